@@ -7,5 +7,7 @@
 
 """
 from . import self_cal
+from . import cal_pool
+from . import pipeline
 
 from ..const_def import *
@@ -0,0 +1,219 @@
+# cal_pool.py
+# a persistent worker pool for calibration with shared-memory data
+#
+#    Copyright (C) 2018 Andrew Chael
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+import os
+import pickle
+import tempfile
+
+from multiprocessing import cpu_count
+from multiprocessing import Pool
+
+try:
+    from multiprocessing import shared_memory
+    from multiprocessing import resource_tracker
+except ImportError:
+    shared_memory = None # fall back to memory-mapped temporary files
+
+# shared arrays attached in this (worker) process, keyed by block name
+_ATTACHED = {}
+# unpickled payloads in this (worker) process, keyed by block name
+_PAYLOADS = {}
+# handle key of the pickled payload block
+_PAYLOAD_KEY = '__payload__'
+
+###################################################################################################################################
+#Calibration Pool
+###################################################################################################################################
+class CalibrationPool(object):
+    """A persistent pool of calibration workers.
+
+       Arrays are placed once in shared memory with share(), together with an optional payload
+       of constant task arguments; tasks then only pass a small handle and a (start, stop) index
+       range, so repeated calibration calls avoid both the pool start-up and the pickling of
+       scans, images and arguments for every task.
+
+       Use as a context manager:
+
+           with CalibrationPool(processes=4) as pool:
+               caltab = network_cal(obs, zbl, pool=pool, caltable=True)
+
+       Attributes:
+           processes (int): the number of worker processes
+    """
+
+    def __init__(self, processes=0):
+        if processes <= 0:
+            processes = int(cpu_count())
+        self.processes = processes
+
+        # start the resource tracker before forking so the workers share it
+        # and do not try to clean up blocks owned by this process when they exit
+        if shared_memory is not None:
+            resource_tracker.ensure_running()
+        self._pool = Pool(processes=processes)
+        self._blocks = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the workers and free all shared arrays.
+        """
+
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
+
+        for name in list(self._blocks.keys()):
+            self._free(name)
+
+    def share(self, payload=(), **arrays):
+        """Copy arrays into shared memory and return a handle that workers can attach to.
+           payload is a tuple of constant arguments passed to every task of the handle;
+           it is pickled once into shared memory and unpickled once per worker.
+        """
+
+        if self._pool is None:
+            raise Exception("CalibrationPool is closed!")
+        if _PAYLOAD_KEY in arrays:
+            raise Exception("%s is a reserved array name!" % _PAYLOAD_KEY)
+
+        if len(payload):
+            blob = pickle.dumps(tuple(payload), protocol=pickle.HIGHEST_PROTOCOL)
+            arrays[_PAYLOAD_KEY] = np.frombuffer(blob, dtype=np.uint8)
+
+        handle = {}
+        for (key, arr) in arrays.items():
+            arr = np.ascontiguousarray(arr)
+            nbytes = max(arr.nbytes, 1)
+            if shared_memory is not None:
+                block = shared_memory.SharedMemory(create=True, size=nbytes)
+                buf = np.ndarray(arr.shape, dtype=arr.dtype, buffer=block.buf)
+                name = block.name
+            else:
+                (fd, name) = tempfile.mkstemp(prefix='ehtim_cal_')
+                os.close(fd)
+                block = None
+                buf = np.memmap(name, dtype=np.uint8, mode='w+', shape=nbytes)
+                buf = buf[:arr.nbytes].view(arr.dtype).reshape(arr.shape)
+            buf[...] = arr
+            handle[key] = (name, arr.shape, arr.dtype)
+            self._blocks[name] = (block, buf)
+
+        return handle
+
+    def arrays(self, handle):
+        """Return the shared arrays of a handle as seen by the main process.
+        """
+
+        return {key: self._blocks[spec[0]][1] for (key, spec) in handle.items() if key != _PAYLOAD_KEY}
+
+    def release(self, handle):
+        """Free the shared arrays of a handle.
+        """
+
+        for spec in handle.values():
+            self._free(spec[0])
+
+    def _free(self, name):
+        (block, buf) = self._blocks.pop(name, (None, None))
+        del buf
+        if block is not None:
+            block.close()
+            block.unlink()
+        elif os.path.exists(name):
+            os.remove(name)
+
+    def map(self, func, handle, ranges, args=()):
+        """Return [func(arrays, start, stop, *(payload + args)) for (start, stop) in ranges], evaluated on the workers,
+           where payload is the tuple given to share(). func must be a module-level function.
+        """
+
+        if self._pool is None:
+            raise Exception("CalibrationPool is closed!")
+
+        tasks = [(func, handle, int(start), int(stop), args) for (start, stop) in ranges]
+        chunksize = max(1, len(tasks) // (4*self.processes))
+        return self._pool.map(_run_task, tasks, chunksize=chunksize)
+
+def attach(handle):
+    """Return the shared arrays of a handle, attaching to them in the current process if needed.
+    """
+
+    # drop attachments to blocks that are no longer in use
+    names = set(spec[0] for spec in handle.values())
+    for name in list(_ATTACHED.keys()):
+        if name not in names:
+            (block, buf) = _ATTACHED.pop(name)
+            del buf
+            if block is not None:
+                block.close()
+            _PAYLOADS.pop(name, None)
+
+    arrays = {}
+    for (key, (name, shape, dtype)) in handle.items():
+        if name not in _ATTACHED:
+            dtype = np.dtype(dtype)
+            nbytes = int(np.prod(shape)) * dtype.itemsize
+            if shared_memory is not None:
+                block = shared_memory.SharedMemory(name=name)
+                buf = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            else:
+                block = None
+                buf = np.memmap(name, dtype=np.uint8, mode='r+', shape=max(nbytes, 1))
+                buf = buf[:nbytes].view(dtype).reshape(shape)
+            _ATTACHED[name] = (block, buf)
+        arrays[key] = _ATTACHED[name][1]
+
+    return arrays
+
+def _run_task(task):
+    (func, handle, start, stop, args) = task
+    arrays = attach(handle)
+    payload = ()
+    if _PAYLOAD_KEY in handle:
+        name = handle[_PAYLOAD_KEY][0]
+        if name not in _PAYLOADS:
+            _PAYLOADS[name] = pickle.loads(arrays[_PAYLOAD_KEY].tobytes())
+        payload = _PAYLOADS[name]
+        del arrays[_PAYLOAD_KEY]
+    return func(arrays, start, stop, *(payload + args))
+
+def split_ranges(bounds, nchunk):
+    """Split consecutive ranges with boundaries bounds into at most nchunk contiguous groups of similar total size.
+       Returns a list of (start, stop) index pairs into bounds.
+    """
+
+    bounds = np.asarray(bounds)
+    nchunk = max(1, min(nchunk, len(bounds) - 1))
+    targets = np.linspace(bounds[0], bounds[-1], nchunk + 1)
+    cuts = np.unique(np.searchsorted(bounds, targets))
+    cuts[0] = 0
+    cuts[-1] = len(bounds) - 1
+    cuts = np.unique(cuts)
+
+    return list(zip(cuts[:-1], cuts[1:]))
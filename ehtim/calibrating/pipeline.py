@@ -0,0 +1,284 @@
+# pipeline.py
+# an incremental multi-round calibration pipeline
+#
+#    Copyright (C) 2018 Andrew Chael
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+from builtins import object
+
+import numpy as np
+import sys
+
+import ehtim.obsdata
+import ehtim.caltable
+from ehtim.calibrating.self_cal import network_cal_scan, network_cal_range, make_cluster_data
+from ehtim.calibrating.self_cal import model_vis, self_cal_gains, ZBLCUTOFF
+from ehtim.calibrating.cal_pool import split_ranges
+
+from ehtim.const_def import *
+
+###################################################################################################################################
+#Calibration Pipeline
+###################################################################################################################################
+class CalibrationPipeline(object):
+    """Repeated calibration of one observation without rebuilding Obsdata objects between rounds.
+
+       The data are partitioned into scans once. Every call to network_cal or self_cal solves for
+       the gains of one round, applies them to the in-memory visibilities and returns the round's
+       Caltable; the cluster data and model visibilities are cached across rounds.
+
+           pipeline = CalibrationPipeline(obs)
+           for i in range(3):
+               caltab = pipeline.network_cal(zbl, sites=sites, method='amp')
+           obs_cal = pipeline.obsdata()
+
+       Attributes:
+           obs (Obsdata): the uncalibrated observation
+           data (numpy.recarray): the time-sorted data table (type DTPOL) with all gains so far applied
+           scan_bounds (numpy.ndarray): the data rows scan_bounds[i]:scan_bounds[i+1] belong to scan i
+           scan_times (numpy.ndarray): the time of each scan in hours
+           scan_idx (numpy.ndarray): the scan index of every data point
+           i1 (numpy.ndarray): the tarr index of the first station of every data point
+           i2 (numpy.ndarray): the tarr index of the second station of every data point
+           bl_idx (numpy.ndarray): the baseline index of every data point
+           gains (numpy.ndarray): the accumulated (nscan, nsite+1) inverse gains applied to the data
+    """
+
+    def __init__(self, obs, pool=None):
+        """Partition an observation for repeated calibration.
+
+           Args:
+               obs (Obsdata): the observation to calibrate
+               pool (CalibrationPool): an optional pool of workers for network_cal
+
+           Returns:
+               (CalibrationPipeline): a CalibrationPipeline object
+        """
+
+        self.obs = obs
+        self.pool = pool
+
+        # time-sort the data so that every scan is a contiguous block of rows
+        self._order = np.argsort(obs.data['time'], kind='mergesort')
+        self.data = obs.data[self._order]
+        (self.scan_times, self.scan_idx) = np.unique(self.data['time'], return_inverse=True)
+        self.scan_bounds = np.searchsorted(self.scan_idx, np.arange(len(self.scan_times) + 1))
+
+        # station and baseline indices of every data point
+        nsite = len(obs.tarr)
+        (names, site_idx) = np.unique(np.hstack((self.data['t1'], self.data['t2'])), return_inverse=True)
+        site_idx = np.array([obs.tkey[name] for name in names], dtype=int)[site_idx]
+        self.i1 = site_idx[:len(self.data)]
+        self.i2 = site_idx[len(self.data):]
+        self.bl_idx = np.unique(self.i1*nsite + self.i2, return_inverse=True)[1]
+
+        # which sites have data in which scans
+        self.has_data = np.zeros((len(self.scan_times), nsite), dtype=bool)
+        self.has_data[self.scan_idx, self.i1] = True
+        self.has_data[self.scan_idx, self.i2] = True
+
+        self.gains = np.ones((len(self.scan_times), nsite + 1), dtype=np.complex128)
+
+        self._cluster_data = {}
+        self._model_vis = {}
+
+    def cluster_data(self, zbl_uvdist_max=ZBLCUTOFF):
+        """Return the (cached) colocated site clusters of the array.
+        """
+
+        if zbl_uvdist_max not in self._cluster_data:
+            self._cluster_data[zbl_uvdist_max] = make_cluster_data(self.obs, zbl_uvdist_max)
+
+        return self._cluster_data[zbl_uvdist_max]
+
+    def model_vis(self, im, ttype='direct', fft_pad_factor=2):
+        """Return the (cached) model visibilities of an image at the uv points of the data.
+        """
+
+        key = (id(im), ttype, fft_pad_factor)
+        cached = self._model_vis.get(key)
+        if cached is None or cached[0] is not im or not np.array_equal(cached[1], im.imvec):
+            V = model_vis(self.obs, im, ttype=ttype, fft_pad_factor=fft_pad_factor)[self._order]
+            cached = (im, im.imvec.copy(), V)
+            self._model_vis[key] = cached
+
+        return cached[2]
+
+    def scans_with_sites(self, sites):
+        """Return the indices of the scans in which all of the given sites have data.
+        """
+
+        keys = [self.obs.tkey[site] for site in sites]
+        return np.nonzero(np.all(self.has_data[:, keys], axis=1))[0]
+
+    def network_cal(self, zbl, sites=[], scans=None, zbl_uvdist_max=ZBLCUTOFF, method="both",
+                    show_solution=False, pad_amp=0., gain_tol=.2):
+        """Network-calibrate the current data with zbl constraints and apply the solution.
+
+           Args:
+               zbl (float): the zero baseline flux
+               sites (list): the sites to calibrate
+               scans (list): the indices of the scans to solve; other scans take the nearest solution in time
+               zbl_uvdist_max (float): the maximum distance of colocated sites in wavelengths
+               method (str): 'amp', 'phase' or 'both'
+               show_solution (bool): print the solution of every scan
+               pad_amp (float): fractional amplitude error added to the sigmas
+               gain_tol (float): the expected fractional gain error
+
+           Returns:
+               (Caltable): the calibration table of this round
+        """
+
+        if len(sites) < 2:
+            print("less than 2 stations specified in network cal: defaulting to calibrating all stations!")
+            sites = self.obs.tarr['site']
+        sites = list(sites)
+
+        if scans is None:
+            scans = np.arange(len(self.scan_times))
+        ranges = [(self.scan_bounds[i], self.scan_bounds[i+1]) for i in scans]
+
+        cluster_data = self.cluster_data(zbl_uvdist_max)
+        if self.pool is not None:
+            # share the data and the constant arguments once; each task solves a contiguous group of scans
+            sizes = np.append(0, np.cumsum([stop - start for (start, stop) in ranges]))
+            handle = self.pool.share(payload=(zbl, sites, cluster_data, method, pad_amp, gain_tol, True, show_solution),
+                                     data=self.data, scan_bounds=np.array(ranges, dtype=int).reshape(-1, 2))
+            rows = self.pool.map(network_cal_range, handle, split_ranges(sizes, self.pool.processes))
+            rows = [row for group in rows for row in group]
+            self.pool.release(handle)
+        else:
+            rows = []
+            for (i, (start, stop)) in enumerate(ranges):
+                sys.stdout.write('\rCalibrating Scan %i/%i...' % (i,len(ranges)))
+                sys.stdout.flush()
+                rows.append(network_cal_scan(self.data[start:stop], zbl, sites, cluster_data, method=method,
+                                             show_solution=show_solution, caltable=True,
+                                             pad_amp=pad_amp, gain_tol=gain_tol))
+        print('DONE')
+
+        # inverse gains of every solved site and scan
+        gains = np.ones(self.gains.shape, dtype=np.complex128)
+        solved = np.zeros(self.has_data.shape, dtype=bool)
+        for (scan, row) in zip(scans, rows):
+            for (site, dat) in row.items():
+                gains[scan, self.obs.tkey[site]] = dat['rscale']
+                solved[scan, self.obs.tkey[site]] = True
+
+        return self.apply_gains(fill_nearest(gains, solved, self.scan_times))
+
+    def self_cal(self, im, sites=[], method="both", show_solution=False, pad_amp=0., ttype='direct',
+                 fft_pad_factor=2, gain_tol=.2):
+        """Self-calibrate the current data to a fixed image and apply the solution.
+           The model visibilities are only computed the first time an image is used.
+
+           Returns:
+               (Caltable): the calibration table of this round
+        """
+
+        if len(sites) < 2:
+            print("less than 2 stations specified in self cal: defaulting to calibrating all stations!")
+            sites = self.obs.tarr['site']
+        site_keys = np.array([self.obs.tkey[site] for site in sites], dtype=int)
+
+        V = self.model_vis(im, ttype=ttype, fft_pad_factor=fft_pad_factor)
+
+        # position of every tarr site in sites, or -1 if it is not calibrated
+        key = -np.ones(len(self.obs.tarr) + 1, dtype=int)
+        key[site_keys] = np.arange(len(site_keys))
+
+        print("Calibrating %i scans..." % len(self.scan_times))
+        sigma_inv = 1.0/(self.data['sigma'] + pad_amp*np.abs(self.data['vis']))
+        g_fit = self_cal_gains(self.scan_idx, key[self.i1], key[self.i2], self.data['vis'], V, sigma_inv,
+                               len(site_keys), method=method, gain_tol=gain_tol)
+        print("Done!")
+
+        if show_solution == True:
+            print(np.abs(g_fit[:,:-1]))
+
+        gains = np.ones(self.gains.shape, dtype=np.complex128)
+        gains[:, site_keys] = g_fit[:, :-1]**-1
+
+        return self.apply_gains(gains)
+
+    def apply_gains(self, gains):
+        """Apply a (nscan, nsite+1) array of inverse gains to the in-memory data.
+
+           Returns:
+               (Caltable): the calibration table of the applied gains
+        """
+
+        g1 = gains[self.scan_idx, self.i1]
+        g2 = gains[self.scan_idx, self.i2]
+        ehtim.caltable.apply_scales(self.data, g1, g1, g2, g2)
+        self.gains *= gains
+
+        return self.make_caltable(gains)
+
+    def make_caltable(self, gains):
+        """Make a Caltable with an entry for every site at every scan where it has data.
+        """
+
+        caldict = {}
+        for (s, site) in enumerate(self.obs.tarr['site']):
+            scans = np.nonzero(self.has_data[:, s])[0]
+            if len(scans) == 0:
+                continue
+            caldict[site] = np.empty(len(scans), dtype=DTCAL)
+            caldict[site]['time'] = self.scan_times[scans]
+            caldict[site]['rscale'] = gains[scans, s]
+            caldict[site]['lscale'] = gains[scans, s]
+
+        obs = self.obs
+        return ehtim.caltable.Caltable(obs.ra, obs.dec, obs.rf, obs.bw, caldict, obs.tarr,
+                                       source=obs.source, mjd=obs.mjd, timetype=obs.timetype)
+
+    def caltable(self):
+        """Return the Caltable of all gains applied so far.
+        """
+
+        return self.make_caltable(self.gains)
+
+    def obsdata(self):
+        """Return the calibrated data as an Obsdata object.
+        """
+
+        obs = self.obs
+        return ehtim.obsdata.Obsdata(obs.ra, obs.dec, obs.rf, obs.bw, self.data.copy(), obs.tarr,
+                                     source=obs.source, mjd=obs.mjd,
+                                     ampcal=obs.ampcal, phasecal=obs.phasecal, dcal=obs.dcal, frcal=obs.frcal,
+                                     timetype=obs.timetype)
+
+def fill_nearest(gains, solved, times):
+    """Fill the unsolved (scan, site) entries of a gain array with the nearest solution in time of the same site.
+       Sites with no solution at all keep their unit gains.
+    """
+
+    gains = gains.copy()
+    for s in range(solved.shape[1]):
+        idx = np.nonzero(solved[:, s])[0]
+        if len(idx) == 0 or len(idx) == len(times):
+            continue
+
+        # nearest solved scan, taking the earlier one at the midpoints
+        mid = 0.5*(times[idx[1:]] + times[idx[:-1]])
+        nearest = idx[np.searchsorted(mid, times, side='left')]
+        gains[:, s] = gains[nearest, s]
+
+    return gains
@@ -29,53 +29,59 @@ import itertools as it
 import ehtim.obsdata
 from ehtim.observing.obs_helpers import *
 import ehtim.imaging.imager_utils as iu
-
-from multiprocessing import cpu_count
-from multiprocessing import Pool
+from ehtim.calibrating.cal_pool import CalibrationPool, split_ranges
 
 import itertools
 
 ZBLCUTOFF = 1.e7;
+SELFCAL_MAXITER = 200 # maximum number of batched Levenberg-Marquardt iterations
+SELFCAL_TOL = 1.e-10 # relative chi^2 decrease at which the batched solver stops
+SELFCAL_GAIN_BOUND = 10. # largest |log gain amplitude|, in units of gain_tol, before a scan is re-solved with self_cal_scan's minimizer
 
 ###################################################################################################################################
 #Network-Calibration
 ###################################################################################################################################
-def network_cal(obs, zbl, sites=[], zbl_uvdist_max=ZBLCUTOFF, method="both", show_solution=False, pad_amp=0.,gain_tol=.2, processes=-1, caltable=False):
-    """Network-calibrate a dataset with zbl constraints
+def network_cal(obs, zbl, sites=[], zbl_uvdist_max=ZBLCUTOFF, method="both", show_solution=False, pad_amp=0.,gain_tol=.2, processes=-1, caltable=False, pool=None):
+    """Network-calibrate a dataset with zbl constraints.
+       Scans are solved in parallel on pool, a CalibrationPool, if given;
+       otherwise a temporary pool with the given number of processes is used (0 = all cpus, -1 = no multiprocessing).
     """
     # V = model visibility, V' = measured visibility, G_i = site gain
     # G_i * conj(G_j) * V_ij = V'_ij
+    if pool is None and processes != -1:
+        with CalibrationPool(processes=processes) as pool:
+            return network_cal(obs, zbl, sites=sites, zbl_uvdist_max=zbl_uvdist_max, method=method,
+                               show_solution=show_solution, pad_amp=pad_amp, gain_tol=gain_tol,
+                               caltable=caltable, pool=pool)
+
     if len(sites) < 2:
         print("less than 2 stations specified in network cal: defaulting to calibrating all stations!")
         sites = obs.tarr['site']
 
-    # Make the pool for parallel processing
-    if processes > 0:
-        print("Using Multiprocessing")
-        pool = Pool(processes=processes)
-    elif processes == 0:
-        processes = int(cpu_count())
-        print("Using Multiprocessing with %d Processes" % processes)
-        pool = Pool(processes=processes)
-    else:
-        print("Not Using Multiprocessing")
-
     # find colocated sites and put into list allclusters
     cluster_data = make_cluster_data(obs, zbl_uvdist_max)
 
     # loop over scans and calibrate
-    scans     = obs.tlist()
-    scans_cal = scans.copy()
-
-    if processes > 0:
-        scans_cal = np.array(filter(lambda x: x,
-                                    pool.map(get_network_scan_cal,
-                                             [[i, len(scans), scans[i],
-                                               zbl, sites, cluster_data, method, pad_amp, gain_tol, caltable, show_solution]
-                                              for i in range(len(scans))
-                                             ])))
+    if pool is not None:
+        # share the scan-ordered data and the constant arguments once; each task calibrates
+        # a contiguous group of scans in place in shared memory
+        print("Using Multiprocessing with %d Processes" % pool.processes)
+        rows = np.arange(len(obs.data))
+        scan_rows = [rows[idx] for idx in obs.tlist_idx()]
+        bounds = np.append(0, np.cumsum([len(idx) for idx in scan_rows]))
+        handle = pool.share(payload=(zbl, sites, cluster_data, method, pad_amp, gain_tol, caltable, show_solution),
+                            data=obs.data[np.concatenate(scan_rows)],
+                            scan_bounds=np.column_stack((bounds[:-1], bounds[1:])))
+        scans_cal = pool.map(network_cal_range, handle, split_ranges(bounds, pool.processes))
+        scans_cal = [row for group in scans_cal for row in group]
+        if not caltable:
+            scans_cal = [pool.arrays(handle)['data'].copy()]
+        pool.release(handle)
         print('DONE')
     else:
+        print("Not Using Multiprocessing")
+        scans     = obs.tlist()
+        scans_cal = scans.copy()
         for i in range(len(scans)):
             sys.stdout.write('\rCalibrating Scan %i/%i...' % (i,len(scans)))
             sys.stdout.flush()
@@ -108,9 +114,6 @@ def network_cal(obs, zbl, sites=[], zbl_uvdist_max=ZBLCUTOFF, method="both", sho
                                         timetype=obs.timetype)
         out = obs_cal
 
-    if processes != -1:
-        pool.close()
-
     return out
 
 def network_cal_scan(scan, zbl, sites, clustered_sites, zbl_uvidst_max=ZBLCUTOFF, method="both", show_solution=False, pad_amp=0., gain_tol=.2, caltable=False):
@@ -275,47 +278,83 @@ def network_cal_scan(scan, zbl, sites, clustered_sites, zbl_uvidst_max=ZBLCUTOFF
     return out
 
 
-def get_network_scan_cal(args):
-    return get_network_scan_cal2(*args)
+def network_cal_range(arrays, start, stop, zbl, sites, cluster_data, method, pad_amp, gain_tol, caltable, show_solution):
+    """Network-calibrate scans [start, stop) of the shared data of a CalibrationPool,
+       where the rows of each scan are given by the shared (nscan, 2) array scan_bounds.
+       The calibrated scans are written back to shared memory; only a list of caltable rows is returned.
+    """
 
-def get_network_scan_cal2(i, n, scan, zbl, sites, cluster_data, method, pad_amp,gain_tol,caltable, show_solution):
-    if n > 1:
-        sys.stdout.write('.')
-        sys.stdout.flush()
+    rows = []
+    for (lo, hi) in arrays['scan_bounds'][start:stop]:
+        out = network_cal_scan(arrays['data'][lo:hi], zbl, sites, cluster_data, zbl_uvidst_max=ZBLCUTOFF,
+                               method=method, caltable=caltable, show_solution=show_solution,
+                               pad_amp=pad_amp, gain_tol=gain_tol)
+        if caltable:
+            rows.append(out)
 
-    return network_cal_scan(scan, zbl, sites, cluster_data, zbl_uvidst_max=ZBLCUTOFF, method=method,caltable=caltable, show_solution=show_solution, pad_amp=pad_amp, gain_tol=gain_tol)
+    return rows
 
 
 ###################################################################################################################################
 #Self-Calibration
 ###################################################################################################################################
-def self_cal(obs, im, sites=[], method="both", show_solution=False, pad_amp=0., ttype='direct', fft_pad_factor=2, gain_tol=.2, caltable=False, processes=-1):
+def self_cal(obs, im, sites=[], method="both", show_solution=False, pad_amp=0., ttype='direct', fft_pad_factor=2, gain_tol=.2, caltable=False, processes=-1, pool=None):
     """Self-calibrate a dataset to a fixed image.
+       Groups of scans are solved in parallel on pool, a CalibrationPool, if given;
+       otherwise a temporary pool with the given number of processes is used (0 = all cpus, -1 = no multiprocessing).
     """
     # V = model visibility, V' = measured visibility, G_i = site gain
     # G_i * conj(G_j) * V_ij = V'_ij
+    if pool is None and processes != -1:
+        with CalibrationPool(processes=processes) as pool:
+            return self_cal(obs, im, sites=sites, method=method, show_solution=show_solution, pad_amp=pad_amp,
+                            ttype=ttype, fft_pad_factor=fft_pad_factor, gain_tol=gain_tol, caltable=caltable, pool=pool)
+
     if len(sites) < 2:
         print("less than 2 stations specified in self cal: defaulting to calibrating all stations!")
         sites = obs.tarr['site']
 
-    # Make the pool for parallel processing
-    if processes > 0:
-        print("Using Multiprocessing")
-        pool = Pool(processes=processes)
-    elif processes == 0:
-        processes = int(cpu_count())
-        print("Using Multiprocessing with %d Processes" % processes)
-        pool = Pool(processes=processes)
+    # First, sample the model visibilities
+    V = model_vis(obs, im, ttype=ttype, fft_pad_factor=fft_pad_factor)
+
+    # Solve for the gains in all scans at once
+    nscan = len(obs.tlist_idx())
+    print("Calibrating %i scans..." % nscan)
+    data = obs.data
+    (scan_idx, g1_keys, g2_keys) = selfcal_keys(obs, sites)
+    sigma_inv = 1.0/(data['sigma'] + pad_amp*np.abs(data['vis']))
+    if pool is None:
+        g_fit = self_cal_gains(scan_idx, g1_keys, g2_keys, data['vis'], V, sigma_inv,
+                               len(sites), method=method, gain_tol=gain_tol)
     else:
-        print("Not Using Multiprocessing")
+        # share the scan-ordered columns once; each worker solves a contiguous group of scans
+        order = np.argsort(scan_idx, kind='mergesort')
+        handle = pool.share(scan_idx=scan_idx[order], g1_keys=g1_keys[order], g2_keys=g2_keys[order],
+                            vis=data['vis'][order], V=V[order], sigma_inv=sigma_inv[order])
+        bounds = np.searchsorted(scan_idx[order], np.arange(nscan + 1))
+        ranges = [(bounds[i], bounds[j]) for (i, j) in split_ranges(bounds, pool.processes)]
+        g_fit = np.vstack(pool.map(self_cal_range, handle, ranges,
+                                   args=(len(sites), method, gain_tol)))
+        pool.release(handle)
+    print("Done!")
+
+    if show_solution == True:
+        print(np.abs(g_fit[:,:-1]))
+
+    out = selfcal_output(obs, sites, g_fit, scan_idx, g1_keys, g2_keys, caltable=caltable)
+
+    return out
+
+def model_vis(obs, im, ttype='direct', fft_pad_factor=2):
+    """Sample the model visibilities of an image at the uv points of obs.data
+    """
 
-    # First, sample the model visibilities
     print("Computing the Model Visibilities with " + ttype + " Fourier Transform...")
     if ttype == 'direct':
         data_arr = obs.unpack(['u','v','vis','sigma'])
         uv = np.hstack((data_arr['u'].reshape(-1,1), data_arr['v'].reshape(-1,1)))
-        A = ftmatrix(im.psize, im.xdim, im.ydim, uv, pulse=im.pulse)
-        V = np.dot(A, im.imvec)
+        A = ftoperator(im.psize, im.xdim, im.ydim, uv, pulse=im.pulse)
+        V = A.dot(im.imvec)
     else:
         (data, sigma, fft_A) = iu.chisqdata_vis_fft(obs, im, fft_pad_factor=fft_pad_factor)
         im_info, sampler_info_list, gridder_info_list = fft_A
@@ -323,52 +362,209 @@ def self_cal(obs, im, sites=[], method="both", show_solution=False, pad_amp=0.,
         V = iu.sampler(vis_arr, sampler_info_list, sample_type='vis')
     print("Done!")
 
-    # Partition the list of model visibilities into scans
-    from itertools import islice
-    it = iter(V)
-    scan_lengths = [len(o) for o in obs.tlist()]
-    V_scans      = [list(islice(it, 0, i)) for i in scan_lengths]
+    return V
 
-    # loop over scans and calibrate
-    scans     = obs.tlist()
-    scans_cal = scans.copy()
+def selfcal_keys(obs, sites):
+    """Return the scan index of every data point and the index of its two sites in sites (-1 if not calibrated)
+    """
 
-    if processes > 0:
-        scans_cal = np.array(pool.map(get_selfcal_scan_cal, [[i, len(scans), scans[i], im, V_scans[i], sites, method, show_solution, pad_amp, gain_tol, caltable] for i in range(len(scans))]))
-        print('DONE')
-    else:
-        for i in range(len(scans)):
-            sys.stdout.write('\rCalibrating Scan %i/%i...' % (i,len(scans)))
-            sys.stdout.flush()
-            scans_cal[i] = self_cal_scan(scans[i], im, V_scan=V_scans[i], sites=sites,
-                                 method=method, show_solution=show_solution,
-                                 pad_amp=pad_amp, gain_tol=gain_tol, caltable=caltable)
+    scan_idx = np.empty(len(obs.data), dtype=int)
+    for (i, idx) in enumerate(obs.tlist_idx()):
+        scan_idx[idx] = i
 
-    if caltable:
-        allsites = obs.tarr['site']
-        caldict = scans_cal[0]
-        for i in range(1,len(scans_cal)):
-            row = scans_cal[i]
-            for site in allsites:
-                try: dat = row[site]
-                except KeyError: continue
+    tkey = {b:a for a,b in enumerate(sites)}
+    (names, site_idx) = np.unique(np.hstack((obs.data['t1'], obs.data['t2'])), return_inverse=True)
+    keys = np.array([tkey.get(name, -1) for name in names], dtype=int)[site_idx]
+    g1_keys = keys[:len(obs.data)]
+    g2_keys = keys[len(obs.data):]
+
+    return (scan_idx, g1_keys, g2_keys)
+
+def self_cal_gains(scan_idx, g1_keys, g2_keys, vis, V, sigma_inv, nsites, method="both", gain_tol=.2,
+                   maxiter=SELFCAL_MAXITER, tol=SELFCAL_TOL):
+    """Solve for the site gains of all scans at once with a batched Levenberg-Marquardt iteration.
+       Each scan minimizes the same chi^2 as self_cal_scan, with gains parameterized as exp(log amplitude + i phase).
+       Returns a (nscan, nsites+1) array of complex gains, with a final column of ones for uncalibrated sites.
+    """
 
-                try: caldict[site] = np.append(caldict[site], row[site])
-                except KeyError: caldict[site] = dat
+    nscan = np.max(scan_idx) + 1
+    solve_amp = method in ("both", "amp")
+    solve_phase = method in ("both", "phase")
+    nblock = int(solve_amp) + int(solve_phase)
+    npar = nblock*nsites
+
+    if method == "amp":
+        vis = np.abs(vis)
+        V = np.abs(V)
+
+    # parameter columns of the two sites of each data point; uncalibrated sites get zero derivatives
+    solved1 = (g1_keys >= 0)
+    solved2 = (g2_keys >= 0)
+    col1 = np.where(solved1, g1_keys, 0)
+    col2 = np.where(solved2, g2_keys, 0)
+    cols = []
+    for block in range(nblock):
+        cols.extend((col1 + block*nsites, col2 + block*nsites))
+    cols = np.array(cols).T
+
+    def gains(x):
+        logamp = x[:, :nsites] if solve_amp else np.zeros((nscan, nsites))
+        phase = x[:, -nsites:] if solve_phase else np.zeros((nscan, nsites))
+        g = np.exp(logamp + 1j*phase)
+        return np.hstack((g, np.ones((nscan, 1))))
+
+    def residuals(x):
+        g = gains(x)
+        model = g[scan_idx, g1_keys] * g[scan_idx, g2_keys].conj() * V
+        resid = (vis - model) * sigma_inv
+        cost = np.bincount(scan_idx, weights=np.abs(resid)**2, minlength=nscan)
+        if solve_amp:
+            cost += np.sum(x[:, :nsites]**2, axis=1) / gain_tol**2
+        return (model, resid, cost)
+
+    def normal_equations(x, model, resid):
+        # derivatives of the residuals with respect to each local parameter
+        dr = -model * sigma_inv
+        ders = []
+        if solve_amp:
+            ders.extend((dr*solved1, dr*solved2))
+        if solve_phase:
+            ders.extend((1j*dr*solved1, -1j*dr*solved2))
+        ders = np.array(ders).T
+
+        # scatter the per-point contributions into the per-scan normal matrices
+        jtj_idx = (scan_idx[:,None,None]*npar + cols[:,:,None])*npar + cols[:,None,:]
+        jtj_val = np.real(ders.conj()[:,:,None] * ders[:,None,:])
+        jtj = np.bincount(jtj_idx.ravel(), weights=jtj_val.ravel(), minlength=nscan*npar*npar).reshape(nscan, npar, npar)
+        jtr_idx = scan_idx[:,None]*npar + cols
+        jtr_val = np.real(ders.conj() * resid[:,None])
+        jtr = np.bincount(jtr_idx.ravel(), weights=jtr_val.ravel(), minlength=nscan*npar).reshape(nscan, npar)
+
+        # gain amplitude prior
+        if solve_amp:
+            jtj[:, np.arange(nsites), np.arange(nsites)] += 1./gain_tol**2
+            jtr[:, :nsites] += x[:, :nsites]/gain_tol**2
+
+        return (jtj, jtr)
+
+    # start from the phases of a per-scan phase-only estimate rather than from zero,
+    # which can leave the iteration in a degenerate minimum with a collapsed gain
+    x = np.zeros((nscan, npar))
+    if solve_phase:
+        x[:, -nsites:] = selfcal_phase_guess(scan_idx, g1_keys, g2_keys, vis, V, sigma_inv, nsites)
+    lam = np.ones(nscan) * 1.e-3
+    active = np.ones(nscan, dtype=bool)
+    (model, resid, cost) = residuals(x)
+    for i in range(maxiter):
+        (jtj, jtr) = normal_equations(x, model, resid)
+
+        # damp with the diagonal; parameters without data are held fixed by a unit diagonal
+        diag = np.diagonal(jtj, axis1=1, axis2=2).copy()
+        diag[diag == 0] = 1.
+        lhs = jtj + lam[:,None,None] * diag[:,:,None] * np.eye(npar)
+        step = np.linalg.solve(lhs, -jtr[:,:,None])[:,:,0]
+        step[~active] = 0.
+
+        xnew = x + step
+        (model_new, resid_new, cost_new) = residuals(xnew)
+        better = active * (cost_new < cost)
+
+        # stop scans whose chi^2 no longer decreases
+        converged = better * ((cost - cost_new) <= tol*cost)
+        active *= ~converged
+        active *= ~((~better) * (lam > 1.e10))
+
+        x[better] = xnew[better]
+        cost[better] = cost_new[better]
+        model = np.where(better[scan_idx], model_new, model)
+        resid = np.where(better[scan_idx], resid_new, resid)
+        lam = np.where(better, np.maximum(lam/10., 1.e-10), lam*10.)
+
+        if not np.any(active):
+            break
+
+    g_fit = gains(x)
+    if method == "amp":
+        g_fit = np.abs(g_fit)
+
+    # re-solve scans where a gain with data ran away with self_cal_scan's minimizer, keeping the better solution
+    if solve_amp:
+        has_data = np.zeros((nscan, nsites + 1), dtype=bool)
+        has_data[scan_idx, g1_keys] = True
+        has_data[scan_idx, g2_keys] = True
+        logamp = np.abs(np.log(np.abs(g_fit))) * has_data
+        for scan in np.where(np.max(logamp, axis=1) > SELFCAL_GAIN_BOUND*gain_tol)[0]:
+            mask = (scan_idx == scan)
+            g_scan = self_cal_scan_gains(vis[mask], V[mask], sigma_inv[mask], g1_keys[mask], g2_keys[mask],
+                                         nsites, method=method, gain_tol=gain_tol)
+            x_scan = x.copy()
+            x_scan[scan, :nsites] = np.log(np.abs(g_scan[:-1]))
+            if solve_phase:
+                x_scan[scan, -nsites:] = np.angle(g_scan[:-1])
+            if residuals(x_scan)[2][scan] < cost[scan]:
+                g_fit[scan] = g_scan
+
+    return g_fit
+
+def selfcal_phase_guess(scan_idx, g1_keys, g2_keys, vis, V, sigma_inv, nsites):
+    """Estimate the site gain phases of every scan from the leading eigenvector of its weighted
+       matrix of measured times conjugate model visibilities, which is proportional to g g^H for perfect data.
+       Returns a (nscan, nsites) array of phases relative to the uncalibrated sites.
+    """
 
-        caltable = ehtim.caltable.Caltable(obs.ra, obs.dec, obs.rf, obs.bw, caldict, obs.tarr,
-                                           source = obs.source, mjd=obs.mjd, timetype=obs.timetype)
-        out = caltable
-    else:
-        obs_cal = ehtim.obsdata.Obsdata(obs.ra, obs.dec, obs.rf, obs.bw,
-                                        np.concatenate(scans_cal), obs.tarr, source=obs.source, mjd=obs.mjd,
-                                        ampcal=obs.ampcal, phasecal=obs.phasecal, dcal=obs.dcal, frcal=obs.frcal,
-                                        timetype=obs.timetype)
+    nscan = np.max(scan_idx) + 1
+    nkey = nsites + 1
+    i1 = np.where(g1_keys >= 0, g1_keys, nsites)
+    i2 = np.where(g2_keys >= 0, g2_keys, nsites)
+    corr = vis * V.conj() * sigma_inv**2
 
-        out = obs_cal
+    # scatter each data point and its conjugate into the per-scan hermitian matrices
+    idx = np.hstack(((scan_idx*nkey + i1)*nkey + i2, (scan_idx*nkey + i2)*nkey + i1))
+    corr = np.hstack((corr, corr.conj()))
+    size = nscan*nkey*nkey
+    mat = (np.bincount(idx, weights=corr.real, minlength=size) +
+           1j*np.bincount(idx, weights=corr.imag, minlength=size)).reshape(nscan, nkey, nkey)
 
-    if processes != -1:
-        pool.close()
+    evec = np.linalg.eigh(mat)[1][:, :, -1]
+    phase = np.angle(evec) - np.angle(evec[:, -1:])
+
+    return phase[:, :-1]
+
+def selfcal_output(obs, sites, g_fit, scan_idx, g1_keys, g2_keys, caltable=False):
+    """Return a Caltable or a calibrated Obsdata given the batched gain solution
+    """
+
+    data = obs.data
+    if caltable:
+        # a table entry for every site at every scan where it has data
+        times = np.unique(data['time'])
+        allsites = obs.tarr['site']
+        tkey = {b:a for a,b in enumerate(sites)}
+        caldict = {}
+        for site in allsites:
+            scans = np.unique(scan_idx[(data['t1'] == site) + (data['t2'] == site)])
+            if len(scans) == 0:
+                continue
+            ginv = g_fit[scans, tkey.get(site, -1)]**-1
+            caldict[site] = np.empty(len(scans), dtype=DTCAL)
+            caldict[site]['time'] = times[scans]
+            caldict[site]['rscale'] = ginv
+            caldict[site]['lscale'] = ginv
+
+        out = ehtim.caltable.Caltable(obs.ra, obs.dec, obs.rf, obs.bw, caldict, obs.tarr,
+                                      source = obs.source, mjd=obs.mjd, timetype=obs.timetype)
+    else:
+        gij_inv = (g_fit[scan_idx, g1_keys] * g_fit[scan_idx, g2_keys].conj())**(-1)
+        data_cal = data.copy()
+        for field in ('vis', 'qvis', 'uvis', 'vvis'):
+            data_cal[field] = gij_inv * data[field]
+        for field in ('sigma', 'qsigma', 'usigma', 'vsigma'):
+            data_cal[field] = np.abs(gij_inv) * data[field]
+
+        out = ehtim.obsdata.Obsdata(obs.ra, obs.dec, obs.rf, obs.bw,
+                                    data_cal, obs.tarr, source=obs.source, mjd=obs.mjd,
+                                    ampcal=obs.ampcal, phasecal=obs.phasecal, dcal=obs.dcal, frcal=obs.frcal,
+                                    timetype=obs.timetype)
 
     return out
 
@@ -383,8 +579,8 @@ def self_cal_scan(scan, im, V_scan=[], sites=[], method="both", show_solution=Fa
 
     if len(V_scan) < 1:
         uv = np.hstack((scan['u'].reshape(-1,1), scan['v'].reshape(-1,1)))
-        A = ftmatrix(im.psize, im.xdim, im.ydim, uv, pulse=im.pulse)
-        V_scan = np.dot(A, im.imvec)
+        A = ftoperator(im.psize, im.xdim, im.ydim, uv, pulse=im.pulse)
+        V_scan = A.dot(im.imvec)
 
     # create a dictionary to keep track of gains
     tkey = {b:a for a,b in enumerate(sites)}
@@ -406,7 +602,47 @@ def self_cal_scan(scan, im, V_scan=[], sites=[], method="both", show_solution=Fa
 
     sigma_inv = 1.0/(scan['sigma'] + pad_amp*np.abs(scan['vis']))
 
-    gpar_guess = np.ones(len(sites), dtype=np.complex128).view(dtype=np.float64)
+    g_fit = self_cal_scan_gains(scan['vis'], V_scan, sigma_inv, g1_keys, g2_keys, len(sites),
+                                method=method, gain_tol=gain_tol)
+
+    if show_solution == True:
+        print (np.abs(g_fit[:-1]))
+
+    if caltable:
+        allsites = list(set(scan['t1']).union(set(scan['t2'])))
+
+        caldict = {}
+        for site in allsites:
+            if site in sites:
+                site_key = tkey[site]
+            else:
+                site_key = -1
+            caldict[site] = np.array((scan['time'][0], g_fit[site_key]**-1, g_fit[site_key]**-1), dtype=DTCAL)
+
+        out = caldict
+
+    else:
+        g1_fit = g_fit[g1_keys]
+        g2_fit = g_fit[g2_keys]
+        gij_inv = (g1_fit * g2_fit.conj())**(-1)
+        scan['vis']  = gij_inv * scan['vis']
+        scan['qvis'] = gij_inv * scan['qvis']
+        scan['uvis'] = gij_inv * scan['uvis']
+        scan['vvis'] = gij_inv * scan['vvis']
+        scan['sigma']  = np.abs(gij_inv) * scan['sigma']
+        scan['qsigma'] = np.abs(gij_inv) * scan['qsigma']
+        scan['usigma'] = np.abs(gij_inv) * scan['usigma']
+        scan['vsigma'] = np.abs(gij_inv) * scan['vsigma']
+        out = scan
+
+    return out
+
+def self_cal_scan_gains(vis, V_scan, sigma_inv, g1_keys, g2_keys, nsites, method="both", gain_tol=.2):
+    """Solve for the site gains of a single scan by direct minimization of the self-calibration chi^2.
+       Returns the nsites complex gains followed by a one for uncalibrated sites.
+    """
+
+    gpar_guess = np.ones(nsites, dtype=np.complex128).view(dtype=np.float64)
 
     def errfunc(gpar):
         g = gpar.astype(np.float64).view(dtype=np.complex128) # all the forward site gains (complex)
@@ -424,9 +660,9 @@ def self_cal_scan(scan, im, V_scan=[], sites=[], method="both", show_solution=Fa
 
         #TODO debias!
         if method=='amp':
-            verr = np.abs(scan['vis']) - g1*g2.conj() * np.abs(V_scan)
+            verr = np.abs(vis) - g1*g2.conj() * np.abs(V_scan)
         else:
-            verr = scan['vis'] - g1*g2.conj() * V_scan
+            verr = vis - g1*g2.conj() * V_scan
 
         chisq = np.sum((verr.real * sigma_inv)**2) + np.sum((verr.imag * sigma_inv)**2)
         chisq_g = np.sum((np.log(np.abs(g))**2 / gain_tol**2))
@@ -437,9 +673,6 @@ def self_cal_scan(scan, im, V_scan=[], sites=[], method="both", show_solution=Fa
     res = opt.minimize(errfunc, gpar_guess, method='Powell', options=optdict)
     g_fit = res.x.view(np.complex128)
 
-    if show_solution == True:
-        print (np.abs(g_fit))
-
     if method=="phase":
         g_fit = g_fit / np.abs(g_fit)
     if method=="amp":
@@ -447,44 +680,16 @@ def self_cal_scan(scan, im, V_scan=[], sites=[], method="both", show_solution=Fa
 
     g_fit = np.append(g_fit, 1.)
 
-    if caltable:
-        allsites = list(set(scan['t1']).union(set(scan['t2'])))
-
-        caldict = {}
-        for site in allsites:
-            if site in sites:
-                site_key = tkey[site]
-            else:
-                site_key = -1
-            caldict[site] = np.array((scan['time'][0], g_fit[site_key]**-1, g_fit[site_key]**-1), dtype=DTCAL)
-
-        out = caldict
+    return g_fit
 
-    else:
-        g1_fit = g_fit[g1_keys]
-        g2_fit = g_fit[g2_keys]
-        gij_inv = (g1_fit * g2_fit.conj())**(-1)
-        scan['vis']  = gij_inv * scan['vis']
-        scan['qvis'] = gij_inv * scan['qvis']
-        scan['uvis'] = gij_inv * scan['uvis']
-        scan['vvis'] = gij_inv * scan['vvis']
-        scan['sigma']  = np.abs(gij_inv) * scan['sigma']
-        scan['qsigma'] = np.abs(gij_inv) * scan['qsigma']
-        scan['usigma'] = np.abs(gij_inv) * scan['usigma']
-        scan['vsigma'] = np.abs(gij_inv) * scan['vsigma']
-        out = scan
-
-    return out
-
-def get_selfcal_scan_cal(args):
-    return get_selfcal_scan_cal2(*args)
-
-def get_selfcal_scan_cal2(i, n, scan, im, V_scan, sites, method, show_solution, pad_amp, gain_tol, caltable):
-    if n > 1:
-        sys.stdout.write('.')
-        sys.stdout.flush()
+def self_cal_range(arrays, start, stop, nsites, method, gain_tol):
+    """Solve for the gains of the scans in rows [start, stop) of the shared columns of a CalibrationPool.
+    """
 
-    return self_cal_scan(scan, im, V_scan=V_scan, sites=sites, method=method, show_solution=show_solution, pad_amp=pad_amp, gain_tol=gain_tol, caltable=caltable)
+    scan_idx = arrays['scan_idx'][start:stop]
+    return self_cal_gains(scan_idx - scan_idx[0], arrays['g1_keys'][start:stop], arrays['g2_keys'][start:stop],
+                          arrays['vis'][start:stop], arrays['V'][start:stop], arrays['sigma_inv'][start:stop],
+                          nsites, method=method, gain_tol=gain_tol)
 
 
 ###################################################################################################################################
@@ -146,20 +146,15 @@ class Caltable(object):
 
                     times_merge = np.unique(np.hstack((time1,time2)))
 
-                    #print 'site'
-                    #print np.min(time1),np.max(time1)
-                    #print np.min(time2),np.max(time2)
-                    #print np.min(times_merge),np.max(times_merge)
-
                     rscale_merge = rinterp1(times_merge) * rinterp2(times_merge)
                     lscale_merge = linterp1(times_merge) * linterp2(times_merge)
 
                     #put the merged data back in data1
-                    #TODO can we do this faster?
-                    datatable = []
-                    for i in xrange(len(times_merge)):
-                        datatable.append(np.array((times_merge[i], rscale_merge[i], lscale_merge[i]), dtype=DTCAL))
-                    data1[site] = np.array(datatable)
+                    datatable = np.empty(len(times_merge), dtype=DTCAL)
+                    datatable['time'] = times_merge
+                    datatable['rscale'] = rscale_merge
+                    datatable['lscale'] = lscale_merge
+                    data1[site] = datatable
 
                 # sites not in both caltables
                 else:
@@ -187,82 +182,49 @@ class Caltable(object):
         else:
             fill_value = extrapolate
 
-        rinterp = {}
-        linterp = {}
-        skipsites = []
+        # evaluate the gains of every site on the unique observation times at once;
+        # sites without calibration data keep unit gains in the last row
+        (times, time_idx) = np.unique(obs.data['time'], return_inverse=True)
+        time_mjd = times/24.0 + obs.mjd
+        rscale = np.ones((len(self.tarr) + 1, len(times)), dtype=np.complex128)
+        lscale = np.ones((len(self.tarr) + 1, len(times)), dtype=np.complex128)
         for s in range(0, len(self.tarr)):
             site = self.tarr[s]['site']
 
             try:
                 self.data[site]
             except KeyError:
-                skipsites.append(site)
                 print ("No Calibration  Data for %s !" % site)
                 continue
 
-            time_mjd = self.data[site]['time']/24.0 + self.mjd
-            rinterp[site] = relaxed_interp1d(time_mjd, self.data[site]['rscale'],
-                                             kind=interp, fill_value=fill_value,bounds_error=False)
-            linterp[site] = relaxed_interp1d(time_mjd, self.data[site]['lscale'],
-                                             kind=interp, fill_value=fill_value,bounds_error=False)
-
-        bllist = obs.bllist()
-        datatable = []
-        for bl_obs in bllist:
-            t1 = bl_obs['t1'][0]
-            t2 = bl_obs['t2'][0]
-            time_mjd = bl_obs['time']/24.0 + obs.mjd
-
-            if t1 in skipsites:
-                rscale1 = lscale1 = np.array(1.)
-            else:
-                rscale1 = rinterp[t1](time_mjd)
-                lscale1 = linterp[t1](time_mjd)
-            if t2 in skipsites:
-                rscale2 = lscale2 = np.array(1.)
-            else:
-                rscale2 = rinterp[t2](time_mjd)
-                lscale2 = linterp[t2](time_mjd)
-
-            if force_singlepol == 'R':
-                lscale1 = rscale1
-                lscale2 = rscale2
-
-            if force_singlepol == 'L':
-                rscale1 = lscale1
-                rscale2 = lscale2
-
-            rrscale = rscale1 * rscale2.conj()
-            llscale = lscale1 * lscale2.conj()
-            rlscale = rscale1 * lscale2.conj()
-            lrscale = lscale1 * rscale2.conj()
-
-            rrvis = (bl_obs['vis']  +    bl_obs['vvis']) * rrscale
-            llvis = (bl_obs['vis']  -    bl_obs['vvis']) * llscale
-            rlvis = (bl_obs['qvis'] + 1j*bl_obs['uvis']) * rlscale
-            lrvis = (bl_obs['qvis'] - 1j*bl_obs['uvis']) * lrscale
-
-            bl_obs['vis']  = 0.5  * (rrvis + llvis)
-            bl_obs['qvis'] = 0.5  * (rlvis + lrvis)
-            bl_obs['uvis'] = 0.5j * (lrvis - rlvis)
-            bl_obs['vvis'] = 0.5  * (rrvis - llvis)
-
-            rrsigma = np.sqrt(bl_obs['sigma']**2 + bl_obs['vsigma']**2) * np.abs(rrscale)
-            llsigma = np.sqrt(bl_obs['sigma']**2 + bl_obs['vsigma']**2) * np.abs(llscale)
-            rlsigma = np.sqrt(bl_obs['qsigma']**2 + bl_obs['usigma']**2) * np.abs(rlscale)
-            lrsigma = np.sqrt(bl_obs['qsigma']**2 + bl_obs['usigma']**2) * np.abs(lrscale)
-
-            bl_obs['sigma']  = 0.5 * np.sqrt( rrsigma**2 + llsigma**2 )
-            bl_obs['qsigma'] = 0.5 * np.sqrt( rlsigma**2 + lrsigma**2 )
-            bl_obs['usigma'] = 0.5 * np.sqrt( lrsigma**2 + rlsigma**2 )
-            bl_obs['vsigma'] = 0.5 * np.sqrt( rrsigma**2 + llsigma**2 )
-
-            if len(datatable):
-                datatable = np.hstack((datatable,bl_obs))
-            else:
-                datatable = bl_obs
+            cal_mjd = self.data[site]['time']/24.0 + self.mjd
+            rscale[s] = relaxed_interp1d(cal_mjd, self.data[site]['rscale'],
+                                         kind=interp, fill_value=fill_value,bounds_error=False)(time_mjd)
+            lscale[s] = relaxed_interp1d(cal_mjd, self.data[site]['lscale'],
+                                         kind=interp, fill_value=fill_value,bounds_error=False)(time_mjd)
+
+        if force_singlepol == 'R':
+            lscale = rscale
+        if force_singlepol == 'L':
+            rscale = lscale
 
-        calobs = ehtim.obsdata.Obsdata(obs.ra, obs.dec, obs.rf, obs.bw, np.array(datatable), obs.tarr, source=obs.source, mjd=obs.mjd)
+        # gather the gains of both stations on every data point
+        tkey = {site: i for (i, site) in enumerate(self.tarr['site'])}
+        (names, site_idx) = np.unique(np.hstack((obs.data['t1'], obs.data['t2'])), return_inverse=True)
+        site_idx = np.array([tkey.get(name, -1) for name in names], dtype=int)[site_idx]
+        i1 = site_idx[:len(obs.data)]
+        i2 = site_idx[len(obs.data):]
+
+        rscale1 = rscale[i1, time_idx]
+        lscale1 = lscale[i1, time_idx]
+        rscale2 = rscale[i2, time_idx]
+        lscale2 = lscale[i2, time_idx]
+
+        # write the calibrated data into one output table
+        datatable = obs.data.copy()
+        apply_scales(datatable, rscale1, lscale1, rscale2, lscale2)
+
+        calobs = ehtim.obsdata.Obsdata(obs.ra, obs.dec, obs.rf, obs.bw, datatable, obs.tarr, source=obs.source, mjd=obs.mjd)
 
         return calobs
 
@@ -272,6 +234,44 @@ class Caltable(object):
 
         save_caltable(self, obs, datadir=datadir, sqrt_gains=sqrt_gains)
 
+    def save_npz(self, fname):
+        """Saves a Caltable object to a binary npz file that can be reloaded with load_caltable_npz
+        """
+
+        save_caltable_npz(self, fname)
+
+def apply_scales(datatable, rscale1, lscale1, rscale2, lscale2):
+    """Scale the visibilities and sigmas of a DTPOL datatable in place
+       by the R and L gains of the first and second station of each data point
+    """
+
+    rrscale = rscale1 * rscale2.conj()
+    llscale = lscale1 * lscale2.conj()
+    rlscale = rscale1 * lscale2.conj()
+    lrscale = lscale1 * rscale2.conj()
+
+    rrvis = (datatable['vis']  +    datatable['vvis']) * rrscale
+    llvis = (datatable['vis']  -    datatable['vvis']) * llscale
+    rlvis = (datatable['qvis'] + 1j*datatable['uvis']) * rlscale
+    lrvis = (datatable['qvis'] - 1j*datatable['uvis']) * lrscale
+
+    datatable['vis']  = 0.5  * (rrvis + llvis)
+    datatable['qvis'] = 0.5  * (rlvis + lrvis)
+    datatable['uvis'] = 0.5j * (lrvis - rlvis)
+    datatable['vvis'] = 0.5  * (rrvis - llvis)
+
+    rrsigma = np.sqrt(datatable['sigma']**2 + datatable['vsigma']**2) * np.abs(rrscale)
+    llsigma = np.sqrt(datatable['sigma']**2 + datatable['vsigma']**2) * np.abs(llscale)
+    rlsigma = np.sqrt(datatable['qsigma']**2 + datatable['usigma']**2) * np.abs(rlscale)
+    lrsigma = np.sqrt(datatable['qsigma']**2 + datatable['usigma']**2) * np.abs(lrscale)
+
+    datatable['sigma']  = 0.5 * np.sqrt( rrsigma**2 + llsigma**2 )
+    datatable['qsigma'] = 0.5 * np.sqrt( rlsigma**2 + lrsigma**2 )
+    datatable['usigma'] = 0.5 * np.sqrt( lrsigma**2 + rlsigma**2 )
+    datatable['vsigma'] = 0.5 * np.sqrt( rrsigma**2 + llsigma**2 )
+
+    return datatable
+
 def load_caltable(obs, datadir, sqrt_gains=False ):
     """Load apriori cal tables
     """
@@ -282,43 +282,25 @@ def load_caltable(obs, datadir, sqrt_gains=False ):
         site = obs.tarr[s]['site']
         filename = datadir + obs.source + '_' + site + '.txt'
         try:
-            data = np.loadtxt(filename, dtype=bytes).astype(str)
+            data = np.loadtxt(filename, ndmin=2)
         except IOError:
             continue
 
-        #print ("filename)
-        datatable = []
-
-        # TODO hacky way to make it work with only one entry
-#        onerowonly=False
-#        try: data.shape[1]
-#        except IndexError:
-#            data = data.reshape(1,len(data))
-#            onerowonly = True
-        for row in data:
-
-            time = (float(row[0]) - obs.mjd) * 24.0 # time is given in mjd
-
-            # Maciek's old convention had a square root
-            #rscale = np.sqrt(float(row[1])) # r
-            #lscale = np.sqrt(float(row[2])) # l
-
-            if len(row) == 3:
-                rscale = float(row[1])
-                lscale = float(row[2])
-            elif len(row) == 5:
-                rscale = float(row[1]) + 1j*float(row[2])
-                lscale = float(row[3]) + 1j*float(row[4])
-            else:
-                raise Exception("cannot load caltable -- format unknown!")
-            if sqrt_gains:
-                rscale = rscale**.5
-                lscale = lscale**.5
-            datatable.append(np.array((time, rscale, lscale), dtype=DTCAL))
-            #if onerowonly:
-            #    datatable.append(np.array((1.1*time, rscale, lscale), dtype=DTCAL))
+        datatable = np.empty(len(data), dtype=DTCAL)
+        datatable['time'] = (data[:,0] - obs.mjd) * 24.0 # time is given in mjd
+        if data.shape[1] == 3:
+            datatable['rscale'] = data[:,1]
+            datatable['lscale'] = data[:,2]
+        elif data.shape[1] == 5:
+            datatable['rscale'] = data[:,1] + 1j*data[:,2]
+            datatable['lscale'] = data[:,3] + 1j*data[:,4]
+        else:
+            raise Exception("cannot load caltable -- format unknown!")
+        if sqrt_gains:
+            datatable['rscale'] = datatable['rscale']**.5
+            datatable['lscale'] = datatable['lscale']**.5
 
-        datatables[site] = np.array(datatable)
+        datatables[site] = datatable
     if len(datatables)>0:
         caltable = Caltable(obs.ra, obs.dec, obs.rf, obs.bw, datatables, obs.tarr, source=obs.source, mjd=obs.mjd, timetype=obs.timetype)
     else:
@@ -359,3 +341,36 @@ def save_caltable(caltable, obs, datadir='.', sqrt_gains=False):
             outline = str(float(time)) + ' ' + str(float(rreal)) + ' ' + str(float(rimag)) + ' ' + str(float(lreal)) + ' ' + str(float(limag)) + '\n'
             outfile.write(outline)
         outfile.close()
+
+def save_caltable_npz(caltable, fname):
+    """Saves a Caltable object to a binary npz file
+    """
+
+    # all site tables are stored in one DTCAL array, with the row ranges of each site
+    sites = list(caltable.data.keys())
+    tables = [np.asarray(caltable.data[site], dtype=DTCAL).reshape(-1) for site in sites]
+    bounds = np.cumsum([0] + [len(table) for table in tables])
+    if len(tables):
+        caldata = np.concatenate(tables)
+    else:
+        caldata = np.empty(0, dtype=DTCAL)
+
+    np.savez(fname, caldata=caldata, sites=np.array(sites), bounds=bounds, tarr=caltable.tarr,
+             ra=caltable.ra, dec=caltable.dec, rf=caltable.rf, bw=caltable.bw,
+             source=caltable.source, mjd=caltable.mjd, timetype=caltable.timetype)
+
+def load_caltable_npz(fname):
+    """Load a Caltable object saved with save_caltable_npz
+    """
+
+    with np.load(fname) as npz:
+        caldata = npz['caldata']
+        bounds = npz['bounds']
+        sites = npz['sites'].tolist()
+        datatables = {site: caldata[bounds[i]:bounds[i+1]] for (i, site) in enumerate(sites)}
+
+        caltable = Caltable(float(npz['ra']), float(npz['dec']), float(npz['rf']), float(npz['bw']),
+                            datatables, npz['tarr'], source=str(npz['source']), mjd=int(npz['mjd']),
+                            timetype=str(npz['timetype']))
+
+    return caltable
@@ -23,10 +23,12 @@ from builtins import range
 from builtins import object
 
 import numpy as np
+import collections
 import matplotlib.pyplot as plt
 import scipy.signal
 import scipy.ndimage.filters as filt
 import scipy.interpolate
+import scipy.sparse
 
 import ehtim.observing.obs_simulate as simobs
 import ehtim.observing.pulses
@@ -36,6 +38,11 @@ import ehtim.io.load
 from ehtim.const_def import *
 from ehtim.observing.obs_helpers import *
 
+REGRID_CACHE_SIZE = 16 # number of (source, target) grid pairs whose interpolation weights are kept by regrid_weights
+REGRID_ORDERS = {'linear':1, 'cubic':3, 'quintic':5}
+
+_regrid_cache = collections.OrderedDict()
+
 ###########################################################################################################################################
 #Image object
 ###########################################################################################################################################
@@ -483,53 +490,8 @@ class Image(object):
                 (Image): resampled image 
         """
         
-        fov_x = self.xdim * self.psize
-        fov_y = self.ydim * self.psize
-        
-        x = np.linspace(-fov_x/2, fov_x/2, self.xdim)
-        y = np.linspace(-fov_y/2, fov_y/2, self.ydim)
-
-        xtarget = np.linspace(-targetfov/2, targetfov/2, npix)
-        ytarget = np.linspace(-targetfov/2, targetfov/2, npix)
-
-        #interpfunc = scipy.interpolate.RectBivariateSpline( y, x, np.reshape(self.imvec, (self.ydim, self.xdim) ) )
-        interpfunc = scipy.interpolate.interp2d( y, x, np.reshape(self.imvec, (self.ydim, self.xdim) ) , kind=interp)
-        tmpimg = interpfunc(ytarget, xtarget)
-        tmpimg[np.abs(xtarget)>fov_x/2.,:] = 0.0
-        tmpimg[:,np.abs(ytarget)>fov_y/2.] = 0.0
-        tmpimg = tmpimg * (targetfov/npix)**2 /self.psize**2
-
-        outim = Image(tmpimg, targetfov/npix, self.ra, self.dec, rf=self.rf, source=self.source, mjd=self.mjd, pulse=self.pulse)
-
-        if len(self.qvec):
-            #interpfunc = scipy.interpolate.RectBivariateSpline( y, x, np.reshape(self.qvec, (self.ydim, self.xdim) ) )
-            interpfunc = scipy.interpolate.interp2d( y, x, np.reshape(self.qvec, (self.ydim, self.xdim) ) , kind=interp)
-            tmpimg = interpfunc(ytarget, xtarget)
-            tmpimg[np.abs(xtarget)>fov_x/2.,:] = 0.0
-            tmpimg[:,np.abs(ytarget)>fov_y/2.] = 0.0
-            outq = tmpimg * (targetfov/npix)**2 / self.psize**2
-
-            #interpfunc = scipy.interpolate.RectBivariateSpline( y, x, np.reshape(self.uvec, (self.ydim, self.xdim) ) )
-            interpfunc = scipy.interpolate.interp2d( y, x, np.reshape(self.uvec, (self.ydim, self.xdim) ) , kind=interp)
-            tmpimg = interpfunc(ytarget, xtarget)
-            tmpimg[np.abs(xtarget)>fov_x/2.,:] = 0.0
-            tmpimg[:,np.abs(ytarget)>fov_y/2.] = 0.0
-            outu = tmpimg * (targetfov/npix)**2 / self.psize**2
-
-            outim.add_qu(outq, outu)
+        return regrid_images([self], targetfov, npix, interp=interp)[0]
 
-        if len(self.vvec):
-            #interpfunc = scipy.interpolate.RectBivariateSpline( y, x, np.reshape(self.vvec, (self.ydim, self.xdim) ) )
-            interpfunc = scipy.interpolate.interp2d( y, x, np.reshape(self.vvec, (self.ydim, self.xdim) ) , kind=interp)
-            tmpimg = interpfunc(ytarget, xtarget)
-            tmpimg[np.abs(xtarget)>fov_x/2.,:] = 0.0
-            tmpimg[:,np.abs(ytarget)>fov_y/2.] = 0.0
-            outv = tmpimg * (targetfov/npix)**2 / self.psize**2
-
-            outim.add_v(outv)
-
-        return outim
-    
     def compare_images(self, im2, psize=None, target_fov=None, beamparams = [1., 1., 1.], blur_frac = 0.0, metric = ['nxcorr', 'nrmse', 'rssd'], blursmall=False, shift=False):
         """Compare to another image by computing normalized cross correlation, normalized root mean squared error, or square root of the sum of squared differences.
 
@@ -620,54 +582,34 @@ class Image(object):
         if im.pulse == ehtim.observing.pulses.deltaPulse2D:
             raise Exception("This function only works on continuously parametrized images: does not work with delta pulses!")
 
-        ydim_new = xdim_new
         fov = im.xdim * im.psize
         psize_new = fov / xdim_new
-        ij = np.array([[[i*im.psize + (im.psize*im.xdim)/2.0 - im.psize/2.0, j*im.psize + (im.psize*im.ydim)/2.0 - im.psize/2.0]
-                        for i in np.arange(0, -im.xdim, -1)]
-                        for j in np.arange(0, -im.ydim, -1)]).reshape((im.xdim*im.ydim, 2))
-        def im_new(x,y):
-            mask = (((x - ker_size*im.psize/2.0) < ij[:,0]) * (ij[:,0] < (x + ker_size*im.psize/2.0)) * ((y-ker_size*im.psize/2.0) < ij[:,1]) * (ij[:,1] < (y+ker_size*im.psize/2.0))).flatten()
-            return np.sum([im.imvec[n] * im.pulse(x-ij[n,0], y-ij[n,1], im.psize, dom="I") for n in np.arange(len(im.imvec))[mask]])
 
-        out = np.array([[im_new(x*psize_new + (psize_new*xdim_new)/2.0 - psize_new/2.0, y*psize_new + (psize_new*ydim_new)/2.0 - psize_new/2.0)
-                          for x in np.arange(0, -xdim_new, -1)]
-                          for y in np.arange(0, -ydim_new, -1)] )
+        # the pulses are separable, so the resampling is Wy @ I @ Wx.T with 1-D weight matrices
+        W = pulse_interp_matrix(im.pulse, im.psize, im.xdim, psize_new, xdim_new, ker_size)
+        W = W / im.pulse(0., 0., im.psize, dom="I")**0.5
+
+        # resample all Stokes planes at once
+        planes = [im.imvec]
+        if len(im.qvec):
+            planes += [im.qvec, im.uvec]
+        if len(im.vvec):
+            planes.append(im.vvec)
+        planes = np.array(planes).reshape(-1, im.ydim, im.xdim)
+
+        out = W.dot(planes.transpose(1,0,2).reshape(im.ydim, -1))
+        out = W.dot(out.reshape(-1, im.xdim).T).T.reshape(xdim_new, len(planes), xdim_new).transpose(1,0,2)
 
         # Normalize
-        scaling = np.sum(im.imvec) / np.sum(out)
+        scaling = np.sum(im.imvec) / np.sum(out[0])
         out *= scaling
-        outim = Image(out, psize_new, im.ra, im.dec, rf=im.rf, source=im.source, mjd=im.mjd, pulse=im.pulse)
+        outim = Image(out[0], psize_new, im.ra, im.dec, rf=im.rf, source=im.source, mjd=im.mjd, pulse=im.pulse)
 
         # Q and U images
         if len(im.qvec):
-            def im_new_q(x,y):
-                mask = (((x - ker_size*im.psize/2.0) < ij[:,0]) * (ij[:,0] < (x + ker_size*im.psize/2.0)) *
-                        ((y - ker_size*im.psize/2.0) < ij[:,1]) * (ij[:,1] < (y + ker_size*im.psize/2.0))).flatten()
-                return np.sum([im.qvec[n] * im.pulse(x-ij[n,0], y-ij[n,1], im.psize, dom="I") for n in np.arange(len(im.imvec))[mask]])
-            def im_new_u(x,y):
-                mask = (((x - ker_size*im.psize/2.0) < ij[:,0]) * (ij[:,0] < (x + ker_size*im.psize/2.0)) *
-                        ((y-ker_size*im.psize/2.0) < ij[:,1]) * (ij[:,1] < (y+ker_size*im.psize/2.0))).flatten()
-                return np.sum([im.uvec[n] * im.pulse(x-ij[n,0], y-ij[n,1], im.psize, dom="I") for n in np.arange(len(im.imvec))[mask]])
-            outq = np.array([[im_new_q(x*psize_new + (psize_new*xdim_new)/2.0 - psize_new/2.0, y*psize_new + (psize_new*ydim_new)/2.0 - psize_new/2.0)
-                          for x in np.arange(0, -xdim_new, -1)]
-                          for y in np.arange(0, -ydim_new, -1)] )
-            outu = np.array([[im_new_u(x*psize_new + (psize_new*xdim_new)/2.0 - psize_new/2.0, y*psize_new + (psize_new*ydim_new)/2.0 - psize_new/2.0)
-                          for x in np.arange(0, -xdim_new, -1)]
-                          for y in np.arange(0, -ydim_new, -1)] )
-            outq *= scaling
-            outu *= scaling
-            outim.add_qu(outq, outu)
+            outim.add_qu(out[1], out[2])
         if len(im.vvec):
-            def im_new_v(x,y):
-                mask = (((x - ker_size*im.psize/2.0) < ij[:,0]) * (ij[:,0] < (x + ker_size*im.psize/2.0)) *
-                        ((y-ker_size*im.psize/2.0) < ij[:,1]) * (ij[:,1] < (y+ker_size*im.psize/2.0))).flatten()
-                return np.sum([im.vvec[n] * im.pulse(x-ij[n,0], y-ij[n,1], im.psize, dom="I") for n in np.arange(len(im.imvec))[mask]])
-            outv = np.array([[im_new_v(x*psize_new + (psize_new*xdim_new)/2.0 - psize_new/2.0, y*psize_new + (psize_new*ydim_new)/2.0 - psize_new/2.0)
-                          for x in np.arange(0, -xdim_new, -1)]
-                          for y in np.arange(0, -ydim_new, -1)] )
-            outv *= scaling
-            outim.add_v(outv)
+            outim.add_v(out[-1])
         return outim
 
     def im_pad(self, fovx, fovy):
@@ -1345,6 +1287,160 @@ def make_square(obs, npix, fov, pulse=PULSE_DEFAULT):
     im = np.zeros((npix,npix))
     return Image(im, pdim, obs.ra, obs.dec, rf=obs.rf, source=obs.source, mjd=obs.mjd, pulse=pulse)
 
+###########################################################################################################################################
+#Batch observation
+###########################################################################################################################################
+def observe_batch(images, obs, ttype="direct", fft_pad_factor=2, sgrscat=False, compact=False):
+    """Observe many images on the same baselines as an existing observation object without adding noise.
+       The DFT matrix or FFT sampling setup of the uv coverage is shared by all images.
+
+       Args:
+           images (list): the Image objects to observe, all with the same dimensions and pixel size
+           obs (Obsdata): the existing observation with  baselines where the image FTs will be sampled
+           ttype (str): if "fast", use FFT to produce visibilities. Else "direct" for DTFT
+           fft_pad_factor (float): zero pad the image to fft_pad_factor * image size in FFT
+           sgrscat (bool): if True, the visibilites will be blurred by the Sgr A* scattering kernel
+           compact (bool): if True, return the visibilities as an array instead of Obsdata objects
+
+       Returns:
+           (list): one Obsdata object per image with no noise, or if compact, the (nimage, nvis) complex
+                   visibility array ((nimage, 4, nvis) I,Q,U,V visibilities for polarized images)
+    """
+
+    vis = simobs.observe_batch_nonoise(images, obs, sgrscat=sgrscat, ttype=ttype, fft_pad_factor=fft_pad_factor)
+    if compact:
+        return vis
+
+    obslist = []
+    for (i, im) in enumerate(images):
+        data = obs.data.copy()
+        if vis.ndim == 3:
+            data['vis'] = vis[i,0]
+            data['qvis'] = vis[i,1]
+            data['uvis'] = vis[i,2]
+            data['vvis'] = vis[i,3]
+        else:
+            data['vis'] = vis[i]
+            data['qvis'] = 0.
+            data['uvis'] = 0.
+            data['vvis'] = 0.
+
+        obslist.append(ehtim.obsdata.Obsdata(im.ra, im.dec, obs.rf, obs.bw, data,
+                                             obs.tarr, source=im.source, mjd=obs.mjd))
+    return obslist
+
+def pulse_interp_matrix(pulse, psize, xdim, psize_new, xdim_new, ker_size=5):
+    """Return the sparse 1-D matrix that resamples one axis of an image with a continuous pulse.
+       Entry (k, i) is pulse(x_k - x_i, 0) for new pixel k and old pixel i closer than ker_size/2 old pixels.
+
+       Args:
+           pulse (function): the image pulse function
+           psize (float): the old pixel size in radian
+           xdim (int): the old number of pixels
+           psize_new (float): the new pixel size in radian
+           xdim_new (int): the new number of pixels
+           ker_size (int): kernel size for resampling
+       Returns:
+           (scipy.sparse.csr_matrix): the (xdim_new, xdim) weight matrix
+    """
+
+    x = np.arange(0, -xdim, -1)*psize + (psize*xdim)/2.0 - psize/2.0
+    x_new = np.arange(0, -xdim_new, -1)*psize_new + (psize_new*xdim_new)/2.0 - psize_new/2.0
+
+    dx = x_new.reshape(-1,1) - x.reshape(1,-1)
+    (rows, cols) = np.nonzero(np.abs(dx) < ker_size*psize/2.0)
+    weights = pulse(dx[rows, cols], 0., psize, dom="I")
+
+    return scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(xdim_new, xdim))
+
+def regrid_weights(n, fov, n_new, fov_new, interp='linear'):
+    """Return the 1-D spline interpolation matrix from n pixels spanning fov to n_new pixels spanning fov_new.
+       Target pixels outside of the original fov get zero weight.
+       The last REGRID_CACHE_SIZE results are cached. The returned array is read-only.
+
+       Args:
+           n (int): the old number of pixels
+           fov (float): the old field of view (radian)
+           n_new (int): the new number of pixels
+           fov_new (float): the new field of view (radian)
+           interp ('linear', 'cubic', 'quintic'): type of interpolation
+       Returns:
+           (numpy.ndarray): the (n_new, n) weight matrix
+    """
+
+    if interp not in REGRID_ORDERS:
+        raise Exception("interp=%s, options for interp are 'linear', 'cubic', 'quintic'" % interp)
+
+    key = (n, fov, n_new, fov_new, interp)
+    if key in _regrid_cache:
+        _regrid_cache[key] = _regrid_cache.pop(key)
+        return _regrid_cache[key]
+
+    x = np.linspace(-fov/2, fov/2, n)
+    xtarget = np.linspace(-fov_new/2, fov_new/2, n_new)
+
+    # interpolating the identity gives the weight of every old pixel at the target points
+    spline = scipy.interpolate.make_interp_spline(x, np.eye(n), k=REGRID_ORDERS[interp])
+    weights = spline(xtarget)
+    weights[np.abs(xtarget) > fov/2.] = 0.0
+    weights.setflags(write=False)
+
+    _regrid_cache[key] = weights
+    while len(_regrid_cache) > REGRID_CACHE_SIZE:
+        _regrid_cache.popitem(last=False)
+
+    return weights
+
+def regrid_images(images, targetfov, npix, interp='linear'):
+    """Resample a list of images with the same dimensions and pixel size to new (square) dimensions.
+       All Stokes planes of all images are interpolated together with two matrix products.
+
+       Args:
+           images (list): the Image objects to resample
+           targetfov  (float): new field of view (radian)
+           npix  (int): new pixel dimension
+           interp ('linear', 'cubic', 'quintic'): type of interpolation. default is linear
+       Returns:
+           (list): the resampled images
+    """
+
+    im = images[0]
+    for image in images[1:]:
+        if image.xdim != im.xdim or image.ydim != im.ydim or image.psize != im.psize:
+            raise Exception("All images in regrid_images must have the same dimensions and pixel size!")
+
+    wy = regrid_weights(im.ydim, im.ydim*im.psize, npix, targetfov, interp)
+    wx = regrid_weights(im.xdim, im.xdim*im.psize, npix, targetfov, interp)
+
+    # stack all Stokes planes of all images
+    planes = []
+    for image in images:
+        planes.append(image.imvec)
+        if len(image.qvec):
+            planes += [image.qvec, image.uvec]
+        if len(image.vvec):
+            planes.append(image.vvec)
+    planes = np.array(planes).reshape(-1, im.ydim, im.xdim)
+
+    out = np.matmul(np.matmul(wy, planes), wx.T)
+    out *= (targetfov/npix)**2 / im.psize**2
+
+    outims = []
+    k = 0
+    for image in images:
+        outim = Image(out[k], targetfov/npix, image.ra, image.dec, rf=image.rf, source=image.source,
+                      mjd=image.mjd, pulse=image.pulse)
+        k += 1
+        if len(image.qvec):
+            outim.add_qu(out[k], out[k+1])
+            k += 2
+        if len(image.vvec):
+            outim.add_v(out[k])
+            k += 1
+        outims.append(outim)
+
+    return outims
+
 def load_txt(fname):
     """Read in an image from a text file.
     
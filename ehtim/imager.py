@@ -344,15 +344,14 @@ class Imager(object):
         self._nprior_I = (self.flux_next * self.prior_next.imvec / np.sum((self.prior_next.imvec)[self._embed_mask]))[self._embed_mask]
         self._ninit_I = (self.flux_next * self.init_next.imvec / np.sum((self.init_next.imvec)[self._embed_mask]))[self._embed_mask]
 
-        # data term tuples
+        # data term tuples, indexing a single set of model visibilities at the unique uv points
         if self._change_imgr_params:
-            self._data_tuples = {}
-            for dname in list(self.dat_term_next.keys()):
-                tup = chisqdata(self.obs_next, self.prior_next, self._embed_mask, dname, 
-                                ttype=self.ttype_next, order=self.fft_interp_order, fft_pad_factor=self.fft_pad_factor, 
-                                conv_func=self.fft_conv_func, p_rad=self.fft_gridder_prad, debias=self.debias, 
-                                snrcut=self.camp_snrcut,systematic_noise=self.systematic_noise)
-                self._data_tuples[dname] = tup
+            (self._data_tuples, self._A_shared) = chisqdata_shared(self.obs_next, self.prior_next, self._embed_mask,
+                                                                   sorted(self.dat_term_next.keys()), ttype=self.ttype_next,
+                                                                   order=self.fft_interp_order, fft_pad_factor=self.fft_pad_factor,
+                                                                   conv_func=self.fft_conv_func, p_rad=self.fft_gridder_prad,
+                                                                   debias=self.debias, snrcut=self.camp_snrcut,
+                                                                   systematic_noise=self.systematic_noise)
             self._change_imgr_params = False
 
         return
@@ -382,13 +381,15 @@ class Imager(object):
     def make_chisq_dict(self, imvec):
         """make dictionary of current chi^2 term values
         """
+        vis = shared_vis(imvec, self._A_shared, ttype=self.ttype_next, mask=self._embed_mask)
+
         chi2_dict = {}
         for dname in sorted(self.dat_term_next.keys()):
             data = self._data_tuples[dname][0]
             sigma = self._data_tuples[dname][1]
-            A = self._data_tuples[dname][2]
+            vis_index = self._data_tuples[dname][2]
 
-            chi2 = chisq(imvec, A, data, sigma, dname, ttype=self.ttype_next, mask=self._embed_mask)
+            chi2 = chisq_and_wdiff_shared(vis, vis_index, data, sigma, dname)[0]
             chi2_dict[dname] = chi2
 
         return chi2_dict
@@ -396,17 +397,39 @@ class Imager(object):
     def make_chisqgrad_dict(self, imvec):
         """make dictionary of current chi^2 term gradient values
         """
+        vis = shared_vis(imvec, self._A_shared, ttype=self.ttype_next, mask=self._embed_mask)
+
         chi2grad_dict = {}
         for dname in sorted(self.dat_term_next.keys()):
             data = self._data_tuples[dname][0]
             sigma = self._data_tuples[dname][1]
-            A = self._data_tuples[dname][2]
+            vis_index = self._data_tuples[dname][2]
 
-            chi2grad = chisqgrad(imvec, A, data, sigma, dname, ttype=self.ttype_next, mask=self._embed_mask)
+            wdiff = chisq_and_wdiff_shared(vis, vis_index, data, sigma, dname)[1]
+            chi2grad = shared_grad(wdiff, self._A_shared, ttype=self.ttype_next, mask=self._embed_mask)
             chi2grad_dict[dname] = chi2grad
 
         return chi2grad_dict
 
+    def make_chisq_and_wdiff(self, imvec):
+        """make dictionary of current chi^2 term values and the weighted sum of their
+           derivatives wrt the shared model visibilities
+        """
+        vis = shared_vis(imvec, self._A_shared, ttype=self.ttype_next, mask=self._embed_mask)
+
+        chi2_dict = {}
+        wdiff_tot = np.zeros(len(vis), dtype=complex)
+        for dname in sorted(self.dat_term_next.keys()):
+            data = self._data_tuples[dname][0]
+            sigma = self._data_tuples[dname][1]
+            vis_index = self._data_tuples[dname][2]
+
+            (chi2, wdiff) = chisq_and_wdiff_shared(vis, vis_index, data, sigma, dname)
+            chi2_dict[dname] = chi2
+            wdiff_tot += self.dat_term_next[dname] * wdiff
+
+        return (chi2_dict, wdiff_tot)
+
     def make_reg_dict(self, imvec):
         """make dictionary of current regularizer values
         """
@@ -527,7 +550,7 @@ class Imager(object):
         datterm = 0.
         chi2_term_dict = self.make_chisqgrad_dict(imvec)
         for dname in sorted(self.dat_term_next.keys()):
-            datterm += self.dat_term_next[dname] * (chi2_term_dict[dname] - 1.)
+            datterm += self.dat_term_next[dname] * chi2_term_dict[dname]
 
         regterm = 0
         reg_term_dict = self.make_reggrad_dict(imvec)
@@ -542,6 +565,36 @@ class Imager(object):
 
         return grad
 
+    def objfunc_and_grad(self, imvec):
+        """Current objective function and its gradient, sharing the model visibilities.
+        """
+        if self.transform_next == 'log':
+            imvec = np.exp(imvec)
+
+        # one forward and one adjoint transform for all data terms together
+        (chi2_term_dict, wdiff) = self.make_chisq_and_wdiff(imvec)
+        datgrad = shared_grad(wdiff, self._A_shared, ttype=self.ttype_next, mask=self._embed_mask)
+        reg_term_dict = self.make_reg_dict(imvec)
+        reggrad_term_dict = self.make_reggrad_dict(imvec)
+
+        datterm = 0.
+        for dname in sorted(self.dat_term_next.keys()):
+            datterm += self.dat_term_next[dname] * (chi2_term_dict[dname] - 1.)
+
+        regterm = 0
+        reggrad = 0
+        for regname in sorted(self.reg_term_next.keys()):
+            regterm += self.reg_term_next[regname] * reg_term_dict[regname]
+            reggrad += self.reg_term_next[regname] * reggrad_term_dict[regname]
+
+        grad = datgrad + reggrad
+
+        # chain rule term for change of variables
+        if self.transform_next == 'log':
+            grad *= imvec
+
+        return (datterm + regterm, grad)
+
     def objgrad_scattering(self, minvec):
         """Current stochastic optics objective function gradient
         """
@@ -588,7 +641,7 @@ class Imager(object):
         datterm = 0.
         chi2_term_dict = self.make_chisqgrad_dict(scatt_im)
         for dname in sorted(self.dat_term_next.keys()):
-            datterm += self.dat_term_next[dname] * (chi2_term_dict[dname] - 1.)
+            datterm += self.dat_term_next[dname] * chi2_term_dict[dname]
         dchisq_dIa = datterm.reshape((N,N))
         # Now the chain rule factor to get the chi^2 gradient wrt the unscattered image
         gx = (rF**2.0 * so.Wrapped_Convolve(self._ea_ker_gradient_x[::-1,::-1], phi_Gradient_x * (dchisq_dIa))).flatten()
@@ -744,7 +797,7 @@ class Imager(object):
         optdict = {'maxiter':self.maxit_next, 'ftol':STOP, 'maxcor':NHIST}
         tstart = time.time()
         if grads:
-            res = opt.minimize(self.objfunc, xinit, method='L-BFGS-B', jac=self.objgrad,
+            res = opt.minimize(self.objfunc_and_grad, xinit, method='L-BFGS-B', jac=True,
                                options=optdict, callback=self.plotcur)
         else:
             res = opt.minimize(self.objfunc, xinit, method='L-BFGS-B',
@@ -30,6 +30,8 @@ import string
 import time
 import numpy as np
 import scipy.optimize as opt
+import scipy.sparse as sparse
+import scipy.special
 import scipy.ndimage as nd
 import scipy.ndimage.filters as filt
 import matplotlib.pyplot as plt
@@ -59,6 +61,7 @@ GRIDDER_P_RAD_DEFAULT = 2
 GRIDDER_CONV_FUNC_DEFAULT = 'gaussian'
 FFT_PAD_DEFAULT = 2
 FFT_INTERP_DEFAULT = 3
+GRIDDER_CORR_NSUB = 32 # number of sub-pixel uv offsets averaged in the gridding correction
 
 nit = 0 # global variable to track the iteration number in the plotting callback
 
@@ -97,7 +100,7 @@ def imager_func(Obsdata, InitIm, Prior, flux,
            ttype (str): The Fourier transform type; options are 'fast', 'direct', 'nfft'
            fft_pad_factor (float): The FFT will pre-pad the image by this factor x the original size
            fft_interp (int): Interpolation order for sampling the FFT
-           grid_conv (str): The convolving function for gridding; options are 'gaussian', 'pill', and 'cubic'
+           grid_conv (str): The convolving function for gridding; options are 'gaussian', 'pillbox', 'cubic', and 'kaiserbessel'
            grid_prad (int): The pixel radius for the convolving function in gridding for FFTs
 
            clipfloor (float): The Jy/pixel level above which prior image pixels are varied
@@ -456,6 +459,48 @@ def chisqgrad(imvec, A, data, sigma, dtype, ttype='direct', mask=[]):
 
     return chisqgrad
 
+def chisq_and_grad(imvec, A, data, sigma, dtype, ttype='direct', mask=[], vis_arr=None):
+    """return the chi^2 and its gradient for the appropriate dtype
+       the model visibilities are computed only once for both;
+       for ttype='fast' a precomputed fft of the embedded image may be passed in vis_arr
+    """
+
+    if not dtype in DATATERMS:
+        return (1, np.zeros(len(imvec)))
+
+    if ttype not in ['fast','direct','nfft']:
+        raise Exception("Possible ttype values are 'fast', 'direct','nfft'!")
+
+    if ttype == 'direct':
+        if dtype in ['vis','amp']:
+            A = [A]
+        samples = [Amatrix.dot(imvec) for Amatrix in A]
+        (chisq, wdiffs) = chisq_and_wdiff(samples, data, sigma, dtype)
+        grad = 2*np.real(sum([ftrdot(wdiff.conj(), Amatrix) for (wdiff, Amatrix) in zip(wdiffs, A)]))
+
+    elif ttype == 'fast':
+        if vis_arr is None:
+            if len(mask)>0 and np.any(np.invert(mask)):
+                imvec = embed(imvec, mask, randomfloor=True)
+            vis_arr = fft_imvec(imvec, A[0])
+        samples = [sampler(vis_arr, [sampler_info], sample_type="vis") for sampler_info in A[1]]
+        (chisq, wdiffs) = chisq_and_wdiff(samples, data, sigma, dtype)
+        grad = 2*fft_adjoint(wdiffs, A)
+
+        if len(mask)>0 and np.any(np.invert(mask)):
+            grad = grad[mask]
+
+    elif ttype == 'nfft':
+        if len(mask)>0 and np.any(np.invert(mask)):
+            imvec = embed(imvec, mask, randomfloor=True)
+        samples = [nfft_trafo(imvec, nfft_info) for nfft_info in A]
+        (chisq, wdiffs) = chisq_and_wdiff(samples, data, sigma, dtype)
+        grad = 2*sum([nfft_adjoint(wdiff, nfft_info) for (wdiff, nfft_info) in zip(wdiffs, A)])
+
+        if len(mask)>0 and np.any(np.invert(mask)):
+            grad = grad[mask]
+
+    return (chisq, grad)
 
 def regularizer(imvec, nprior, mask, flux, xdim, ydim, psize, stype):
     """return the regularizer value
@@ -603,57 +648,57 @@ def chisqdata(Obsdata, Prior, mask, dtype, ttype='direct', debias=True,snrcut=0,
 def chisq_vis(imvec, Amatrix, vis, sigma):
     """Visibility chi-squared"""
 
-    samples = np.dot(Amatrix, imvec)
+    samples = Amatrix.dot(imvec)
     return np.sum(np.abs((samples-vis)/sigma)**2)/(2*len(vis))
 
 def chisqgrad_vis(imvec, Amatrix, vis, sigma):
     """The gradient of the visibility chi-squared"""
 
-    samples = np.dot(Amatrix, imvec)
+    samples = Amatrix.dot(imvec)
     wdiff = (vis - samples)/(sigma**2)
 
-    out = -np.real(np.dot(Amatrix.conj().T, wdiff))/len(vis)
+    out = -np.real(ftrdot(wdiff.conj(), Amatrix))/len(vis)
     return out
 
 def chisq_amp(imvec, A, amp, sigma):
     """Visibility Amplitudes (normalized) chi-squared"""
 
-    amp_samples = np.abs(np.dot(A, imvec))
+    amp_samples = np.abs(A.dot(imvec))
     return np.sum(np.abs((amp - amp_samples)/sigma)**2)/len(amp)
 
 def chisqgrad_amp(imvec, A, amp, sigma):
     """The gradient of the amplitude chi-squared"""
 
-    i1 = np.dot(A, imvec)
+    i1 = A.dot(imvec)
     amp_samples = np.abs(i1)
 
     pp = ((amp - amp_samples) * amp_samples) / (sigma**2) / i1
-    out = (-2.0/len(amp)) * np.real(np.dot(pp, A))
+    out = (-2.0/len(amp)) * np.real(ftrdot(pp, A))
     return out
 
 def chisq_bs(imvec, Amatrices, bis, sigma):
     """Bispectrum chi-squared"""
 
-    bisamples = np.dot(Amatrices[0], imvec) * np.dot(Amatrices[1], imvec) * np.dot(Amatrices[2], imvec)
+    bisamples = Amatrices[0].dot(imvec) * Amatrices[1].dot(imvec) * Amatrices[2].dot(imvec)
     chisq= np.sum(np.abs(((bis - bisamples)/sigma))**2)/(2.*len(bis))
     return chisq
 
 def chisqgrad_bs(imvec, Amatrices, bis, sigma):
     """The gradient of the bispectrum chi-squared"""
 
-    bisamples = np.dot(Amatrices[0], imvec) * np.dot(Amatrices[1], imvec) * np.dot(Amatrices[2], imvec)
+    bisamples = Amatrices[0].dot(imvec) * Amatrices[1].dot(imvec) * Amatrices[2].dot(imvec)
     wdiff = ((bis - bisamples).conj())/(sigma**2)
-    pt1 = wdiff * np.dot(Amatrices[1],imvec) * np.dot(Amatrices[2],imvec)
-    pt2 = wdiff * np.dot(Amatrices[0],imvec) * np.dot(Amatrices[2],imvec)
-    pt3 = wdiff * np.dot(Amatrices[0],imvec) * np.dot(Amatrices[1],imvec)
-    out = -np.real(np.dot(pt1, Amatrices[0]) + np.dot(pt2, Amatrices[1]) + np.dot(pt3, Amatrices[2]))/len(bis)
+    pt1 = wdiff * Amatrices[1].dot(imvec) * Amatrices[2].dot(imvec)
+    pt2 = wdiff * Amatrices[0].dot(imvec) * Amatrices[2].dot(imvec)
+    pt3 = wdiff * Amatrices[0].dot(imvec) * Amatrices[1].dot(imvec)
+    out = -np.real(ftrdot(pt1, Amatrices[0]) + ftrdot(pt2, Amatrices[1]) + ftrdot(pt3, Amatrices[2]))/len(bis)
     return out
 
 def chisq_cphase(imvec, Amatrices, clphase, sigma):
     """Closure Phases (normalized) chi-squared"""
     clphase = clphase * DEGREE
     sigma = sigma * DEGREE
-    clphase_samples = np.angle(np.dot(Amatrices[0], imvec) * np.dot(Amatrices[1], imvec) * np.dot(Amatrices[2], imvec))
+    clphase_samples = np.angle(Amatrices[0].dot(imvec) * Amatrices[1].dot(imvec) * Amatrices[2].dot(imvec))
     chisq= (2.0/len(clphase)) * np.sum((1.0 - np.cos(clphase-clphase_samples))/(sigma**2))
     return chisq
 
@@ -662,32 +707,32 @@ def chisqgrad_cphase(imvec, Amatrices, clphase, sigma):
     clphase = clphase * DEGREE
     sigma = sigma * DEGREE
 
-    i1 = np.dot(Amatrices[0], imvec)
-    i2 = np.dot(Amatrices[1], imvec)
-    i3 = np.dot(Amatrices[2], imvec)
+    i1 = Amatrices[0].dot(imvec)
+    i2 = Amatrices[1].dot(imvec)
+    i3 = Amatrices[2].dot(imvec)
     clphase_samples = np.angle(i1 * i2 * i3)
 
     pref = np.sin(clphase - clphase_samples)/(sigma**2)
     pt1  = pref/i1
     pt2  = pref/i2
     pt3  = pref/i3
-    out  = -(2.0/len(clphase)) * np.imag(np.dot(pt1, Amatrices[0]) + np.dot(pt2, Amatrices[1]) + np.dot(pt3, Amatrices[2]))
+    out  = -(2.0/len(clphase)) * np.imag(ftrdot(pt1, Amatrices[0]) + ftrdot(pt2, Amatrices[1]) + ftrdot(pt3, Amatrices[2]))
     return out
 
 def chisq_camp(imvec, Amatrices, clamp, sigma):
     """Closure Amplitudes (normalized) chi-squared"""
 
-    clamp_samples = np.abs(np.dot(Amatrices[0], imvec) * np.dot(Amatrices[1], imvec) / (np.dot(Amatrices[2], imvec) * np.dot(Amatrices[3], imvec)))
+    clamp_samples = np.abs(Amatrices[0].dot(imvec) * Amatrices[1].dot(imvec) / (Amatrices[2].dot(imvec) * Amatrices[3].dot(imvec)))
     chisq = np.sum(np.abs((clamp - clamp_samples)/sigma)**2)/len(clamp)
     return chisq
 
 def chisqgrad_camp(imvec, Amatrices, clamp, sigma):
     """The gradient of the closure amplitude chi-squared"""
 
-    i1 = np.dot(Amatrices[0], imvec)
-    i2 = np.dot(Amatrices[1], imvec)
-    i3 = np.dot(Amatrices[2], imvec)
-    i4 = np.dot(Amatrices[3], imvec)
+    i1 = Amatrices[0].dot(imvec)
+    i2 = Amatrices[1].dot(imvec)
+    i3 = Amatrices[2].dot(imvec)
+    i4 = Amatrices[3].dot(imvec)
     clamp_samples = np.abs((i1 * i2)/(i3 * i4))
 
     pp = ((clamp - clamp_samples) * clamp_samples)/(sigma**2)
@@ -695,16 +740,16 @@ def chisqgrad_camp(imvec, Amatrices, clamp, sigma):
     pt2 =  pp/i2
     pt3 = -pp/i3
     pt4 = -pp/i4
-    out = (-2.0/len(clamp)) * np.real(np.dot(pt1, Amatrices[0]) + np.dot(pt2, Amatrices[1]) + np.dot(pt3, Amatrices[2]) + np.dot(pt4, Amatrices[3]))
+    out = (-2.0/len(clamp)) * np.real(ftrdot(pt1, Amatrices[0]) + ftrdot(pt2, Amatrices[1]) + ftrdot(pt3, Amatrices[2]) + ftrdot(pt4, Amatrices[3]))
     return out
 
 def chisq_logcamp(imvec, Amatrices, log_clamp, sigma):
     """Log Closure Amplitudes (normalized) chi-squared"""
 
-    a1 = np.abs(np.dot(Amatrices[0], imvec))
-    a2 = np.abs(np.dot(Amatrices[1], imvec))
-    a3 = np.abs(np.dot(Amatrices[2], imvec))
-    a4 = np.abs(np.dot(Amatrices[3], imvec))
+    a1 = np.abs(Amatrices[0].dot(imvec))
+    a2 = np.abs(Amatrices[1].dot(imvec))
+    a3 = np.abs(Amatrices[2].dot(imvec))
+    a4 = np.abs(Amatrices[3].dot(imvec))
 
     samples = np.log(a1) + np.log(a2) - np.log(a3) - np.log(a4)
     chisq = np.sum(np.abs((log_clamp - samples)/sigma)**2) / (len(log_clamp))
@@ -713,10 +758,10 @@ def chisq_logcamp(imvec, Amatrices, log_clamp, sigma):
 def chisqgrad_logcamp(imvec, Amatrices, log_clamp, sigma):
     """The gradient of the Log closure amplitude chi-squared"""
 
-    i1 = np.dot(Amatrices[0], imvec)
-    i2 = np.dot(Amatrices[1], imvec)
-    i3 = np.dot(Amatrices[2], imvec)
-    i4 = np.dot(Amatrices[3], imvec)
+    i1 = Amatrices[0].dot(imvec)
+    i2 = Amatrices[1].dot(imvec)
+    i3 = Amatrices[2].dot(imvec)
+    i4 = Amatrices[3].dot(imvec)
     log_clamp_samples = np.log(np.abs(i1)) + np.log(np.abs(i2)) - np.log(np.abs(i3)) - np.log(np.abs(i4))
 
     pp = (log_clamp - log_clamp_samples) / (sigma**2)
@@ -724,7 +769,7 @@ def chisqgrad_logcamp(imvec, Amatrices, log_clamp, sigma):
     pt2 = pp / i2
     pt3 = -pp / i3
     pt4 = -pp / i4
-    out = (-2.0/len(log_clamp)) * np.real(np.dot(pt1, Amatrices[0]) + np.dot(pt2, Amatrices[1]) + np.dot(pt3, Amatrices[2]) + np.dot(pt4, Amatrices[3]))
+    out = (-2.0/len(log_clamp)) * np.real(ftrdot(pt1, Amatrices[0]) + ftrdot(pt2, Amatrices[1]) + ftrdot(pt3, Amatrices[2]) + ftrdot(pt4, Amatrices[3]))
     return out
 
 ##################################################################################################
@@ -760,7 +805,7 @@ def chisqgrad_vis_fft(vis_arr, A, vis, sigma):
 
     # extract relevant cells and flatten
     # TODO or is x<-->y??
-    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2, im_info.padvaly1:-im_info.padvaly2].flatten())
+    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2, im_info.padvaly1:-im_info.padvaly2].flatten()) / im_info.gridcorr
 
     return out
 
@@ -795,7 +840,7 @@ def chisqgrad_amp_fft(vis_arr, A, amp, sigma):
 
     # extract relevent cells and flatten
     # TODO or is x<-->y??
-    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten())
+    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) / im_info.gridcorr
 
     return out
 
@@ -831,7 +876,7 @@ def chisqgrad_bs_fft(vis_arr, A, bis, sigma):
 
     # extract relevant cells and flatten
     # TODO or is x<-->y??
-    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) 
+    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) / im_info.gridcorr
     return out
 
 def chisq_cphase_fft(vis_arr, A, clphase, sigma):
@@ -872,7 +917,7 @@ def chisqgrad_cphase_fft(vis_arr, A, clphase, sigma):
 
     # extract relevant cells and flatten
     # TODO or is x<-->y??
-    out = np.imag(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten())
+    out = np.imag(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) / im_info.gridcorr
 
     return out
 
@@ -913,7 +958,7 @@ def chisqgrad_camp_fft(vis_arr, A, clamp, sigma):
 
     # extract relevant cells and flatten
     # TODO or is x<-->y??
-    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) 
+    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) / im_info.gridcorr
 
     return out
 
@@ -957,7 +1002,7 @@ def chisqgrad_logcamp_fft(vis_arr, A, log_clamp, sigma):
 
     # extract relevant cells and flatten
     # TODO or is x<-->y??
-    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) 
+    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) / im_info.gridcorr
 
     return out
 
@@ -1450,6 +1495,191 @@ def chisqgrad_logcamp_nfft(imvec, A, log_clamp, sigma):
 
     out = out1 + out2 + out3 + out4
     return out
+
+##################################################################################################
+# Fused Chi-squared and Gradient Functions
+##################################################################################################
+def chisq_and_wdiff(samples, data, sigma, dtype):
+    """Return the chi^2 and its derivatives with respect to the conjugated model visibilities
+       samples is a list of the model visibilities entering the data product
+       (1 for vis/amp, 3 for bs/cphase, 4 for camp/logcamp)
+       the chi^2 gradient wrt a real image is 2*Re(sum_i F_i^H wdiff_i) for forward transforms F_i
+    """
+
+    if dtype == 'vis':
+        v1 = samples[0]
+        chisq = np.sum(np.abs((v1-data)/sigma)**2)/(2*len(data))
+        wdiffs = [(v1 - data)/(sigma**2)/(2*len(data))]
+
+    elif dtype == 'amp':
+        v1 = samples[0]
+        amp_samples = np.abs(v1)
+        chisq = np.sum(np.abs((data - amp_samples)/sigma)**2)/len(data)
+        wdiffs = [((amp_samples - data)/(sigma**2) * v1/amp_samples)/len(data)]
+
+    elif dtype == 'bs':
+        (v1, v2, v3) = samples
+        bisamples = v1*v2*v3
+        chisq = np.sum(np.abs(((data - bisamples)/sigma))**2)/(2.*len(data))
+        wdiff = (bisamples - data)/(sigma**2)/(2.*len(data))
+        wdiffs = [wdiff*(v2*v3).conj(), wdiff*(v1*v3).conj(), wdiff*(v1*v2).conj()]
+
+    elif dtype == 'cphase':
+        (v1, v2, v3) = samples
+        clphase = data * DEGREE
+        sigmarad = sigma * DEGREE
+        clphase_samples = np.angle(v1*v2*v3)
+        chisq = (2.0/len(clphase)) * np.sum((1.0 - np.cos(clphase-clphase_samples))/(sigmarad**2))
+        pref = -0.5j * (2.0/len(clphase)) * np.sin(clphase - clphase_samples)/(sigmarad**2)
+        wdiffs = [pref/v1.conj(), pref/v2.conj(), pref/v3.conj()]
+
+    elif dtype == 'camp':
+        (v1, v2, v3, v4) = samples
+        clamp_samples = np.abs((v1 * v2)/(v3 * v4))
+        chisq = np.sum(np.abs((data - clamp_samples)/sigma)**2)/len(data)
+        pp = -((data - clamp_samples) * clamp_samples)/(sigma**2)/len(data)
+        wdiffs = [pp/v1.conj(), pp/v2.conj(), -pp/v3.conj(), -pp/v4.conj()]
+
+    elif dtype == 'logcamp':
+        (v1, v2, v3, v4) = samples
+        log_clamp_samples = np.log(np.abs(v1)) + np.log(np.abs(v2)) - np.log(np.abs(v3)) - np.log(np.abs(v4))
+        chisq = np.sum(np.abs((data - log_clamp_samples)/sigma)**2) / (len(data))
+        pp = -(data - log_clamp_samples)/(sigma**2)/len(data)
+        wdiffs = [pp/v1.conj(), pp/v2.conj(), -pp/v3.conj(), -pp/v4.conj()]
+
+    else:
+        raise Exception("Invalid data term: valid data terms are: " + ' '.join(DATATERMS))
+
+    return (chisq, wdiffs)
+
+def fft_adjoint(wdiff_list, A):
+    """Apply the adjoint of the fft + sampling operators in A to a list of uv-space vectors
+       the real part of the result is returned on the unpadded image grid
+    """
+
+    im_info, sampler_info_list, gridder_info_list = A
+
+    pulsefacs = [sampler_info.pulsefac for sampler_info in sampler_info_list]
+    data_list = [wdiff * pulsefac.conj() for (wdiff, pulsefac) in zip(wdiff_list, pulsefacs)]
+
+    # Setup and perform the inverse FFT
+    wdiff_arr = gridder(data_list, gridder_info_list)
+    grad_arr = np.fft.ifftshift(np.fft.ifft2(np.fft.fftshift(wdiff_arr)))
+    grad_arr = grad_arr * (im_info.npad * im_info.npad)
+
+    # extract relevant cells and flatten
+    out = np.real(grad_arr[im_info.padvalx1:-im_info.padvalx2,im_info.padvaly1:-im_info.padvaly2].flatten()) / im_info.gridcorr
+    return out
+
+def dirty_images(uv, data_list, npix, psize, ttype='fast', fft_pad_factor=2,
+                 conv_func=GRIDDER_CONV_FUNC_DEFAULT, p_rad=GRIDDER_P_RAD_DEFAULT):
+    """Return the (ndata, npix, npix) real parts of the adjoint DFTs of a list of weighted data vectors at the uv points.
+       With ttype='fast', all data vectors are gridded in a single pass and transformed with one batched FFT,
+       and the result is divided by the image of the gridding kernel.
+    """
+
+    data_arr = np.array(data_list).reshape(-1, len(uv))
+    xlist = np.arange(0,-npix,-1)*psize + (psize*npix)/2.0 - psize/2.0
+
+    if ttype == 'direct':
+        # the phase factors are separable in x and y
+        yphase = np.exp(-2j*np.pi*np.outer(xlist, uv[:,1]))
+        xphase = np.exp(-2j*np.pi*np.outer(xlist, uv[:,0]))
+        return np.array([np.real(np.dot(yphase*data, xphase.T)) for data in data_arr])
+
+    elif ttype != 'fast':
+        raise Exception("ttype=%s, options for ttype are 'direct', 'fast'" % ttype)
+
+    npad = int(fft_pad_factor * npix)
+    im_info = ImInfo(npix, npix, npad, psize, deltaPulse2D, conv_func=conv_func, p_rad=p_rad)
+    (sampler_info, gridder_info) = make_gridder_and_sampler_info(im_info, uv, conv_func=conv_func, p_rad=p_rad)
+    (_, kernel_info) = make_gridder_and_sampler_info(im_info, np.zeros((1,2)), conv_func=conv_func, p_rad=p_rad)
+
+    # grid every data vector, and a unit point at the origin for the gridding correction
+    grid = gridder_info.gridmatrix.dot((data_arr * sampler_info.pulsefac.conj()).T)
+    grid = np.hstack((grid, kernel_info.gridmatrix.dot(np.ones((1,1)))))
+    grid = grid.T.reshape(-1, npad, npad)
+
+    ims = np.fft.ifftshift(np.fft.ifft2(np.fft.fftshift(grid, axes=(-2,-1))), axes=(-2,-1)) * (npad*npad)
+    ims = np.real(ims[:, im_info.padvalx1:npad-im_info.padvalx2, im_info.padvaly1:npad-im_info.padvaly2])
+
+    return ims[:-1] / ims[-1]
+
+def nfft_trafo(imvec, nfft_info):
+    """Return the model visibilities of imvec at the uv points of an NFFTInfo object
+    """
+
+    plan = nfft_info.plan
+    plan.f_hat = imvec.copy().reshape((nfft_info.ydim,nfft_info.xdim)).T
+    plan.trafo()
+    samples = plan.f.copy()*nfft_info.pulsefac
+    return samples
+
+def nfft_adjoint(wdiff, nfft_info):
+    """Apply the adjoint of the nfft in an NFFTInfo object to a uv-space vector
+       the real part of the result is returned
+    """
+
+    plan = nfft_info.plan
+    plan.f = wdiff * nfft_info.pulsefac.conj()
+    plan.adjoint()
+    out = np.real((plan.f_hat.copy().T).reshape(nfft_info.xdim*nfft_info.ydim))
+    return out
+
+def shared_vis(imvec, A, ttype='direct', mask=[]):
+    """Return the model visibilities of imvec at the unique uv points of a shared transform A
+    """
+
+    if ttype == 'direct':
+        vis = A.dot(imvec)
+    else:
+        if len(mask)>0 and np.any(np.invert(mask)):
+            imvec = embed(imvec, mask, randomfloor=True)
+        if ttype == 'fast':
+            vis_arr = fft_imvec(imvec, A[0])
+            vis = sampler(vis_arr, A[1], sample_type="vis")
+        elif ttype == 'nfft':
+            vis = nfft_trafo(imvec, A[0])
+        else:
+            raise Exception("Possible ttype values are 'fast', 'direct','nfft'!")
+
+    return vis
+
+def shared_grad(wdiff, A, ttype='direct', mask=[]):
+    """Return the image gradient 2*Re(F^H wdiff) for the shared transform A
+    """
+
+    if ttype == 'direct':
+        grad = 2*np.real(ftrdot(wdiff.conj(), A))
+    else:
+        if ttype == 'fast':
+            grad = 2*fft_adjoint([wdiff], A)
+        elif ttype == 'nfft':
+            grad = 2*nfft_adjoint(wdiff, A[0])
+        else:
+            raise Exception("Possible ttype values are 'fast', 'direct','nfft'!")
+        if len(mask)>0 and np.any(np.invert(mask)):
+            grad = grad[mask]
+
+    return grad
+
+def chisq_and_wdiff_shared(vis, vis_index, data, sigma, dtype):
+    """Return the chi^2 of a data term and its derivative wrt the conjugated shared model visibilities
+       vis_index is the list of (index, conj) maps from the data term into vis
+    """
+
+    samples = [np.where(conj, vis[index].conj(), vis[index]) for (index, conj) in vis_index]
+    (chisq, wdiffs) = chisq_and_wdiff(samples, data, sigma, dtype)
+
+    # accumulate the derivatives on the shared points
+    wdiff_shared = np.zeros(len(vis), dtype=complex)
+    for ((index, conj), wdiff) in zip(vis_index, wdiffs):
+        wdiff = np.where(conj, wdiff.conj(), wdiff)
+        wdiff_shared += (np.bincount(index, weights=np.real(wdiff), minlength=len(vis)) +
+                         1j*np.bincount(index, weights=np.imag(wdiff), minlength=len(vis)))
+
+    return (chisq, wdiff_shared)
+
 ##################################################################################################
 # Regularizer and Gradient Functions
 ##################################################################################################
@@ -1651,7 +1881,7 @@ def chisqdata_vis(Obsdata, Prior, mask, systematic_noise=0.0):
     #sigma = ampdata['sigma']
     sigma = np.linalg.norm([data_arr['sigma'], systematic_noise*data_arr['amp']],axis=0)
 
-    A = ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv, pulse=Prior.pulse, mask=mask)
+    A = ftoperator(Prior.psize, Prior.xdim, Prior.ydim, uv, pulse=Prior.pulse, mask=mask)
 
     return (vis, sigma, A)
 
@@ -1667,7 +1897,7 @@ def chisqdata_amp(Obsdata, Prior, mask,debias=True, systematic_noise=0.0):
     #sigma = ampdata['sigma']
     sigma = np.linalg.norm([ampdata['sigma'], systematic_noise*ampdata['amp']],axis=0)
 
-    A = ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv, pulse=Prior.pulse, mask=mask)
+    A = ftoperator(Prior.psize, Prior.xdim, Prior.ydim, uv, pulse=Prior.pulse, mask=mask)
 
     return (amp, sigma, A)
 
@@ -1682,10 +1912,7 @@ def chisqdata_bs(Obsdata, Prior, mask):
     bi = biarr['bispec']
     sigma = biarr['sigmab']
 
-    A3 = (ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv1, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv2, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv3, pulse=Prior.pulse, mask=mask)
-         )
+    A3 = closure_ftmatrices(Prior, mask, (uv1, uv2, uv3))
 
     return (bi, sigma, A3)
 
@@ -1700,10 +1927,7 @@ def chisqdata_cphase(Obsdata, Prior, mask):
     clphase = clphasearr['cphase']
     sigma = clphasearr['sigmacp']
 
-    A3 = (ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv1, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv2, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv3, pulse=Prior.pulse, mask=mask)
-         )
+    A3 = closure_ftmatrices(Prior, mask, (uv1, uv2, uv3))
     return (clphase, sigma, A3)
 
 def chisqdata_camp(Obsdata, Prior, mask, debias=True,snrcut=0):
@@ -1719,11 +1943,7 @@ def chisqdata_camp(Obsdata, Prior, mask, debias=True,snrcut=0):
     clamp = clamparr['camp'][snrmask]
     sigma = clamparr['sigmaca'][snrmask]
 
-    A4 = (ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv1, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv2, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv3, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv4, pulse=Prior.pulse, mask=mask)
-         )
+    A4 = closure_ftmatrices(Prior, mask, (uv1, uv2, uv3, uv4))
 
     return (clamp, sigma, A4)
 
@@ -1741,14 +1961,21 @@ def chisqdata_logcamp(Obsdata, Prior, mask, debias=True, snrcut=0):
     clamp = clamparr['camp'][snrmask]
     sigma = clamparr['sigmaca'][snrmask]
 
-    A4 = (ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv1, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv2, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv3, pulse=Prior.pulse, mask=mask),
-          ftmatrix(Prior.psize, Prior.xdim, Prior.ydim, uv4, pulse=Prior.pulse, mask=mask)
-         )
+    A4 = closure_ftmatrices(Prior, mask, (uv1, uv2, uv3, uv4))
 
     return (clamp, sigma, A4)
 
+def closure_ftmatrices(Prior, mask, uvlist):
+    """Return a tuple of DFT operators for the baselines of a closure quantity.
+       Closures share baselines, so one DFT operator is built over the distinct uv points
+       and each baseline gathers its rows by index
+    """
+
+    (uv_unique, vis_index) = unique_uv_index(uvlist)
+    A = ftoperator(Prior.psize, Prior.xdim, Prior.ydim, uv_unique, pulse=Prior.pulse, mask=mask)
+
+    shared = {}
+    return tuple(GatheredFTOperator(A, index, conj, shared=shared) for (index, conj) in vis_index)
 
 ##################################################################################################
 # FFT Chi^2 Data functions
@@ -1769,7 +1996,7 @@ def chisqdata_vis_fft(Obsdata, Prior, fft_pad_factor=2,
 
     npad = int(fft_pad_factor * np.max((Prior.xdim, Prior.ydim)))
 
-    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse)
+    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse, conv_func=conv_func, p_rad=p_rad)
 
     gs_info = make_gridder_and_sampler_info(im_info, uv, conv_func=conv_func, p_rad=p_rad, order=order)
     sampler_info_list = [gs_info[0]]
@@ -1795,7 +2022,7 @@ def chisqdata_amp_fft(Obsdata, Prior, fft_pad_factor=2,
 
     npad = int(fft_pad_factor * np.max((Prior.xdim, Prior.ydim)))
 
-    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse)
+    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse, conv_func=conv_func, p_rad=p_rad)
 
     gs_info = make_gridder_and_sampler_info(im_info, uv, conv_func=conv_func, p_rad=p_rad, order=order)
     sampler_info_list = [gs_info[0]]
@@ -1817,7 +2044,7 @@ def chisqdata_bs_fft(Obsdata, Prior, fft_pad_factor=2,
 
     npad = int(fft_pad_factor * np.max((Prior.xdim, Prior.ydim)))
 
-    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse)
+    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse, conv_func=conv_func, p_rad=p_rad)
 
     gs_info1 = make_gridder_and_sampler_info(im_info, uv1, conv_func=conv_func, p_rad=p_rad, order=order)
     gs_info2 = make_gridder_and_sampler_info(im_info, uv2, conv_func=conv_func, p_rad=p_rad, order=order)
@@ -1841,7 +2068,7 @@ def chisqdata_cphase_fft(Obsdata, Prior, fft_pad_factor=2,
 
     npad = int(fft_pad_factor * np.max((Prior.xdim, Prior.ydim)))
 
-    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse)
+    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse, conv_func=conv_func, p_rad=p_rad)
 
     gs_info1 = make_gridder_and_sampler_info(im_info, uv1, conv_func=conv_func, p_rad=p_rad, order=order)
     gs_info2 = make_gridder_and_sampler_info(im_info, uv2, conv_func=conv_func, p_rad=p_rad, order=order)
@@ -1867,7 +2094,7 @@ def chisqdata_camp_fft(Obsdata, Prior, fft_pad_factor=2,
     sigma = clamparr['sigmaca'][mask]
     npad = int(fft_pad_factor * np.max((Prior.xdim, Prior.ydim)))
 
-    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse)
+    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse, conv_func=conv_func, p_rad=p_rad)
 
     gs_info1 = make_gridder_and_sampler_info(im_info, uv1, conv_func=conv_func, p_rad=p_rad, order=order)
     gs_info2 = make_gridder_and_sampler_info(im_info, uv2, conv_func=conv_func, p_rad=p_rad, order=order)
@@ -1894,7 +2121,7 @@ def chisqdata_logcamp_fft(Obsdata, Prior, fft_pad_factor=2,
     sigma = clamparr['sigmaca'][mask]
     npad = int(fft_pad_factor * np.max((Prior.xdim, Prior.ydim)))
 
-    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse)
+    im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse, conv_func=conv_func, p_rad=p_rad)
 
     gs_info1 = make_gridder_and_sampler_info(im_info, uv1, conv_func=conv_func, p_rad=p_rad, order=order)
     gs_info2 = make_gridder_and_sampler_info(im_info, uv2, conv_func=conv_func, p_rad=p_rad, order=order)
@@ -2054,6 +2281,111 @@ def chisqdata_logcamp_nfft(Obsdata, Prior, debias=True,snrcut=0,
 
     return (clamp, sigma, A)
 
+##################################################################################################
+# Shared Visibility Chi^2 Data functions
+##################################################################################################
+def chisqdata_uv(Obsdata, dtype, debias=True, snrcut=0, systematic_noise=0.0):
+    """Return the data, sigmas, and the list of uv point arrays entering each data product
+    """
+
+    if dtype == 'vis':
+        data_arr = Obsdata.unpack(['u','v','vis','amp','sigma'])
+        data = data_arr['vis']
+        sigma = np.linalg.norm([data_arr['sigma'], systematic_noise*data_arr['amp']],axis=0)
+        uvlist = [np.hstack((data_arr['u'].reshape(-1,1), data_arr['v'].reshape(-1,1)))]
+
+    elif dtype == 'amp':
+        data_arr = Obsdata.unpack(['u','v','amp','sigma'], debias=debias)
+        data = data_arr['amp']
+        sigma = np.linalg.norm([data_arr['sigma'], systematic_noise*data_arr['amp']],axis=0)
+        uvlist = [np.hstack((data_arr['u'].reshape(-1,1), data_arr['v'].reshape(-1,1)))]
+
+    elif dtype == 'bs':
+        biarr = Obsdata.bispectra(mode="all", count="min")
+        data = biarr['bispec']
+        sigma = biarr['sigmab']
+        uvlist = [np.hstack((biarr['u%i'%i].reshape(-1,1), biarr['v%i'%i].reshape(-1,1))) for i in (1,2,3)]
+
+    elif dtype == 'cphase':
+        clphasearr = Obsdata.c_phases(mode="all", count="min")
+        data = clphasearr['cphase']
+        sigma = clphasearr['sigmacp']
+        uvlist = [np.hstack((clphasearr['u%i'%i].reshape(-1,1), clphasearr['v%i'%i].reshape(-1,1))) for i in (1,2,3)]
+
+    elif dtype in ['camp', 'logcamp']:
+        clamparr = Obsdata.c_amplitudes(mode='all', count='min', ctype=dtype, debias=debias)
+        snrmask = np.abs(clamparr['camp']/clamparr['sigmaca']) > snrcut
+        data = clamparr['camp'][snrmask]
+        sigma = clamparr['sigmaca'][snrmask]
+        uvlist = [np.hstack((clamparr['u%i'%i].reshape(-1,1), clamparr['v%i'%i].reshape(-1,1)))[snrmask] for i in (1,2,3,4)]
+
+    else:
+        raise Exception("Invalid data term: valid data terms are: " + ' '.join(DATATERMS))
+
+    return (data, sigma, uvlist)
+
+def unique_uv_index(uvlist):
+    """Find the unique uv points in a list of uv arrays, identifying conjugate points.
+       Returns the unique points in the u>0 half plane and,
+       for every input array, a tuple of (index, conj) arrays into them
+    """
+
+    lens = [len(uv) for uv in uvlist]
+    uvall = np.vstack(uvlist)
+
+    # points in the lower half plane are sampled as the conjugate of their reflection
+    conj = (uvall[:,0] < 0) + ((uvall[:,0] == 0) * (uvall[:,1] < 0))
+    uvall = np.where(conj[:,None], -uvall, uvall)
+
+    (uv_unique, index) = np.unique(uvall, axis=0, return_inverse=True)
+    index = index.reshape(-1)
+
+    bounds = np.cumsum([0] + lens)
+    vis_index = [(index[bounds[i]:bounds[i+1]], conj[bounds[i]:bounds[i+1]]) for i in range(len(lens))]
+
+    return (uv_unique, vis_index)
+
+def chisqdata_shared(Obsdata, Prior, mask, dtypes, ttype='direct', debias=True, snrcut=0,
+                     fft_pad_factor=2, conv_func=GRIDDER_CONV_FUNC_DEFAULT, p_rad=GRIDDER_P_RAD_DEFAULT,
+                     order=FFT_INTERP_DEFAULT, systematic_noise=0.0):
+    """Return the data, sigmas, and visibility index maps for each data term in dtypes,
+       and a single fourier transform structure for all the unique uv points they use
+    """
+
+    if ttype not in ['fast','direct','nfft']:
+        raise Exception("Possible ttype values are 'fast', 'direct','nfft'!")
+
+    data_tuples = {}
+    uvlist = []
+    for dtype in dtypes:
+        (data, sigma, uvs) = chisqdata_uv(Obsdata, dtype, debias=debias, snrcut=snrcut,
+                                           systematic_noise=systematic_noise)
+        data_tuples[dtype] = (data, sigma, len(uvs))
+        uvlist += uvs
+
+    (uv, vis_index) = unique_uv_index(uvlist)
+
+    # split the index maps back up by data term
+    k = 0
+    for dtype in dtypes:
+        (data, sigma, nuv) = data_tuples[dtype]
+        data_tuples[dtype] = (data, sigma, vis_index[k:k+nuv])
+        k += nuv
+
+    npad = int(fft_pad_factor * np.max((Prior.xdim, Prior.ydim)))
+    if ttype == 'direct':
+        A = ftoperator(Prior.psize, Prior.xdim, Prior.ydim, uv, pulse=Prior.pulse, mask=mask)
+    elif ttype == 'fast':
+        im_info = ImInfo(Prior.xdim, Prior.ydim, npad, Prior.psize, Prior.pulse, conv_func=conv_func, p_rad=p_rad)
+        gs_info = make_gridder_and_sampler_info(im_info, uv, conv_func=conv_func, p_rad=p_rad, order=order)
+        A = (im_info, [gs_info[0]], [gs_info[1]])
+    elif ttype == 'nfft':
+        if (Prior.xdim%2 or Prior.ydim%2):
+            raise Exception("NFFT doesn't work with odd image dimensions!")
+        A = [NFFTInfo(Prior.xdim, Prior.ydim, Prior.psize, Prior.pulse, npad, p_rad, uv)]
+
+    return (data_tuples, A)
+
 ##################################################################################################
 # FFT & NFFT helper functions
 ##################################################################################################
@@ -2077,17 +2409,18 @@ class NFFTInfo(object):
         self.plan = nfft_plan
 
         # compute phase and pulsefac
-        phases = np.exp(-1j*np.pi*(uv_scaled[:,0]+uv_scaled[:,1]))
-        pulses = np.array([pulse(2*np.pi*uv_scaled[i,0], 2*np.pi*uv_scaled[i,1], 1., dom="F") 
-                           for i in xrange(self.uvdim)])
-        self.pulsefac = (pulses*phases)
+        self.pulsefac = pulse_factors(uv, psize, pulse, xdim, ydim)
 
 class SamplerInfo(object):
-    def __init__(self, order, uv, pulsefac):
+    def __init__(self, order, uv, pulsefac, gridmatrix):
         self.order = int(order)
         self.uv = uv
         self.pulsefac = pulsefac
 
+        # the (npad*npad, nvis) gridding operator; its transpose samples the grid,
+        # so sampler() is the exact adjoint of gridder()
+        self.gridmatrix = gridmatrix
+
 class GridderInfo(object):
     def __init__(self, npad, func, p_rad, coords, weights):
         self.npad = int(npad)
@@ -2096,13 +2429,27 @@ class GridderInfo(object):
         self.coords = coords
         self.weights = weights
 
+        # sparse (npad*npad, nvis) gridding operator
+        # grid indices wrap around the array edges, as in the original np.add.at indexing
+        nvis = len(coords)
+        offsets = np.arange(-self.p_rad, self.p_rad+1)
+        rows = (coords[:,0].reshape(-1,1,1) + offsets.reshape(1,-1,1)) % self.npad
+        cols = (coords[:,1].reshape(-1,1,1) + offsets.reshape(1,1,-1)) % self.npad
+        gridinds = (rows*self.npad + cols).reshape(-1)
+        visinds = np.repeat(np.arange(nvis), len(offsets)**2)
+        gridweights = np.array(weights).transpose((2,0,1)).reshape(-1)
+
+        self.gridmatrix = sparse.csr_matrix((gridweights, (gridinds, visinds)), shape=(self.npad*self.npad, nvis))
+
 class ImInfo(object):
-    def __init__(self, xdim, ydim, npad, psize, pulse):
+    def __init__(self, xdim, ydim, npad, psize, pulse, conv_func=GRIDDER_CONV_FUNC_DEFAULT, p_rad=GRIDDER_P_RAD_DEFAULT):
         self.xdim = int(xdim)
         self.ydim = int(ydim)
         self.npad = int(npad)
         self.psize = psize
         self.pulse = pulse
+        self.conv_func = conv_func
+        self.p_rad = int(p_rad)
 
         padvalx1 = padvalx2 = int(np.floor((npad - xdim)/2.0))
         if xdim % 2:
@@ -2116,32 +2463,82 @@ class ImInfo(object):
         self.padvaly1 = padvaly1
         self.padvaly2 = padvaly2
 
+        # image-plane response of the gridding kernel, divided out of the image before the FFT
+        # and out of the adjoint after the inverse FFT
+        self.gridcorr = gridder_correction(self)
+
 def conv_func_pill(x,y):
-    if abs(x) < 0.5 and abs(y) < 0.5:
-        out = 1.
-    else:
-        out = 0.
-    return out
+    return conv_func_pill_1d(x) * conv_func_pill_1d(y)
+
+def conv_func_pill_1d(x):
+    return np.where(np.abs(x) < 0.5, 1., 0.)
 
 def conv_func_gauss(x,y):
     return np.exp(-(x**2 + y**2))
 
+def conv_func_gauss_1d(x):
+    return np.exp(-x**2)
+
 def conv_func_cubicspline(x,y):
-    if abs(x) <= 1:
-        fx = 1.5*abs(x)**3 - 2.5*abs(x)**2 + 1
-    elif abs(x) < 2:
-        fx = -0.5*abs(x)**3 + 2.5*abs(x)**2 -4*abs(x) + 2
-    else: 
-        fx = 0
-
-    if abs(y) <= 1:
-        fy = 1.5*abs(y)**3 - 2.5*abs(y)**2 + 1
-    elif abs(y) < 2:
-        fy = -0.5*abs(y)**3 + 2.5*abs(y)**2 - 4*abs(y) + 2
-    else: 
-        fy = 0
-
-    return fx*fy
+    return conv_func_cubicspline_1d(x) * conv_func_cubicspline_1d(y)
+
+def conv_func_cubicspline_1d(x):
+    ax = np.abs(x)
+    return np.where(ax <= 1, 1.5*ax**3 - 2.5*ax**2 + 1,
+                    np.where(ax < 2, -0.5*ax**3 + 2.5*ax**2 - 4*ax + 2, 0.))
+
+def conv_func_1d(conv_func, x, p_rad, oversamp):
+    """Evaluate the 1-D gridding kernel conv_func at pixel offsets x, for a grid oversampled by oversamp
+    """
+    if conv_func == 'gaussian':
+        return conv_func_gauss_1d(x)
+    elif conv_func == 'pillbox':
+        return conv_func_pill_1d(x)
+    elif conv_func == 'cubic':
+        return conv_func_cubicspline_1d(x)
+    elif conv_func == 'kaiserbessel':
+        width = 2*p_rad + 1
+        return conv_func_kaiserbessel_1d(x, width, kaiserbessel_beta(width, oversamp))
+    else:
+        raise Exception("conv_func must be either 'pillbox', 'gaussian', 'cubic', or 'kaiserbessel'")
+
+def gridder_correction(im_info, nsub=GRIDDER_CORR_NSUB):
+    """Return the flattened image-plane response of the normalized gridding kernel of im_info,
+       averaged over nsub sub-pixel offsets of the uv points from the grid
+    """
+
+    npad = im_info.npad
+    p_rad = im_info.p_rad
+    oversamp = float(npad)/np.max((im_info.xdim, im_info.ydim))
+
+    # kernel weights at the 2*p_rad+1 grid offsets of a point at each sub-pixel offset
+    dsub = (np.arange(nsub) + 0.5)/nsub - 0.5
+    k = np.arange(-p_rad, p_rad+1).reshape(1,-1) - dsub.reshape(-1,1)
+    w = conv_func_1d(im_info.conv_func, k, p_rad, oversamp)
+    w = w / np.sum(w, axis=1).reshape(-1,1)
+
+    # the kernel is symmetric, so its transform at the padded pixel offsets from the phase center is real
+    x = np.arange(npad) - npad//2
+    corr = np.mean(np.dot(w.reshape(nsub, 1, -1) * np.cos(2*np.pi*k.reshape(nsub, 1, -1)*x.reshape(1,-1,1)/npad),
+                          np.ones(2*p_rad+1)), axis=0)
+
+    corry = corr[im_info.padvalx1:npad-im_info.padvalx2]
+    corrx = corr[im_info.padvaly1:npad-im_info.padvaly2]
+    return np.outer(corry, corrx).reshape(-1)
+
+def conv_func_kaiserbessel(x, y, width, beta):
+    return conv_func_kaiserbessel_1d(x, width, beta) * conv_func_kaiserbessel_1d(y, width, beta)
+
+def conv_func_kaiserbessel_1d(x, width, beta):
+    """Kaiser-Bessel approximation to the prolate spheroidal kernel with full support width in pixels
+    """
+    arg = 1. - (2.*x/width)**2
+    return np.where(arg >= 0, scipy.special.i0(beta*np.sqrt(np.abs(arg))), 0.)
+
+def kaiserbessel_beta(width, oversamp):
+    """Kaiser-Bessel shape parameter for a kernel width and grid oversampling factor (Beatty et al. 2005)
+    """
+    return np.pi*np.sqrt(np.max(((width/oversamp)**2 * (oversamp - 0.5)**2 - 0.8, 0.)))
 
 ##There's a bug in scipy spheroidal function of order 0! - gives nans for eta<1
 #def conv_func_spheroidal(x,y,p,m):
@@ -2165,7 +2562,8 @@ def fft_imvec(imvec, im_info):
     padvaly1 = im_info.padvaly1
     padvaly2 = im_info.padvaly2
 
-    imarr = imvec.reshape(ydim, xdim)
+    # divide out the image-plane response of the gridding kernel that sampler() convolves with
+    imarr = (imvec / im_info.gridcorr).reshape(ydim, xdim)
     imarr = np.pad(imarr, ((padvalx1,padvalx2),(padvaly1,padvaly2)), 'constant', constant_values=0.0)
     npad = imarr.shape[0]
     if imarr.shape[0]!=imarr.shape[1]:
@@ -2181,24 +2579,17 @@ def sampler(griddata, sampler_info_list, sample_type="vis"):
     Samples griddata (e.g. the FFT of an image) at uv points 
     the griddata should already be rotated so u,v = 0,0 is in the center
     sampler_info_list is an appropriately ordered list of 4 sampler_info objects
-    order is the order of the spline interpolation
+    the grid is sampled with the transpose of the gridding operator, the exact adjoint of gridder()
     """
     if sample_type not in ["vis","bs","camp"]:
         raise Exception("sampler sample_type should be either 'vis','bs',or 'camp'!")
     if griddata.shape[0] != griddata.shape[1]:
         raise Exception("griddata should be a square array!")
 
+    gridvec = griddata.reshape(-1)
     dataset = []
     for sampler_info in sampler_info_list:
-
-        vu2 = sampler_info.uv
-        pulsefac = sampler_info.pulsefac
-
-        datare = nd.map_coordinates(np.real(griddata), vu2, order=sampler_info.order)
-        dataim = nd.map_coordinates(np.imag(griddata), vu2, order=sampler_info.order)
-
-        data = datare + 1j*dataim
-        data = data * pulsefac
+        data = sampler_info.gridmatrix.T.dot(gridvec) * sampler_info.pulsefac
 
         dataset.append(data)
  
@@ -2221,7 +2612,7 @@ def gridder(data_list, gridder_info_list):
                          "is not equal to length of gridder_info_list!")
 
     npad = gridder_info_list[0].npad
-    datagrid = np.zeros((npad, npad)).astype('c16')
+    datagrid = np.zeros(npad*npad).astype('c16')
 
     for k in range(len(gridder_info_list)):
         gridder_info = gridder_info_list[k]
@@ -2230,30 +2621,24 @@ def gridder(data_list, gridder_info_list):
         if gridder_info.npad != npad:
             raise Exception("npad values not consistent in gridder_info_list!")
 
-        p_rad = gridder_info.p_rad
-        coords = gridder_info.coords
-        weights = gridder_info.weights
-        
-        p_rad = int(p_rad)
-        for i in range(2*p_rad+1):
-            dy = i - p_rad
-            for j in range(2*p_rad+1):
-                dx = j - p_rad
-                weight = weights[i][j]
-                np.add.at(datagrid, tuple(map(tuple, (coords + [dy, dx]).transpose())), data*weight)
-    
-    return datagrid
+        datagrid += gridder_info.gridmatrix.dot(data)
+
+    return datagrid.reshape(npad, npad)
 
 def make_gridder_and_sampler_info(im_info, uv, conv_func=GRIDDER_CONV_FUNC_DEFAULT, p_rad=GRIDDER_P_RAD_DEFAULT, order=FFT_INTERP_DEFAULT):
     """
     Prep norms and weights for gridding data sampled at uv points on a square array
     im_info tuple contains (xdim, ydim, npad, psize, pulse) of the grid
-    conv_func is the convolution function: current options are "pillbox", "gaussian"
+    conv_func is the convolution function: current options are "pillbox", "gaussian", "cubic", "kaiserbessel"
     p_rad is the pixel radius inside wich the conv_func is nonzero
+    both must match the kernel of im_info, whose gridding correction is applied around the FFT
+    order is kept for compatibility; the sampler uses the transposed gridding operator
     """
 
-    if not (conv_func in ['pillbox','gaussian','cubic']):
-        raise Exception("conv_func must be either 'pillbox', 'gaussian', or, 'cubic'")
+    if not (conv_func in ['pillbox','gaussian','cubic','kaiserbessel']):
+        raise Exception("conv_func must be either 'pillbox', 'gaussian', 'cubic', or 'kaiserbessel'")
+    if conv_func != im_info.conv_func or int(p_rad) != im_info.p_rad:
+        raise Exception("conv_func and p_rad must match the gridding kernel of im_info!")
 
     xdim = im_info.xdim
     ydim = im_info.ydim
@@ -2270,52 +2655,24 @@ def make_gridder_and_sampler_info(im_info, uv, conv_func=GRIDDER_CONV_FUNC_DEFAU
     dcoords = vu2 - np.round(vu2).astype(int)
     vu2  = vu2.T
 
-    # TODO: phase rotations should be done separately for x and y if the image isn't square
-    # e.g., 
-    phase = np.exp(-1j*np.pi*psize*((1+im_info.xdim%2)*uv[:,0] + (1+im_info.ydim%2)*uv[:,1])) 
-##   Andrew prefers the less elegant:
-#    if im_info.xdim%2: 
-#        phase *= np.exp(-1j*np.pi*psize*uv[:,0])
-#    if im_info.ydim%2: 
-#        phase *= np.exp(-1j*np.pi*psize*uv[:,1])
+    # pulse function times the phase rotation to the image centroid
+    pulsefac = pulse_factors(uv, psize, pulse, im_info.xdim, im_info.ydim)
 
-    pulsefac = np.array([pulse(2*np.pi*uvpt[0], 2*np.pi*uvpt[1], psize, dom="F") for uvpt in uv])
-    pulsefac = pulsefac * phase
-
-    #compute gridder norm
-    weights = []
-    norm = np.zeros_like(len(coords))
-    for i in range(2*p_rad+1):
-        weights.append([])
-        dy = i - p_rad
-        for j in range(2*p_rad+1):
-            dx = j - p_rad
-            if conv_func == 'gaussian':
-                norm = norm + conv_func_gauss(dy - dcoords[:,0], dx - dcoords[:,1]) 
-            elif conv_func == 'pillbox':
-                norm = norm + conv_func_pill(dy - dcoords[:,0], dx - dcoords[:,1])
-            elif conv_func == 'cubic':
-                norm = norm + conv_func_cubicspline(dy - dcoords[:,0], dx - dcoords[:,1])
-
-            weights[i].append(None)
-
-    #compute weights for gridding
-    for i in range(2*p_rad+1):
-        dy = i - p_rad
-        for j in range(2*p_rad+1):
-            dx = j - p_rad
-            if conv_func == 'gaussian':
-                weight = conv_func_gauss(dy - dcoords[:,0], dx - dcoords[:,1])/norm
-            elif conv_func == 'pillbox':
-                weight = conv_func_pill(dy - dcoords[:,0], dx - dcoords[:,1])/norm
-            elif conv_func == 'cubic':
-                weight = conv_func_cubicspline(dy - dcoords[:,0], dx - dcoords[:,1])/norm
+    #evaluate the separable kernel at all pixel offsets for all points at once
+    offsets = np.arange(-p_rad, p_rad+1)
+    ky = offsets.reshape(1,-1) - dcoords[:,0].reshape(-1,1)
+    kx = offsets.reshape(1,-1) - dcoords[:,1].reshape(-1,1)
+    oversamp = float(npad)/np.max((xdim, ydim))
+    wy = conv_func_1d(conv_func, ky, p_rad, oversamp)
+    wx = conv_func_1d(conv_func, kx, p_rad, oversamp)
 
-            weights[i][j] = weight
+    #compute gridder norm and weights for gridding, indexed as weights[i][j][k] for offsets (dy, dx) and point k
+    norm = np.sum(wy, axis=1) * np.sum(wx, axis=1)
+    weights = (wy.T.reshape(2*p_rad+1, 1, -1) * wx.T.reshape(1, 2*p_rad+1, -1)) / norm
 
     #output the coordinates, norms, and weights
-    sampler_info = SamplerInfo(order, vu2, pulsefac)
     gridder_info = GridderInfo(npad, conv_func, p_rad, coords, weights)
+    sampler_info = SamplerInfo(order, vu2, pulsefac, gridder_info.gridmatrix)
     return (sampler_info, gridder_info)
 
 
@@ -2394,8 +2751,7 @@ def sampler_old(griddata, im_info, uvset, sample_type="vis", order=3):
         data = data * phase
 
         # Multiply by the pulse function
-        # TODO make faster?
-        pulsefac = np.array([pulse(2*np.pi*uvpt[0], 2*np.pi*uvpt[1], psize, dom="F") for uvpt in uv])
+        pulsefac = pulse(2*np.pi*uv[:,0], 2*np.pi*uv[:,1], psize, dom="F")
         data = data * pulsefac
 
         dataset.append(data)
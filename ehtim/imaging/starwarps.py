@@ -1350,7 +1350,7 @@ def genPhaseShiftMtx(ulist, vlist, init_x, init_y, flowbasis_x, flowbasis_y, the
 
     uvlist = np.transpose(np.squeeze(np.array([ulist, vlist])))
     uvlist = np.reshape(uvlist, (vlist.shape[0], 2))
-    pulseVec = [pulse(2*np.pi*uv[0], 2*np.pi*uv[1], pdim, dom="F") for uv in uvlist ]
+    pulseVec = pulse(2*np.pi*uvlist[:,0], 2*np.pi*uvlist[:,1], pdim, dom="F") * np.ones(len(uvlist))
     
     shiftMtx = np.dot( np.diag(pulseVec) , np.reshape( np.squeeze(shiftMtx_x * shiftMtx_y), (vlist.shape[0], npixels)  ) )
     return shiftMtx
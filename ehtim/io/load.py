@@ -42,6 +42,8 @@ import ehtim.io.oifits
 from ehtim.const_def import *
 from ehtim.observing.obs_helpers import *
 
+UVFITS_CHUNKSIZE = 65536 # number of visibility records reduced at once when loading uvfits files
+
 ##################################################################################################
 # Vex IO
 ##################################################################################################
@@ -615,13 +617,14 @@ def load_obs_maps(arrfile, obsspec, ifile, qfile=0, ufile=0, vfile=0, src=SOURCE
 
 
 #TODO can we save new telescope array terms and flags to uvfits and load them?
-def load_obs_uvfits(filename, flipbl=False, force_singlepol=None, channel=all, IF=all):
+def load_obs_uvfits(filename, flipbl=False, force_singlepol=None, channel=all, IF=all, chunksize=UVFITS_CHUNKSIZE):
     """Load uvfits data from a uvfits file.
        To read a single polarization (e.g., only RR) from a full polarization file, set force_singlepol='R' or 'L'
+       The data are memory mapped and averaged over channels and IFs chunksize records at a time
     """
 
     # Load the uvfits file
-    hdulist = fits.open(filename)
+    hdulist = fits.open(filename, memmap=True)
     header = hdulist[0].header
     data = hdulist[0].data
 
@@ -717,45 +720,59 @@ def load_obs_uvfits(filename, flipbl=False, force_singlepol=None, channel=all, I
         raise Exception('The specified IF does not exist')  
         
 
+    # Average the visibilities and weights over the selected channels and IFs, one chunk of records at a time
+    # the correlation products are in the order rr, ll, rl, lr
     #TODO CHECK THESE DECISIONS CAREFULLY!!!!
-    rrweight = data['DATA'][:,0,0,IF,channel,0,2].reshape(nvis, nifs, nchannels)
-    if num_corr >= 2: 
-        llweight = data['DATA'][:,0,0,IF,channel,1,2].reshape(nvis, nifs, nchannels)
-    else:
-        llweight = rrweight * 0.0
-    if num_corr >= 3: 
-        rlweight = data['DATA'][:,0,0,IF,channel,2,2].reshape(nvis, nifs, nchannels)
-    else:
-        rlweight = rrweight * 0.0
-    if num_corr >= 4: 
-        lrweight = data['DATA'][:,0,0,IF,channel,3,2].reshape(nvis, nifs, nchannels)
-    else:
-        lrweight = rrweight * 0.0
-
-    # If necessary, enforce single polarization
+    corrs = ['rr', 'll', 'rl', 'lr']
     if force_singlepol == 'L':
-        rrweight = rrweight * 0.0
-        rlweight = rlweight * 0.0
-        lrweight = lrweight * 0.0
+        corr_used = [False, True, False, False]
     elif force_singlepol == 'R':
-        llweight = llweight * 0.0
-        rlweight = rlweight * 0.0
-        lrweight = lrweight * 0.0
-        
-    #TODO less than or equal to?
-    rrmask_2d = (rrweight > 0.)
-    llmask_2d = (llweight > 0.)
-    rlmask_2d = (rlweight > 0.)
-    lrmask_2d = (lrweight > 0.)
-
-    # if there is any unmasked data in the frequency column, use it
-    rrmask = np.any(np.any(rrmask_2d, axis=2), axis=1)
-    llmask = np.any(np.any(llmask_2d, axis=2), axis=1)
-    rlmask = np.any(np.any(rlmask_2d, axis=2), axis=1)
-    lrmask = np.any(np.any(rlmask_2d, axis=2), axis=1)
+        corr_used = [True, False, False, False]
+    else:
+        corr_used = [True, True, True, True]
+
+    corrvis = {corr: np.zeros(nvis, dtype='c16') for corr in corrs}
+    corrsig = {corr: np.zeros(nvis) for corr in corrs}
+    corrmask = {corr: np.zeros(nvis, dtype=bool) for corr in corrs}
+
+    for k0 in range(0, nvis, chunksize):
+        k1 = min(k0 + chunksize, nvis)
+        chunk = data['DATA'][k0:k1,0,0][:,IF][:,:,channel]
+
+        for (icorr, corr) in enumerate(corrs):
+            if icorr >= num_corr or not corr_used[icorr]:
+                continue
+
+            #TODO less than or equal to?
+            weight = chunk[:,:,:,icorr,2]
+            mask_2d = (weight > 0.)
+
+            # average over channels, then over the IFs with any unmasked data
+            nchan_if = np.sum(mask_2d, axis=2)
+            vis_if = np.sum(np.where(mask_2d, chunk[:,:,:,icorr,0] + 1j*chunk[:,:,:,icorr,1], 0.), axis=2)
+            nif = np.sum(nchan_if > 0, axis=1)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                vis = np.sum(np.where(nchan_if > 0, vis_if/nchan_if, 0.), axis=1) / nif
+
+                # variances are mean / N , or sum / N^2
+                nsig = np.sum(nchan_if, axis=1)
+                sig = np.sqrt(np.sum(np.where(mask_2d, 1./weight, 0.), axis=(1,2))) / nsig
+
+            corrmask[corr][k0:k1] = (nsig > 0)
+            corrvis[corr][k0:k1] = vis
+            corrsig[corr][k0:k1] = sig
+
+    # Masked correlation products are nan so they don't mess up the Stokes parameters
+    for corr in corrs:
+        corrvis[corr][~corrmask[corr]] = np.nan
+        corrsig[corr][~corrmask[corr]] = np.nan
 
     # Total intensity mask
     # TODO or or and here? - what if we have only 1 of rr, ll?
+    rrmask = corrmask['rr']
+    llmask = corrmask['ll']
+    rlmask = corrmask['rl']
+    lrmask = corrmask['lr']
     mask = rrmask + llmask
 
     if not np.any(mask):
@@ -789,15 +806,14 @@ def load_obs_uvfits(filename, flipbl=False, force_singlepol=None, channel=all, I
     try:
         tints = data['INTTIM'][mask]
     except KeyError:
-        tints = np.zeros(len(mask))
+        tints = np.zeros(len(times))
     # Sites - add names
     t1 = data['BASELINE'][mask].astype(int)//256
     t2 = data['BASELINE'][mask].astype(int) - t1*256
     t1 = t1 - 1
     t2 = t2 - 1
-    scopes_num = np.sort(list(set(np.hstack((t1,t2)))))
-    t1 = np.array([tarr[i]['site'] for i in t1])
-    t2 = np.array([tarr[i]['site'] for i in t2])
+    t1 = tarr['site'][t1]
+    t2 = tarr['site'][t2]
 
     # Opacities (not in standard files)
     try:
@@ -821,82 +837,15 @@ def load_obs_uvfits(filename, flipbl=False, force_singlepol=None, channel=all, I
             except KeyError:
                 raise Exception("Cant figure out column label for UV coords")
 
-    # Get and average visibility data
-    # replace masked vis with nans so they don't mess up the average
-    #TODO: coherent average ok?
-    #TODO 2d or 1d mask
-    rr_2d = data['DATA'][:,0,0,IF,channel,0,0] + 1j*data['DATA'][:,0,0,IF,channel,0,1]
-    rr_2d = rr_2d.reshape(nvis, nifs, nchannels)
-    if num_corr >= 2: 
-        ll_2d = data['DATA'][:,0,0,IF,channel,1,0] + 1j*data['DATA'][:,0,0,IF,channel,1,1]
-        ll_2d = ll_2d.reshape(nvis, nifs, nchannels)
-    else:
-        ll_2d = rr_2d*0.0
-    if num_corr >= 3: 
-        rl_2d = data['DATA'][:,0,0,IF,channel,2,0] + 1j*data['DATA'][:,0,0,IF,channel,2,1]
-        rl_2d = rl_2d.reshape(nvis, nifs, nchannels)
-    else:
-        rl_2d = rr_2d*0.0
-    if num_corr >= 4: 
-        lr_2d = data['DATA'][:,0,0,IF,channel,3,0] + 1j*data['DATA'][:,0,0,IF,channel,3,1]
-        lr_2d = lr_2d.reshape(nvis, nifs, nchannels)
-    else:
-        lr_2d = rr_2d*0.0
-
-    rr_2d[~rrmask_2d] = np.nan
-    ll_2d[~llmask_2d] = np.nan
-    rl_2d[~rlmask_2d] = np.nan
-    lr_2d[~lrmask_2d] = np.nan
-
-    rr = np.nanmean(np.nanmean(rr_2d, axis=2), axis=1)[mask]
-    ll = np.nanmean(np.nanmean(ll_2d, axis=2), axis=1)[mask]
-    rl = np.nanmean(np.nanmean(rl_2d, axis=2), axis=1)[mask]
-    lr = np.nanmean(np.nanmean(lr_2d, axis=2), axis=1)[mask]
-
-    #rr = np.mean(data['DATA'][:,0,0,0,:,0,0][mask] + 1j*data['DATA'][:,0,0,0,:,0,1][mask], axis=1)
-    #ll = np.mean(data['DATA'][:,0,0,0,:,1,0][mask] + 1j*data['DATA'][:,0,0,0,:,1,1][mask], axis=1)
-    #rl = np.mean(data['DATA'][:,0,0,0,:,2,0][mask] + 1j*data['DATA'][:,0,0,0,:,2,1][mask], axis=1)
-    #lr = np.mean(data['DATA'][:,0,0,0,:,3,0][mask] + 1j*data['DATA'][:,0,0,0,:,3,1][mask], axis=1)
-
-    # average weights
-    # variances are mean / N , or sum / N^2
-    # replace masked weights with nans so they don't mess up the average
-    rrweight[~rrmask_2d] = np.nan
-    llweight[~llmask_2d] = np.nan
-    rlweight[~rlmask_2d] = np.nan
-    lrweight[~lrmask_2d] = np.nan
-
-    nsig_rr = np.sum(np.sum(rrmask_2d, axis=2), axis=1).astype(float)
-    nsig_rr[~rrmask] = np.nan
-    rrsig = np.sqrt(np.nansum(np.nansum(1./rrweight, axis=2), axis=1)) / nsig_rr
-    rrsig = rrsig[mask]
-
-    nsig_ll = np.sum(np.sum(llmask_2d, axis=2), axis=1).astype(float)
-    nsig_ll[~llmask] = np.nan
-    llsig = np.sqrt(np.nansum(np.nansum(1./llweight, axis=2), axis=1)) / nsig_ll
-    llsig = llsig[mask]
-
-    nsig_rl = np.sum(np.sum(rlmask_2d, axis=2), axis=1).astype(float)
-    nsig_rl[~rlmask] = np.nan
-    rlsig = np.sqrt(np.nansum(np.nansum(1./rlweight, axis=2), axis=1)) / nsig_rl
-    rlsig = rlsig[mask]
-
-    nsig_lr = np.sum(np.sum(lrmask_2d, axis=2), axis=1).astype(float)
-    nsig_lr[~lrmask] = np.nan
-    lrsig = np.sqrt(np.nansum(np.nansum(1./lrweight, axis=2), axis=1)) / nsig_lr
-    lrsig = lrsig[mask]
-
-    # make sigmas from weights
-    # zero out weights with zero error
-    #rrweight[rrweight==0] = EP
-    #llweight[llweight==0] = EP
-    #rlweight[rlweight==0] = EP
-    #lrweight[lrweight==0] = EP
-
-    #rrsig = np.sqrt(rrweight)
-    #llsig = 1/np.sqrt(llweight)
-    #rlsig = 1/np.sqrt(rlweight)
-    #lrsig = 1/np.sqrt(lrweight)
+    rr = corrvis['rr'][mask]
+    ll = corrvis['ll'][mask]
+    rl = corrvis['rl'][mask]
+    lr = corrvis['lr'][mask]
+
+    rrsig = corrsig['rr'][mask]
+    llsig = corrsig['ll'][mask]
+    rlsig = corrsig['rl'][mask]
+    lrsig = corrsig['lr'][mask]
 
     # Form stokes parameters from data
     # look at these mask choices!!
@@ -942,19 +891,23 @@ def load_obs_uvfits(filename, flipbl=False, force_singlepol=None, channel=all, I
         v = -v
 
     # Make a datatable
-    datatable = []
-    for i in range(len(times)):
-        datatable.append(np.array
-                         ((
-                           times[i], tints[i],
-                           t1[i], t2[i], tau1[i], tau2[i],
-                           u[i], v[i],
-                           ivis[i], qvis[i], uvis[i], vvis[i],
-                           isigma[i], qsigma[i], usigma[i], vsigma[i]
-                           ), dtype=DTPOL
-                         ))
-
-    datatable = np.array(datatable)
+    datatable = np.empty(len(times), dtype=DTPOL)
+    datatable['time'] = times
+    datatable['tint'] = tints
+    datatable['t1'] = t1
+    datatable['t2'] = t2
+    datatable['tau1'] = tau1
+    datatable['tau2'] = tau2
+    datatable['u'] = u
+    datatable['v'] = v
+    datatable['vis'] = ivis
+    datatable['qvis'] = qvis
+    datatable['uvis'] = uvis
+    datatable['vvis'] = vvis
+    datatable['sigma'] = isigma
+    datatable['qsigma'] = qsigma
+    datatable['usigma'] = usigma
+    datatable['vsigma'] = vsigma
 
     #TODO get calibration flags from uvfits?
     return ehtim.obsdata.Obsdata(ra, dec, rf, bw, datatable, tarr, source=src, mjd=mjd, scantable=scantable)
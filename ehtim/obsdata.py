@@ -35,6 +35,7 @@ import ehtim.image
 import ehtim.io.save
 import ehtim.io.load
 import ehtim.observing.obs_simulate as simobs
+import ehtim.observing.obs_flagging as obs_flagging
 
 from ehtim.const_def import *
 from ehtim.observing.obs_helpers import *
@@ -73,7 +74,8 @@ class Obsdata(object):
     """
 
     def __init__(self, ra, dec, rf, bw, datatable, tarr, source=SOURCE_DEFAULT, mjd=MJD_DEFAULT, ampcal=True, phasecal=True,
-                                                      opacitycal=True, dcal=True, frcal=True, timetype='UTC', scantable=None):
+                                                      opacitycal=True, dcal=True, frcal=True, timetype='UTC', scantable=None,
+                                                      canonical=False):
 
         """A polarimetric VLBI observation of visibility amplitudes and phases (in Jy).
 
@@ -92,7 +94,7 @@ class Obsdata(object):
                frcal (bool): True if feed rotation calibrated out of visibilities
                dcal (bool): True if D terms calibrated out of visibilities
                timetype (str): How to interpret tstart and tstop; either 'GMST' or 'UTC'
-
+               canonical (bool): if True, trust that datatable is already sorted with one ordered entry per baseline and time
 
            Returns:
                obsdata (Obsdata): an Obsdata object
@@ -123,37 +125,37 @@ class Obsdata(object):
         # Dictionary of array indices for site names
         self.tkey = {self.tarr[i]['site']: i for i in range(len(self.tarr))}
 
-        # Time partition the datatable
-        datalist = []
-        for key, group in it.groupby(datatable, lambda x: x['time']):
-            datalist.append(np.array([obs for obs in group]))
-
-        # Remove conjugate baselines
-        obsdata = []
-        for tlist in datalist:
-            blpairs = []
-            for dat in tlist:
-                if not (set((dat['t1'], dat['t2']))) in blpairs:
-
-                     # Reverse the baseline in the right order for uvfits:
-                     if(self.tkey[dat['t1']] < self.tkey[dat['t2']]):
-                        (dat['t1'], dat['t2']) = (dat['t2'], dat['t1'])
-                        (dat['tau1'], dat['tau2']) = (dat['tau2'], dat['tau1'])
-                        dat['u'] = -dat['u']
-                        dat['v'] = -dat['v']
-                        dat['vis'] = np.conj(dat['vis'])
-                        dat['uvis'] = np.conj(dat['uvis'])
-                        dat['qvis'] = np.conj(dat['qvis'])
-                        dat['vvis'] = np.conj(dat['vvis'])
-
-                     # Append the data point
-                     blpairs.append(set((dat['t1'],dat['t2'])))
-                     obsdata.append(dat)
-
-        obsdata = np.array(obsdata, dtype=DTPOL)
-
-        # Sort the data by time
-        obsdata = obsdata[np.argsort(obsdata, order=['time','t1'])]
+        if canonical:
+            # The table is already in the order produced below, so just copy it
+            obsdata = np.array(datatable, dtype=DTPOL)
+        else:
+            # Station indices of every data point
+            (names, idx) = np.unique(np.hstack((datatable['t1'], datatable['t2'])), return_inverse=True)
+            idx = np.array([self.tkey[name] for name in names], dtype=int)[idx]
+            i1 = idx[:len(datatable)]
+            i2 = idx[len(datatable):]
+
+            # Remove repeated and conjugate baselines within each run of equal times,
+            # keeping the first occurrence
+            nsite = len(self.tarr)
+            run = np.hstack(([0], np.cumsum(datatable['time'][1:] != datatable['time'][:-1])))
+            blkey = (run*nsite + np.maximum(i1, i2))*nsite + np.minimum(i1, i2)
+            keep = np.sort(np.unique(blkey, return_index=True)[1])
+            obsdata = np.array(datatable[keep], dtype=DTPOL)
+
+            # Reverse the baselines in the right order for uvfits:
+            swap = (i1 < i2)[keep]
+            for (f1, f2) in (('t1', 't2'), ('tau1', 'tau2')):
+                tmp = obsdata[f1][swap]
+                obsdata[f1][swap] = obsdata[f2][swap]
+                obsdata[f2][swap] = tmp
+            for f in ('u', 'v'):
+                obsdata[f][swap] = -obsdata[f][swap]
+            for f in ('vis', 'qvis', 'uvis', 'vvis'):
+                obsdata[f][swap] = np.conj(obsdata[f][swap])
+
+            # Sort the data by time
+            obsdata = obsdata[np.argsort(obsdata, order=['time','t1'])]
 
         # Save the data
         self.data = obsdata
@@ -167,6 +169,32 @@ class Obsdata(object):
         if self.tstop < self.tstart:
             self.tstop += 24.0
 
+    @property
+    def data(self):
+        """The basic data table with datatype DTPOL.
+           Groupings of the table (tlist_idx, bllist_idx, ...) are cached; after editing the time or
+           site columns in place, reassign the table (obs.data = obs.data) to recompute them.
+        """
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        # assigning a new data table drops any groupings computed from the old one
+        self._data = data
+        self._cache = {}
+
+    def _index_cache(self):
+        """Return the cache of index groupings of the data table.
+           The cache is cleared by the data setter; as a cheap safeguard it is also keyed on the
+           identity, buffer and length of the table. In-place edits of its columns are not detected.
+        """
+
+        layout = (id(self._data), self._data.__array_interface__['data'][0], len(self._data))
+        if self._cache.get('layout') != layout:
+            self._cache = {'layout': layout}
+
+        return self._cache
+
     def copy(self):
 
         """Copy the observation object.
@@ -178,7 +206,7 @@ class Obsdata(object):
         """
         newobs = Obsdata(self.ra, self.dec, self.rf, self.bw, self.data, self.tarr, source=self.source, mjd=self.mjd,
                          ampcal=self.ampcal, phasecal=self.phasecal, opacitycal=self.opacitycal, dcal=self.dcal,
-                         frcal=self.frcal, timetype=self.timetype, scantable=self.scans)
+                         frcal=self.frcal, timetype=self.timetype, scantable=self.scans, canonical=True)
         return newobs
 
     def data_conj(self):
@@ -208,9 +236,73 @@ class Obsdata(object):
                 data[f] = np.hstack((self.data[f], self.data[f]))
 
         # Sort the data by time
-        data = data[np.argsort(data['time'])]
+        data = data[np.argsort(data['time'], kind='mergesort')]
         return data
 
+    def tlist_idx(self, conj=False):
+
+        """Group the data indices by observation time without copying the data.
+
+           Args:
+                conj (bool): True if the indices refer to the data table with conjugate baselines, data_conj()
+           Returns:
+                (list): a list of slices (or index arrays if the data are not time-sorted) into the data table
+        """
+
+        cache = self._index_cache()
+        key = ('tlist', bool(conj))
+        if key not in cache:
+            if conj:
+                times = np.hstack((self.data['time'], self.data['time']))
+            else:
+                times = self.data['time']
+            order = np.argsort(times, kind='mergesort')
+
+            # data_conj() sorts its table by time, so its groups are always contiguous
+            sortedtimes = times[order]
+            starts = np.unique(sortedtimes, return_index=True)[1]
+            stops = np.append(starts[1:], len(sortedtimes))
+            if conj or np.all(order == np.arange(len(order))):
+                idxlist = [slice(start, stop) for (start, stop) in zip(starts, stops)]
+            else:
+                idxlist = np.split(order, starts[1:])
+
+            cache[key] = idxlist
+
+        return cache[key]
+
+    def bllist_idx(self, conj=False):
+
+        """Group the data indices by baseline without copying the data.
+
+           Args:
+                conj (bool): True if the indices refer to the data table with conjugate baselines, data_conj()
+           Returns:
+                (list): a list of index arrays into the data table, time-ordered within each baseline
+        """
+
+        cache = self._index_cache()
+        key = ('bllist', bool(conj))
+        if key not in cache:
+            if conj:
+                data = self.data_conj()
+            else:
+                data = self.data
+
+            # label each baseline by its pair of site indices, sorted by t1 then t2
+            (sites, site_idx) = np.unique(np.hstack((data['t1'], data['t2'])), return_inverse=True)
+            i1 = site_idx[:len(data)]
+            i2 = site_idx[len(data):]
+            if conj:
+                (i1, i2) = (np.minimum(i1, i2), np.maximum(i1, i2))
+            blkey = i1*len(sites) + i2
+
+            order = np.argsort(blkey, kind='mergesort')
+            starts = np.unique(blkey[order], return_index=True)[1]
+            cache[key] = np.split(order, starts[1:])
+
+        return cache[key]
+
     def tlist(self, conj=False):
 
         """Group the data in a list of equal time observation datatables.
@@ -226,12 +318,7 @@ class Obsdata(object):
         else:
             data = self.data
 
-        # Use itertools groupby function to partition the data
-        datalist = []
-        for key, group in it.groupby(data, lambda x: x['time']):
-            datalist.append(np.array([obs for obs in group]))
-
-        return np.array(datalist)
+        return split_table(data, self.tlist_idx(conj=conj))
 
     def bllist(self,conj=False):
 
@@ -242,15 +329,13 @@ class Obsdata(object):
            Returns:
                 (list): a list of data tables (type DTPOL) containing baseline-partitioned data
         """
-        data = self.data
-        idx = np.lexsort((data['t2'], data['t1']))
-
-        datalist = []
-        for key, group in it.groupby(data[idx], lambda x: set((x['t1'], x['t2'])) ):
 
-            datalist.append(np.array([obs for obs in group]))
+        if conj:
+            data = self.data_conj()
+        else:
+            data = self.data
 
-        return np.array(datalist)
+        return split_table(data, self.bllist_idx(conj=conj))
 
     def unpack_bl(self, site1, site2, fields, ang_unit='deg', debias=False, timetype=False):
 
@@ -595,110 +680,91 @@ class Obsdata(object):
         obsout.data['v'] = vout
         return obsout
 
-    def avg_coherent(self, inttime):
+    def avg_coherent(self, inttime, scan_avg=False, incoherent=False):
 
         """Coherently average data along u,v tracks in chunks of length inttime (sec).
 
            Args:
                 inttime (float): coherent integration time in seconds
+                scan_avg (bool): if True, average over the scans in obs.scans instead of inttime chunks
+                incoherent (bool): if True, average the debiased visibility amplitudes and discard the phases
            Returns:
                 (Obsdata): Obsdata object containing averaged data
         """
 
-        alldata_list = ['vis', 'u', 'v',
-                        'sigma', 't1', 't2', 'tau1', 'tau2',
-                        'uvis', 'qvis', 'vvis', 'qsigma',
-                        'usigma', 'vsigma', 'tint', 'time']
-
-        timesplit = self.unpack(alldata_list, mode='time')
-
-        inttime_hr = inttime/3600.
-        datatable = []
-        timeregion =  []
-        time_current = timesplit[0]['time'][0]
-        tavg = 1
-
-        for t in range(0, len(timesplit)):
-            sys.stdout.write('\rAveraging Scans %i/%i in %f sec ints : Reduced Data %i/%i'
-                              % (t,len(timesplit),inttime, tavg,t)
-                            )
-            sys.stdout.flush()
-
-            # accumulate data in a time region
-            if (timesplit[t]['time'][0] - time_current < inttime_hr):
-
-                for i in range(0,len(timesplit[t]['time'])):
-                    timeregion.append(np.array
-                             ((
-                               timesplit[t]['time'][i],
-                               timesplit[t]['tint'][i],
-                               timesplit[t]['t1'][i],
-                               timesplit[t]['t2'][i],
-                               timesplit[t]['tau1'][i],
-                               timesplit[t]['tau2'][i],
-                               timesplit[t]['u'][i],
-                               timesplit[t]['v'][i],
-                               timesplit[t]['vis'][i],
-                               timesplit[t]['qvis'][i],
-                               timesplit[t]['uvis'][i],
-                               timesplit[t]['vvis'][i],
-                               timesplit[t]['sigma'][i],
-                               timesplit[t]['qsigma'][i],
-                               timesplit[t]['usigma'][i],
-                               timesplit[t]['vsigma'][i]
-                               ), dtype=DTPOL
-                             ))
-
-            # average data in a time region
+        data = self.data
+        times = data['time']
+
+        # Assign each data point to a time bin
+        if scan_avg:
+            if self.scans is None or len(self.scans) == 0:
+                raise Exception("No scan table in observation: cannot average by scan!")
+            scanstart = 24.0*(self.scans['time'] - 0.5*self.scans['interval'])
+            scanstop = 24.0*(self.scans['time'] + 0.5*self.scans['interval'])
+            scanorder = np.argsort(scanstart)
+            tbin = np.searchsorted(scanstart[scanorder], times, side='right') - 1
+            inscan = (tbin >= 0) * (times <= scanstop[scanorder][np.maximum(tbin, 0)])
+            if not np.all(inscan):
+                print("Warning: dropping %i data points outside of the scan table!" % np.sum(~inscan))
+            data = data[inscan]
+            times = times[inscan]
+            tbin = tbin[inscan]
+        else:
+            # each chunk starts at the first time not within inttime of the previous chunk start
+            inttime_hr = inttime/3600.
+            utimes = np.unique(times)
+            tstarts = []
+            i = 0
+            while i < len(utimes):
+                tstarts.append(utimes[i])
+                i = max(i + 1, np.searchsorted(utimes, utimes[i] + inttime_hr, side='left'))
+            tbin = np.searchsorted(np.array(tstarts), times, side='right') - 1
+
+        if len(data) == 0:
+            raise Exception("No data left to average!")
+
+        # Group the data by time bin and baseline
+        (sites, site_idx) = np.unique(np.hstack((data['t1'], data['t2'])), return_inverse=True)
+        nsite = len(sites)
+        blkey = (tbin*nsite + site_idx[:len(data)])*nsite + site_idx[len(data):]
+        (blkey, first, group) = np.unique(blkey, return_index=True, return_inverse=True)
+        group = group.reshape(-1)
+        counts = np.bincount(group)
+
+        def binmean(x):
+            if np.iscomplexobj(x):
+                return (np.bincount(group, weights=np.real(x)) + 1j*np.bincount(group, weights=np.imag(x)))/counts
+            return np.bincount(group, weights=x)/counts
+
+        def binsigma(sig):
+            return np.sqrt(np.bincount(group, weights=sig**2))/counts
+
+        # all baselines in a time bin get the mean time of the bin
+        # (scans of the scan table may have no data, so skip empty bins)
+        tbin_counts = np.bincount(tbin)
+        tbin_mean = np.divide(np.bincount(tbin, weights=times), tbin_counts,
+                              out=np.zeros(len(tbin_counts)), where=(tbin_counts > 0))
+
+        datatable = np.empty(len(blkey), dtype=DTPOL)
+        datatable['time'] = tbin_mean[tbin[first]]
+        datatable['t1'] = data['t1'][first]
+        datatable['t2'] = data['t2'][first]
+        for field in ('tint', 'tau1', 'tau2', 'u', 'v'):
+            datatable[field] = binmean(data[field])
+        for (field, sigfield) in (('vis','sigma'), ('qvis','qsigma'), ('uvis','usigma'), ('vvis','vsigma')):
+            if incoherent:
+                datatable[field] = binmean(amp_debias(np.abs(data[field]), data[sigfield]))
             else:
-                tavg += 1
-                obs_timeregion = Obsdata(self.ra, self.dec, self.rf, self.bw, np.array(timeregion),
-                                         self.tarr, source=self.source, mjd=self.mjd)
-
-                blsplit = obs_timeregion.unpack(alldata_list, mode='bl')
-                for bl in range(0,len(blsplit)):
-
-                    bldata = blsplit[bl]
-                    datatable.append(np.array
-                             ((
-                               np.mean(obs_timeregion.data['time']),
-                               np.mean(bldata['tint']),
-                               bldata['t1'][0],
-                               bldata['t2'][0],
-                               np.mean(bldata['tau1']),
-                               np.mean(bldata['tau2']),
-                               np.mean(bldata['u']),
-                               np.mean(bldata['v']),
-                               np.mean(bldata['vis']),
-                               np.mean(bldata['qvis']),
-                               np.mean(bldata['uvis']),
-                               np.mean(bldata['vvis']),
-                               np.sqrt(np.sum(bldata['sigma']**2)/len(bldata)**2),
-                               np.sqrt(np.sum(bldata['qsigma']**2)/len(bldata)**2),
-                               np.sqrt(np.sum(bldata['usigma']**2)/len(bldata)**2),
-                               np.sqrt(np.sum(bldata['vsigma']**2)/len(bldata)**2)
-                               ), dtype=DTPOL
-                             ))
-
-
-                # start a new time region
-                timeregion = []
-                time_current = timesplit[t]['time'][0]
-                for i in range(0, len(timesplit[t]['time'])):
-                    timeregion.append(np.array
-                             ((
-                               timesplit[t]['time'][i], timesplit[t]['tint'][i],
-                               timesplit[t]['t1'][i], timesplit[t]['t2'][i], timesplit[t]['tau1'][i], timesplit[t]['tau2'][i],
-                               timesplit[t]['u'][i], timesplit[t]['v'][i],
-                               timesplit[t]['vis'][i], timesplit[t]['qvis'][i], timesplit[t]['uvis'][i], timesplit[t]['vvis'][i],
-                               timesplit[t]['sigma'][i], timesplit[t]['qsigma'][i], timesplit[t]['usigma'][i], timesplit[t]['vsigma'][i]
-                               ), dtype=DTPOL
-                             ))
-        print(len(datatable))
-
-        return Obsdata(self.ra, self.dec, self.rf, self.bw, np.array(datatable), self.tarr, source=self.source, mjd=self.mjd)
-
-    def dirtybeam(self, npix, fov, pulse=PULSE_DEFAULT):
+                datatable[field] = binmean(data[field])
+            datatable[sigfield] = binsigma(data[sigfield])
+
+        print("Averaged %i visibilities into %i" % (len(data), len(datatable)))
+
+        return Obsdata(self.ra, self.dec, self.rf, self.bw, datatable, self.tarr, source=self.source, mjd=self.mjd,
+                       ampcal=self.ampcal, phasecal=self.phasecal, opacitycal=self.opacitycal, dcal=self.dcal,
+                       frcal=self.frcal, timetype=self.timetype, scantable=self.scans)
+
+    def dirtybeam(self, npix, fov, pulse=PULSE_DEFAULT, weighting='none', robust=0., ttype='direct', fft_pad_factor=2):
 
         """Make an image of the observation dirty beam.
 
@@ -706,28 +772,20 @@ class Obsdata(object):
                npix (int): The pixel size of the square output image.
                fov (float): The field of view of the square output image in radians.
                pulse (function): The function convolved with the pixel values for continuous image.
+               weighting (str): 'none', 'natural', 'uniform' or 'briggs' visibility weighting
+               robust (float): the Briggs robust parameter
+               ttype (str): if "fast", grid the visibilities and use an FFT. Else "direct" for DTFT
+               fft_pad_factor (float): zero pad the image to fft_pad_factor * image size in FFT
 
            Returns:
                (Image): an Image object with the dirty beam.
         """
 
-        pdim = fov/npix
-        u = self.unpack('u')['u']
-        v = self.unpack('v')['v']
-
-        xlist = np.arange(0,-npix,-1)*pdim + (pdim*npix)/2.0 - pdim/2.0
-
-        im = np.array([[np.mean(np.cos(2*np.pi*(i*u + j*v)))
-                  for i in xlist]
-                  for j in xlist])
-
-        im = im[0:npix, 0:npix]
-
-        # Normalize to a total beam power of 1
-        im = im/np.sum(im)
+        (beam, ims) = self.dirty_planes(npix, fov, stokes=False, weighting=weighting, robust=robust,
+                                        ttype=ttype, fft_pad_factor=fft_pad_factor)
 
         src = self.source + "_DB"
-        return ehtim.image.Image(im, pdim, self.ra, self.dec, rf=self.rf, source=src, mjd=self.mjd, pulse=pulse)
+        return ehtim.image.Image(beam, fov/npix, self.ra, self.dec, rf=self.rf, source=src, mjd=self.mjd, pulse=pulse)
 
     def cleanbeam(self, npix, fov, pulse=PULSE_DEFAULT):
 
@@ -793,67 +851,64 @@ class Obsdata(object):
 
         return np.array((fwhm_maj, fwhm_min, theta))
 
-    def dirtyimage(self, npix, fov, pulse=PULSE_DEFAULT):
+    def dirty_planes(self, npix, fov, stokes=True, weighting='none', robust=0., ttype='direct', fft_pad_factor=2):
 
-        """Make the observation dirty image (direct Fourier transform).
+        """Make the dirty beam and the I,Q,U,V dirty images of the observation with one weighting of the data.
 
            Args:
-               npix (int): The pixel size of the square output image.
-               fov (float): The field of view of the square output image in radians.
-               pulse (function): The function convolved with the pixel values for continuous image.
+               npix (int): The pixel size of the square output images.
+               fov (float): The field of view of the square output images in radians.
+               stokes (bool): if False, only make the dirty beam
+               weighting (str): 'none', 'natural', 'uniform' or 'briggs' visibility weighting
+               robust (float): the Briggs robust parameter
+               ttype (str): if "fast", grid the visibilities and use an FFT. Else "direct" for DTFT
+               fft_pad_factor (float): zero pad the image to fft_pad_factor * image size in FFT
 
            Returns:
-               (Image): an Image object with dirty image.
+               (tuple): the (npix, npix) dirty beam normalized to a total power of 1,
+                        and the (4, npix, npix) I,Q,U,V dirty images in Jy/pixel
         """
 
-        pdim = fov/npix
-        u = self.unpack('u')['u']
-        v = self.unpack('v')['v']
-        vis = self.unpack('vis')['vis']
-        qvis = self.unpack('qvis')['qvis']
-        uvis = self.unpack('uvis')['uvis']
-        vvis = self.unpack('vvis')['vvis']
+        import ehtim.imaging.imager_utils as iu
 
-        xlist = np.arange(0,-npix,-1)*pdim + (pdim*npix)/2.0 - pdim/2.0
+        data = self.unpack(['u','v','vis','qvis','uvis','vvis','sigma'])
+        uv = np.hstack((data['u'].reshape(-1,1), data['v'].reshape(-1,1)))
+        weights = imaging_weights(data['u'], data['v'], data['sigma'], fov, weighting=weighting, robust=robust)
 
-        # Take the DFTS
-        #TODO verify if is this right?
+        # The beam and all Stokes planes share one transform
         # Shouldn't need to real about conjugate baselines b/c unpack does not return them
-        im  = np.array([[np.mean(np.real(vis)*np.cos(2*np.pi*(i*u + j*v)) -
-                                 np.imag(vis)*np.sin(2*np.pi*(i*u + j*v)))
-                  for i in xlist]
-                  for j in xlist])
-        qim = np.array([[np.mean(np.real(qvis)*np.cos(2*np.pi*(i*u + j*v)) -
-                                 np.imag(qvis)*np.sin(2*np.pi*(i*u + j*v)))
-                  for i in xlist]
-                  for j in xlist])
-        uim = np.array([[np.mean(np.real(uvis)*np.cos(2*np.pi*(i*u + j*v)) -
-                                 np.imag(uvis)*np.sin(2*np.pi*(i*u + j*v)))
-                  for i in xlist]
-                  for j in xlist])
-        vim = np.array([[np.mean(np.real(vvis)*np.cos(2*np.pi*(i*u + j*v)) -
-                                 np.imag(vvis)*np.sin(2*np.pi*(i*u + j*v)))
-                  for i in xlist]
-                  for j in xlist])
-
-        dim = np.array([[np.mean(np.cos(2*np.pi*(i*u + j*v)))
-                  for i in xlist]
-                  for j in xlist])
+        data_list = [weights]
+        if stokes:
+            data_list += [weights*data[field] for field in ['vis','qvis','uvis','vvis']]
+        ims = iu.dirty_images(uv, data_list, npix, fov/npix, ttype=ttype, fft_pad_factor=fft_pad_factor)
 
         # Final normalization
-        im  = im /np.sum(dim)
-        qim = qim/np.sum(dim)
-        uim = uim/np.sum(dim)
-        vim = vim/np.sum(dim)
+        norm = np.sum(ims[0])
+        return (ims[0]/norm, ims[1:]/norm)
+
+    def dirtyimage(self, npix, fov, pulse=PULSE_DEFAULT, weighting='none', robust=0., ttype='direct', fft_pad_factor=2):
+
+        """Make the observation dirty image.
 
-        im = im[0:npix, 0:npix]
-        qim = qim[0:npix, 0:npix]
-        uim = uim[0:npix, 0:npix]
-        vim = vim[0:npix, 0:npix]
+           Args:
+               npix (int): The pixel size of the square output image.
+               fov (float): The field of view of the square output image in radians.
+               pulse (function): The function convolved with the pixel values for continuous image.
+               weighting (str): 'none', 'natural', 'uniform' or 'briggs' visibility weighting
+               robust (float): the Briggs robust parameter
+               ttype (str): if "fast", grid the visibilities and use an FFT. Else "direct" for DTFT
+               fft_pad_factor (float): zero pad the image to fft_pad_factor * image size in FFT
 
-        out = ehtim.image.Image(im, pdim, self.ra, self.dec, rf=self.rf, source=self.source, mjd=self.mjd, pulse=pulse)
-        out.add_qu(qim, uim)
-        out.add_v(vim)
+           Returns:
+               (Image): an Image object with dirty image.
+        """
+
+        (beam, ims) = self.dirty_planes(npix, fov, weighting=weighting, robust=robust,
+                                        ttype=ttype, fft_pad_factor=fft_pad_factor)
+
+        out = ehtim.image.Image(ims[0], fov/npix, self.ra, self.dec, rf=self.rf, source=self.source, mjd=self.mjd, pulse=pulse)
+        out.add_qu(ims[1], ims[2])
+        out.add_v(ims[3])
 
         return out
 
@@ -939,91 +994,119 @@ class Obsdata(object):
 
         return np.median(std_list)
 
-    def flag_uvdist(self, uv_min = 0.0, uv_max = 1e12):
+    def flag_mask(self, mask):
 
-        # This will remove all visibilities that include any of the specified sites
-        obs_out = self.copy()
-        uvdist_list = obs_out.unpack('uvdist')['uvdist']
-        mask = np.array([uv_min <= uvdist_list[j] <= uv_max for j in range(len(uvdist_list))])
-        obs_out.data = obs_out.data[mask]
+        """Keep only the data points where mask is True.
+           Masks from the mask_* methods can be combined with & and | and applied with a single copy.
+
+           Args:
+               mask (numpy.ndarray): a boolean array with one entry per data point, True to keep the point
+
+           Returns:
+               (Obsdata): the observation with the masked data points removed
+        """
+
+        mask = np.asarray(mask, dtype=bool)
+        if len(mask) != len(self.data):
+            raise Exception("flag mask must have one entry per data point!")
+
+        obs_out = Obsdata(self.ra, self.dec, self.rf, self.bw, self.data[mask], self.tarr, source=self.source,
+                          mjd=self.mjd, ampcal=self.ampcal, phasecal=self.phasecal, opacitycal=self.opacitycal,
+                          dcal=self.dcal, frcal=self.frcal, timetype=self.timetype, scantable=self.scans,
+                          canonical=True)
         print('Flagged %d/%d visibilities' % ((len(self.data)-len(obs_out.data)), (len(self.data))))
         return obs_out
 
+    def mask_uvdist(self, uv_min = 0.0, uv_max = 1e12):
+
+        """Return a mask that is False for the data points with uv distance outside [uv_min, uv_max].
+        """
+
+        uvdist = self.unpack('uvdist')['uvdist']
+        return (uv_min <= uvdist) * (uvdist <= uv_max)
+
+    def mask_sites(self, sites):
+
+        """Return a mask that is False for all visibilities that include any of the specified sites.
+        """
+
+        return ~np.isin(self.data['t1'], sites) * ~np.isin(self.data['t2'], sites)
+
+    def mask_low_snr(self, snr_cut = 3):
+
+        """Return a mask that is False for all data points with snr below the specified snr_cut.
+        """
+
+        return self.unpack('snr')['snr'] > snr_cut
+
+    def mask_UT_range(self, UT_start_hour = 0.0, UT_stop_hour = 0.0, flag_or_keep = 0):
+
+        """Return a mask that is False for the points within (or if flag_or_keep, outside) a specified UT range.
+        """
+
+        times = self.data['time']
+        UT_mask = (times <= UT_start_hour) + (times >= UT_stop_hour)
+        if flag_or_keep:
+            UT_mask = np.invert(UT_mask)
+        return UT_mask
+
+    def mask_large_scatter(self, field = 'amp', scatter_cut = 1.0, max_diff_seconds = 100):
+
+        """Return a mask that is False for the data points whose baseline has a large scatter in the field
+           (e.g., amp or snr) within max_diff_seconds. The scatter is the median absolute deviation from the median.
+        """
+
+        values = self.unpack(field)[field]
+        (median, mad) = obs_flagging.scatter_stats(self.data['t1'], self.data['t2'], self.data['time'],
+                                                   values, max_diff_seconds/3600.0)
+        return mad < scatter_cut
+
+    def mask_anomalous(self, field = 'snr', max_diff_seconds = 100, robust_nsigma_cut = 5):
+
+        """Return a mask that is False for the data points with anomalous field (e.g., amp or snr)
+           compared to the median of the same baseline within max_diff_seconds.
+           The median absolute deviation from the median is used as a robust proxy for standard deviation.
+        """
+
+        values = self.unpack(field)[field]
+        (median, mad) = obs_flagging.scatter_stats(self.data['t1'], self.data['t2'], self.data['time'],
+                                                   values, max_diff_seconds/3600.0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.abs(values - median)/mad < robust_nsigma_cut
+
+    def flag_uvdist(self, uv_min = 0.0, uv_max = 1e12):
+
+        # This will remove all visibilities with uv distance outside [uv_min, uv_max]
+        return self.flag_mask(self.mask_uvdist(uv_min=uv_min, uv_max=uv_max))
+
     def flag_sites(self, sites):
 
         # This will remove all visibilities that include any of the specified sites
-        obs_out = self.copy()
-        t1_list = obs_out.unpack('t1')['t1']
-        t2_list = obs_out.unpack('t2')['t2']
-        site_mask = np.array([t1_list[j] not in sites and t2_list[j] not in sites for j in range(len(t1_list))])
-        obs_out.data = obs_out.data[site_mask]
-        print('Flagged %d/%d visibilities' % ((len(self.data)-len(obs_out.data)), (len(self.data))))
-        return obs_out
+        return self.flag_mask(self.mask_sites(sites))
 
     def flag_low_snr(self, snr_cut = 3):
 
         # This drops all data points with snr below the specified snr_cut
-        obs_out = self.copy()
-        snr_mask = obs_out.unpack('snr')['snr'] > snr_cut
-        obs_out.data = obs_out.data[snr_mask]
-        print('Flagged %d/%d visibilities' % ((len(self.data)-len(obs_out.data)), (len(self.data))))
-        return obs_out
+        return self.flag_mask(self.mask_low_snr(snr_cut=snr_cut))
 
     def flag_UT_range(self, UT_start_hour = 0.0, UT_stop_hour = 0.0, flag_or_keep = 0):
 
         # This drops (or only keeps) points within a specified UT range
-        obs_out = self.copy()
-        UT_mask = obs_out.unpack('time')['time'] <= UT_start_hour
-        UT_mask = UT_mask + (obs_out.unpack('time')['time'] >= UT_stop_hour)
-        if flag_or_keep:
-            UT_mask = np.invert(UT_mask)
-
-        obs_out.data = obs_out.data[UT_mask]
-        print('Flagged %d/%d visibilities' % ((len(self.data)-len(obs_out.data)), (len(self.data))))
-        return obs_out
+        return self.flag_mask(self.mask_UT_range(UT_start_hour=UT_start_hour, UT_stop_hour=UT_stop_hour,
+                                                 flag_or_keep=flag_or_keep))
 
     def flag_large_scatter(self, field = 'amp', scatter_cut = 1.0, max_diff_seconds = 100):
 
         # This drops all data points with scatter in the field (e.g., amp or snr) greater than a prescribed amount
-        obs_out = self.copy()
-
-        stats = dict()
-
-        for t1 in set(obs_out.data['t1']):
-            for t2 in set(obs_out.data['t2']):
-                vals = obs_out.unpack_bl(t1,t2,field)
-                for j in range(len(vals)):
-                    near_vals_mask = np.abs(vals['time'] - vals['time'][j])<max_diff_seconds/3600.0
-                    fields  = vals[field][np.abs(vals['time'] - vals['time'][j])<max_diff_seconds/3600.0] #only the nearby fields
-                    dfields = np.median(np.abs(fields-np.median(fields))) # robust estimator of the scatter
-                    stats[(vals['time'][j][0], tuple(sorted((t1,t2))))] = dfields
-
-        mask = np.array([stats[(rec[0], tuple(sorted((rec[2], rec[3]))))] < scatter_cut for rec in obs_out.data])
-        obs_out.data = obs_out.data[mask]
-        print('Flagged %d/%d visibilities' % ((len(self.data)-len(obs_out.data)), (len(self.data))))
-        return obs_out
+        return self.flag_mask(self.mask_large_scatter(field=field, scatter_cut=scatter_cut,
+                                                      max_diff_seconds=max_diff_seconds))
 
     def flag_anomalous(self, field = 'snr', max_diff_seconds = 100, robust_nsigma_cut = 5):
 
         # This drops all data points with anomalous field (e.g., amp or snr)
         # Here, we use median absolute deviation from the median as a robust proxy for standard deviation
-        obs_out = self.copy()
-
-        stats = dict()
-
-        for t1 in set(obs_out.data['t1']):
-            for t2 in set(obs_out.data['t2']):
-                vals = obs_out.unpack_bl(t1,t2,field)
-                for j in range(len(vals)):
-                    near_vals_mask = np.abs(vals['time'] - vals['time'][j])<max_diff_seconds/3600.0
-                    fields  = vals[field][np.abs(vals['time'] - vals['time'][j])<max_diff_seconds/3600.0] #only the nearby fields
-                    dfields = np.median(np.abs(fields-np.median(fields))) # robust estimator of the scatter
-                    stats[(vals['time'][j][0], tuple(sorted((t1,t2))))] = np.abs(vals[field][j]-np.median(fields)) / dfields
-
-        mask = np.array([stats[(rec[0], tuple(sorted((rec[2], rec[3]))))][0] < robust_nsigma_cut for rec in obs_out.data])
-        obs_out.data = obs_out.data[mask]
-        print('Flagged %d/%d visibilities' % ((len(self.data)-len(obs_out.data)), (len(self.data))))
-        return obs_out
+        return self.flag_mask(self.mask_anomalous(field=field, max_diff_seconds=max_diff_seconds,
+                                                  robust_nsigma_cut=robust_nsigma_cut))
 
     def taper(self, fwhm):
         """Taper the observation with a circular Gaussian kernel
@@ -1085,16 +1168,15 @@ class Obsdata(object):
         v = datatable['v']
 
         # divide visibilities by the scattering kernel
-        for i in range(len(vis)):
-            ker = sgra_kernel_uv(self.rf, u[i], v[i])
-            vis[i] = vis[i]/ker
-            qvis[i] = qvis[i]/ker
-            uvis[i] = uvis[i]/ker
-            vvis[i] = vvis[i]/ker
-            sigma[i] = sigma[i]/ker
-            qsigma[i] = qsigma[i]/ker
-            usigma[i] = usigma[i]/ker
-            vsigma[i] = vsigma[i]/ker
+        ker = sgra_kernel_uv(self.rf, u, v)
+        vis = vis/ker
+        qvis = qvis/ker
+        uvis = uvis/ker
+        vvis = vvis/ker
+        sigma = sigma/ker
+        qsigma = qsigma/ker
+        usigma = usigma/ker
+        vsigma = vsigma/ker
 
         datatable['vis'] = vis
         datatable['qvis'] = qvis
@@ -1143,6 +1225,105 @@ class Obsdata(object):
         res = opt.minimize(errfunc, paramguess, method='Powell',options=optdict)
         return res.x
 
+    def closure_idx(self, ctype='bispec', count='min'):
+
+        """Return the index tables of the closure quantities in the data with conjugate baselines.
+
+           Args:
+               ctype (str): 'bispec' for closure triangles or 'camp' for closure quadrangles
+               count (str): If 'min', return a minimal set of closures, if 'max' return all closures
+
+           Returns:
+               (tuple): arrays of the scan index in tlist_idx(conj=True), the tarr indices of the sites,
+                        and the data_conj() rows of the baselines (l1, l2, l3) or (blue1, blue2, red1, red2) of each closure
+        """
+
+        if not count in ('min', 'max'):
+            raise Exception("possible options for count are 'min' and 'max'")
+        if not ctype in ('bispec', 'camp'):
+            raise Exception("closure type must be 'bispec' or 'camp'!")
+
+        # the index tables depend only on the time and site columns and the array,
+        # so they are reused until these columns change or obs.tarr is replaced
+        cache = self._index_cache()
+        key = ('closure', ctype, count)
+        if key in cache and cache[key][0] is self.tarr:
+            return cache[key][1]
+
+        nsite_closure = {'bispec':3, 'camp':4}[ctype]
+        data = self.data_conj()
+        scanslices = self.tlist_idx(conj=True)
+        nscan = len(scanslices)
+        nsite = len(self.tarr)
+        scan = np.repeat(np.arange(nscan), [sl.stop - sl.start for sl in scanslices])
+
+        # tarr indices of the sites on every baseline
+        (names, site_idx) = np.unique(np.hstack((data['t1'], data['t2'])), return_inverse=True)
+        site_idx = np.array([self.tkey[name] for name in names], dtype=int)[site_idx]
+        i1 = site_idx[:len(data)]
+        i2 = site_idx[len(data):]
+
+        # sorted lookup table of (scan, site1, site2) -> row; later rows overwrite earlier duplicates
+        blkey = (scan*nsite + i1)*nsite + i2
+        order = np.argsort(blkey, kind='mergesort')
+        blkey = blkey[order]
+        last = np.append(blkey[1:] != blkey[:-1], True)
+        blkey = blkey[last]
+        blrow = order[last]
+
+        # scans with the same sites present share the same candidate closures
+        present = np.zeros((nscan, nsite), dtype=bool)
+        present[scan, i1] = True
+        (patterns, pattern_idx) = np.unique(present, axis=0, return_inverse=True)
+        pattern_idx = pattern_idx.reshape(-1)
+
+        scanlist = [np.zeros(0, dtype=int)]
+        poslist = [np.zeros(0, dtype=int)]
+        sitelist = [np.zeros((0, nsite_closure), dtype=int)]
+        rowlist = [np.zeros((0, nsite_closure), dtype=int)]
+        for p in range(len(patterns)):
+            (sitetab, pairs) = closure_site_table(np.where(patterns[p])[0], self.tarr, ctype=ctype, count=count)
+            if len(sitetab) == 0:
+                continue
+
+            # look up the rows of every baseline in every closure in every scan with this pattern
+            scans = np.where(pattern_idx == p)[0]
+            rows = np.empty((len(scans), len(sitetab), len(pairs)), dtype=int)
+            for (k, (s1, s2)) in enumerate(pairs):
+                query = (scans.reshape(-1,1)*nsite + sitetab[:,s1])*nsite + sitetab[:,s2]
+                pos = np.minimum(np.searchsorted(blkey, query), len(blkey) - 1)
+                rows[:,:,k] = np.where(blkey[pos] == query, blrow[pos], -1)
+
+            # keep closures where all baselines are present
+            (iscan, iclosure) = np.nonzero(np.all(rows >= 0, axis=2))
+            scanlist.append(scans[iscan])
+            poslist.append(iclosure)
+            sitelist.append(sitetab[iclosure])
+            rowlist.append(rows[iscan, iclosure])
+
+        # order the closures by scan
+        scan = np.concatenate(scanlist)
+        order = np.lexsort((np.concatenate(poslist), scan))
+
+        closures = (scan[order], np.concatenate(sitelist)[order], np.concatenate(rowlist)[order])
+        cache[key] = (self.tarr, closures)
+
+        return closures
+
+    def closure_times(self, scan, timetype):
+
+        """Return the times of closures given their scan indices in tlist_idx(conj=True).
+        """
+
+        # tlist_idx(conj=True) has one scan per unique time
+        times = np.unique(self.data['time'])[scan]
+        if timetype in ['GMST','gmst'] and self.timetype=='UTC' and len(times):
+            times = utc_to_gmst(times, self.mjd)
+        if timetype in ['UTC','utc'] and self.timetype=='GMST' and len(times):
+            times = gmst_to_utc(times, self.mjd)
+
+        return times
+
     def bispectra(self, vtype='vis', mode='time', count='min',timetype=False):
 
         """Return a recarray of the equal time bispectra.
@@ -1167,82 +1348,34 @@ class Obsdata(object):
         if timetype not  in ['GMST','UTC','gmst','utc']:
             raise Exception("timetype should be 'GMST' or 'UTC'!")
 
-        # Generate the time-sorted data with conjugate baselines
-        tlist = self.tlist(conj=True)
-        outlist = []
-        bis = []
-        tt = 1
-        for tdata in tlist:
-            sys.stdout.flush()
-            sys.stdout.write('\rGetting bispectra: type: %s count: %s scan %i/%i ' % (vtype, count, tt, len(tlist)))
-
-            tt += 1
-
-            time = tdata[0]['time']
-            if timetype in ['GMST','gmst'] and self.timetype=='UTC':
-                time = utc_to_gmst(time, self.mjd)
-            if timetype in ['UTC','utc'] and self.timetype=='GMST':
-                time = gmst_to_utc(time, self.mjd)
-            sites = list(set(np.hstack((tdata['t1'],tdata['t2']))))
-
-            # Create a dictionary of baselines at the current time incl. conjugates;
-            l_dict = {}
-            for dat in tdata:
-                l_dict[(dat['t1'], dat['t2'])] = dat
-
-            # Determine the triangles in the time step
-
-            # Minimal Set
-            if count == 'min':
-                # If we want a minimal set, choose triangles with the minimum sefd reference
-                # Unless there is no sefd data, in which case choose the northernmost
-                # TODO This should probably be an sefdr + sefdl average instead
-                if len(set(self.tarr['sefdr'])) > 1:
-                    ref = sites[np.argmin([self.tarr[self.tkey[site]]['sefdr'] for site in sites])]
-                else:
-                    ref = sites[np.argmax([self.tarr[self.tkey[site]]['z'] for site in sites])]
-                sites.remove(ref)
-
-                # Find all triangles that contain the ref
-                tris = list(it.combinations(sites,2))
-                tris = [(ref, t[0], t[1]) for t in tris]
-
-            # Maximal  Set - find all triangles
-            elif count == 'max':
-                tris = list(it.combinations(sites,3))
-
-            # Generate bispectra for each triangle
-            for tri in tris:
-                # The ordering is north-south
-                a1 = np.argmax([self.tarr[self.tkey[site]]['z'] for site in tri])
-                a3 = np.argmin([self.tarr[self.tkey[site]]['z'] for site in tri])
-                a2 = 3 - a1 - a3
-                tri = (tri[a1], tri[a2], tri[a3])
-
-                # Select triangle entries in the data dictionary
-                try:
-                    l1 = l_dict[(tri[0], tri[1])]
-                    l2 = l_dict[(tri[1],tri[2])]
-                    l3 = l_dict[(tri[2], tri[0])]
-                except KeyError:
-                    continue
-
-                (bi, bisig) = make_bispectrum(l1,l2,l3,vtype)
-
-                # Append to the equal-time list
-                bis.append(np.array((time, tri[0], tri[1], tri[2],
-                                     l1['u'], l1['v'], l2['u'], l2['v'], l3['u'], l3['v'],
-                                     bi, bisig), dtype=DTBIS))
-
-            # Append to outlist
-            if mode=='time' and len(bis) > 0:
-                outlist.append(np.array(bis))
-                bis = []
-
-            elif mode=='all':
-                outlist = np.array(bis)
-
-        return np.array(outlist)
+        # Find the closure triangles and gather their baselines from the data with conjugate baselines
+        sys.stdout.write('\rGetting bispectra: type: %s count: %s ' % (vtype, count))
+        (scan, sites, rows) = self.closure_idx(ctype='bispec', count=count)
+        data = self.data_conj()
+        l1 = data[rows[:,0]]
+        l2 = data[rows[:,1]]
+        l3 = data[rows[:,2]]
+
+        (bi, bisig) = make_bispectrum(l1, l2, l3, vtype)
+
+        bis = np.empty(len(scan), dtype=DTBIS)
+        bis['time'] = self.closure_times(scan, timetype)
+        bis['t1'] = l1['t1']
+        bis['t2'] = l2['t1']
+        bis['t3'] = l3['t1']
+        bis['u1'] = l1['u']
+        bis['v1'] = l1['v']
+        bis['u2'] = l2['u']
+        bis['v2'] = l2['v']
+        bis['u3'] = l3['u']
+        bis['v3'] = l3['v']
+        bis['bispec'] = bi
+        bis['sigmab'] = bisig
+
+        if mode=='time':
+            return split_table(bis, run_slices(scan))
+        else:
+            return bis
 
     def c_phases(self, vtype='vis', mode='time', count='min', ang_unit='deg', timetype=False):
 
@@ -1274,26 +1407,20 @@ class Obsdata(object):
         else: angle = 1.0
 
         # Get the bispectra data
-        bispecs = self.bispectra(vtype=vtype, mode='time', count=count, timetype=timetype)
+        bis = self.bispectra(vtype=vtype, mode='all', count=count, timetype=timetype)
 
-        # Reformat into a closure phase list/array
-        outlist = []
-        cps = []
+        # Reformat into a closure phase array
         sys.stdout.write('\rReformatting bispectra to closure phase...')
-        for bis in bispecs:
-            for bi in bis:
-                if len(bi) == 0: continue
-                bi.dtype.names = ('time','t1','t2','t3','u1','v1','u2','v2','u3','v3','cphase','sigmacp')
-                bi['sigmacp'] = np.real(bi['sigmacp']/np.abs(bi['cphase'])/angle)
-                bi['cphase'] = np.real((np.angle(bi['cphase'])/angle))
-                cps.append(bi.astype(np.dtype(DTCPHASE)))
-            if mode == 'time' and len(cps) > 0:
-                outlist.append(np.array(cps))
-                cps = []
-
-        if mode == 'all':
-            outlist = np.array(cps)
-        return np.array(outlist)
+        cps = np.empty(len(bis), dtype=DTCPHASE)
+        for field in ('time','t1','t2','t3','u1','v1','u2','v2','u3','v3'):
+            cps[field] = bis[field]
+        cps['cphase'] = np.real(np.angle(bis['bispec'])/angle)
+        cps['sigmacp'] = np.real(bis['sigmab']/np.abs(bis['bispec'])/angle)
+
+        if mode=='time':
+            return split_table(cps, run_slices(cps['time']))
+        else:
+            return cps
 
     def bispectra_tri(self, site1, site2, site3, vtype='vis',timetype=False):
 
@@ -1424,121 +1551,40 @@ class Obsdata(object):
         if timetype not  in ['GMST','UTC','gmst','utc']:
             raise Exception("timetype should be 'GMST' or 'UTC'!")
 
-        # Get data sorted by time
-        tlist = self.tlist(conj=True)
-        outlist = []
-        cas = []
-        tt = 1
-        for tdata in tlist:
-            sys.stdout.flush()
-            sys.stdout.write('\rGetting closure amps: type: %s %s count: %s scan %i/%i ' % (vtype, ctype, count, tt, len(tlist)))
-            tt += 1
-
-            time = tdata[0]['time']
-            if timetype in ['GMST','gmst'] and self.timetype=='UTC':
-                time = utc_to_gmst(time, self.mjd)
-            if timetype in ['UTC','utc'] and self.timetype=='GMST':
-                time = gmst_to_utc(time, self.mjd)
-
-            sites = np.array(list(set(np.hstack((tdata['t1'],tdata['t2'])))))
-            if len(sites) < 4:
-                continue
-
-            # Create a dictionary of baseline data at the current time including conjugates;
-            l_dict = {}
-            for dat in tdata:
-                l_dict[(dat['t1'], dat['t2'])] = dat
-
-            # Minimal set
-            if count == 'min':
-                # If we want a minimal set, choose the minimum sefd reference
-                # TODO this should probably be an sefdr + sefdl average instead
-                sites = sites[np.argsort([self.tarr[self.tkey[site]]['sefdr'] for site in sites])]
-                ref = sites[0]
-
-                # Loop over other sites >=3 and form minimal closure amplitude set
-                for i in range(3, len(sites)):
-                    if (ref, sites[i]) not in l_dict.keys():
-                        continue
-
-                    # MJ: This causes a KeyError in some cases, probably with flagged data or something
-                    blue1 = l_dict[ref, sites[i]]
-                    for j in range(1, i):
-                        if j == i-1: k = 1
-                        else: k = j+1
-
-                        # MJ: I tried joining these into a single if statement using or without success... no idea why..
-                        if (sites[i], sites[j]) not in l_dict.keys():
-                            continue
-
-                        if (ref, sites[k]) not in l_dict.keys():
-                            continue
-
-                        if (sites[j], sites[k]) not in l_dict.keys():
-                            continue
-
-                        #TODO behavior when no baseline?
-                        try:
-                            red1 = l_dict[sites[i], sites[j]]
-                            red2 = l_dict[ref, sites[k]]
-                            blue2 = l_dict[sites[j], sites[k]]
-                        except KeyError:
-                            continue
-
-                        # Compute the closure amplitude and the error
-                        (camp, camperr) = make_closure_amplitude(red1, red2, blue1, blue2, vtype,
-                                                                 ctype=ctype, debias=debias, debias_type=debias_type)
-
-                        # Add the closure amplitudes to the equal-time list
-                        # Our site convention is (12)(34)/(14)(23)
-                        cas.append(np.array((time,
-                                             ref, sites[i], sites[j], sites[k],
-                                             blue1['u'], blue1['v'], blue2['u'], blue2['v'],
-                                             red1['u'], red1['v'], red2['u'], red2['v'],
-                                             camp, camperr),
-                                             dtype=DTCAMP))
-
-            # Maximal Set
-            elif count == 'max':
-                # Find all quadrangles
-                quadsets = list(it.combinations(sites,4))
-                for q in quadsets:
-                    # Loop over 3 closure amplitudes
-                    # Our site convention is (12)(34)/(14)(23)
-                    for quad in (q, [q[0],q[2],q[1],q[3]], [q[0],q[1],q[3],q[2]]):
-
-                        # Blue is numerator, red is denominator
-                        # TODO behavior when no baseline?
-                        try:
-                            blue1 = l_dict[quad[0], quad[1]]
-                            blue2 = l_dict[quad[2], quad[3]]
-                            red1 = l_dict[quad[0], quad[3]]
-                            red2 = l_dict[quad[1], quad[2]]
-                        except KeyError:
-                            continue
-
-                        # Compute the closure amplitude and the error
-                        (camp, camperr) = make_closure_amplitude(red1, red2, blue1, blue2, vtype,
-                                                                 ctype=ctype, debias=debias, debias_type=debias_type)
-
-                        # Add the closure amplitudes to the equal-time list
-                        # Our site convention is (12)(34)/(14)(23)
-                        cas.append(np.array((time,
-                                             quad[0], quad[1], quad[2], quad[3],
-                                             blue1['u'], blue1['v'], blue2['u'], blue2['v'],
-                                             red1['u'], red1['v'], red2['u'], red2['v'],
-                                             camp, camperr),
-                                             dtype=DTCAMP))
-
-            # Append all equal time closure amps to outlist
-            if mode=='time':
-                outlist.append(np.array(cas))
-                cas = []
-
-            elif mode=='all':
-                outlist = np.array(cas)
-
-        return np.array(outlist)
+        # Find the closure quadrangles and gather their baselines from the data with conjugate baselines
+        # Our site convention is (12)(34)/(14)(23); blue is numerator, red is denominator
+        sys.stdout.write('\rGetting closure amps: type: %s %s count: %s ' % (vtype, ctype, count))
+        (scan, sites, rows) = self.closure_idx(ctype='camp', count=count)
+        data = self.data_conj()
+        blue1 = data[rows[:,0]]
+        blue2 = data[rows[:,1]]
+        red1 = data[rows[:,2]]
+        red2 = data[rows[:,3]]
+
+        (camp, camperr) = make_closure_amplitude(red1, red2, blue1, blue2, vtype,
+                                                 ctype=ctype, debias=debias, debias_type=debias_type)
+
+        cas = np.empty(len(scan), dtype=DTCAMP)
+        cas['time'] = self.closure_times(scan, timetype)
+        cas['t1'] = blue1['t1']
+        cas['t2'] = blue1['t2']
+        cas['t3'] = blue2['t1']
+        cas['t4'] = blue2['t2']
+        cas['u1'] = blue1['u']
+        cas['v1'] = blue1['v']
+        cas['u2'] = blue2['u']
+        cas['v2'] = blue2['v']
+        cas['u3'] = red1['u']
+        cas['v3'] = red1['v']
+        cas['u4'] = red2['u']
+        cas['v4'] = red2['v']
+        cas['camp'] = camp
+        cas['sigmaca'] = camperr
+
+        if mode=='time':
+            return split_table(cas, run_slices(scan))
+        else:
+            return cas
 
     def camp_quad(self, site1, site2, site3, site4, vtype='vis', ctype='camp', debias=True, timetype=False, camps=[]):
 
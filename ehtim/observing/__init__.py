@@ -10,3 +10,4 @@ from . import pulses
 from . import jdcal
 from . import obs_helpers
 from . import obs_simulate
+from . import obs_flagging
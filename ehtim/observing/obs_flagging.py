@@ -0,0 +1,112 @@
+# obs_flagging.py
+# vectorized statistics for flagging interferometric data
+#
+#    Copyright (C) 2018 Andrew Chael
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from __future__ import division
+from __future__ import print_function
+from builtins import range
+
+import numpy as np
+
+from ehtim.const_def import *
+
+WINDOW_BLOCKSIZE = 2**22 # largest number of padded window entries evaluated at once by windowed_median_mad
+
+##################################################################################################
+# Flagging statistics
+##################################################################################################
+
+def baseline_index(t1, t2):
+    """Return the index of the baseline of every data point, counting t1-t2 and t2-t1 as the same baseline
+    """
+
+    (names, idx) = np.unique(np.hstack((t1, t2)), return_inverse=True)
+    i1 = idx[:len(t1)]
+    i2 = idx[len(t1):]
+    blkey = np.minimum(i1, i2)*len(names) + np.maximum(i1, i2)
+
+    return np.unique(blkey, return_inverse=True)[1]
+
+def window_bounds(groups, times, window):
+    """Find the points of the same group closer in time than window to every point.
+
+       Args:
+           groups (numpy.ndarray): the integer group (e.g. baseline) index of every point
+           times (numpy.ndarray): the time of every point
+           window (float): the half width of the window, in the units of times
+
+       Returns:
+           (tuple): the order that sorts the points by group and time, and the start and stop positions
+                    in that order of the window of each sorted point
+    """
+
+    order = np.lexsort((times, groups))
+    groups = groups[order]
+    times = times[order]
+
+    start = np.empty(len(times), dtype=int)
+    stop = np.empty(len(times), dtype=int)
+    bounds = np.searchsorted(groups, np.arange(np.max(groups) + 2))
+    for k in range(len(bounds) - 1):
+        (k0, k1) = (bounds[k], bounds[k+1])
+        tk = times[k0:k1]
+
+        # the window edges only move forward in sorted time, so binary search finds them all at once
+        start[k0:k1] = k0 + np.searchsorted(tk, tk - window, side='right')
+        stop[k0:k1] = k0 + np.searchsorted(tk, tk + window, side='left')
+
+    return (order, start, stop)
+
+def windowed_median_mad(values, start, stop):
+    """Return the median and the median absolute deviation from the median of values[start:stop] for every window.
+    """
+
+    values = np.asarray(values, dtype=float)
+    nwin = np.max(stop - start)
+    offsets = np.arange(nwin)
+    blocksize = max(WINDOW_BLOCKSIZE // nwin, 1)
+
+    median = np.empty(len(start))
+    mad = np.empty(len(start))
+    for k0 in range(0, len(start), blocksize):
+        k1 = min(k0 + blocksize, len(start))
+
+        # pad the windows of this block to a common length with nans
+        idx = start[k0:k1].reshape(-1,1) + offsets
+        win = np.where(idx < stop[k0:k1].reshape(-1,1), values[np.minimum(idx, len(values) - 1)], np.nan)
+
+        median[k0:k1] = np.nanmedian(win, axis=1)
+        mad[k0:k1] = np.nanmedian(np.abs(win - median[k0:k1].reshape(-1,1)), axis=1)
+
+    return (median, mad)
+
+def scatter_stats(t1, t2, times, values, window):
+    """Return the median and median absolute deviation of the values on the same baseline
+       within window of each data point, in the original order of the points.
+    """
+
+    (order, start, stop) = window_bounds(baseline_index(t1, t2), times, window)
+    (median, mad) = windowed_median_mad(np.asarray(values)[order], start, stop)
+
+    # undo the baseline-time sort
+    out_median = np.empty(len(order))
+    out_mad = np.empty(len(order))
+    out_median[order] = median
+    out_mad[order] = mad
+
+    return (out_median, out_mad)
@@ -21,6 +21,9 @@ from builtins import str
 from builtins import map
 from builtins import range
 import ephem
+import hashlib
+import itertools as it
+import collections
 
 import astropy.time as at
 import astropy.coordinates as coords
@@ -29,6 +32,17 @@ import scipy.special as ss
 
 from ehtim.const_def import *
 
+DFT_BLOCKSIZE = 1024 # number of uv points processed at once by DFTOperator
+DFT_MATRIX_MAXSIZE = 2**26 # largest number of dense DFT matrix elements before switching to DFTOperator
+PULSEFAC_CACHE_SIZE = 16 # number of uv coverages whose pulse factors are kept by pulse_factors
+FTOPERATOR_CACHE_SIZE = 2 # number of DFT operators kept by ftoperator_cached
+EPHEM_CACHE_SIZE = 64 # number of (site, time grid) spacecraft positions kept by ephem_coords
+
+_pulsefac_cache = collections.OrderedDict()
+_ftoperator_cache = collections.OrderedDict()
+_ephem_cache = collections.OrderedDict()
+_tle_cache = {}
+
 ##################################################################################################
 # Other Functions
 ##################################################################################################
@@ -40,8 +54,8 @@ def compute_uv_coordinates(array, site1, site2, time, mjd, ra, dec, rf, timetype
     if not isinstance(site2, np.ndarray): site2 = np.array([site2]).flatten()
 
     if len(site1) == len(site2) == 1:
-        site1 = np.array([site1[0] for i in range(len(time))])
-        site2 = np.array([site2[0] for i in range(len(time))])
+        site1 = np.repeat(site1, len(time))
+        site2 = np.repeat(site2, len(time))
     elif not (len(site1) == len(site2) == len(time)):
         raise Exception("site1, site2, and time not the same dimension in compute_uv_coordinates!") 
 
@@ -63,7 +77,6 @@ def compute_uv_coordinates(array, site1, site2, time, mjd, ra, dec, rf, timetype
     else: raise Exception("timetype must be UTC or GMST!")
 
     fracmjd = np.floor(mjd) + time/24.
-    dto = (at.Time(fracmjd, format='mjd')).datetime
     theta = np.mod((time_sidereal - ra)*HOUR, 2*np.pi)
     if type(fix_theta_GMST) != bool:
         theta = np.mod((fix_theta_GMST - ra)*HOUR, 2*np.pi)
@@ -74,53 +87,15 @@ def compute_uv_coordinates(array, site1, site2, time, mjd, ra, dec, rf, timetype
     coord1 = np.vstack((array.tarr[i1]['x'], array.tarr[i1]['y'], array.tarr[i1]['z'])).T
     coord2 = np.vstack((array.tarr[i2]['x'], array.tarr[i2]['y'], array.tarr[i2]['z'])).T
 
-    # TODO SPEED UP!??
-    # use spacecraft ephemeris to get position of site 1
-    spacemask1 = [np.all(coord == (0.,0.,0.)) for coord in coord1]
-    if np.any(spacemask1):
-        if timetype=='GMST':
-            raise Exception("Spacecraft ephemeris only work with UTC!")
-
-        site1space_list = site2[spacemask1]
-        site1space_dtolist = dto[spacemask1]
-        coord1space = []
-        for k in range(len(site1space_list)):
-            site1space = site1space_list[k]
-            dto_now = site1space_dtolist[k]
-            sat = ephem.readtle(array.ephem[site1space][0],array.ephem[site1space][1],array.ephem[site1space][2])
-            sat.compute(dto_now) # often complains if ephemeris out of date!
-            elev = sat.elevation
-            lat = sat.sublat / DEGREE
-            lon = sat.sublong / DEGREE
-            # pyephem doesn't use an ellipsoid earth model!
-            c1 = coords.EarthLocation.from_geodetic(lon, lat, elev, ellipsoid=None)
-            c1 = np.array((c1.x.value, c1.y.value, c1.z.value))
-            coord1space.append(c1)
-        coord1space = np.array(coord1space)
-        coord1[spacemask1] = coord1space
-
-    spacemask2 = [np.all(coord == (0.,0.,0.)) for coord in coord2]
-    if np.any(spacemask2):
-        if timetype=='GMST':
-            raise Exception("Spacecraft ephemeris only work with UTC!")
-
-        site2space_list = site2[spacemask2]
-        site2space_dtolist = dto[spacemask2]
-        coord2space = []
-        for k in range(len(site2space_list)):
-            site2space = site2space_list[k]
-            dto_now = site2space_dtolist[k]
-            sat = ephem.readtle(array.ephem[site2space][0],array.ephem[site2space][1],array.ephem[site2space][2])
-            sat.compute(dto_now) # often complains if ephemeris out of date!
-            elev = sat.elevation
-            lat = sat.sublat / DEGREE
-            lon = sat.sublong / DEGREE
-            # pyephem doesn't use an ellipsoid earth model!
-            c2 = coords.EarthLocation.from_geodetic(lon, lat, elev, ellipsoid=None)
-            c2 = np.array((c2.x.value, c2.y.value, c2.z.value))
-            coord2space.append(c2)
-        coord2space = np.array(coord2space)
-        coord2[spacemask2] = coord2space
+    # use spacecraft ephemeris to get positions of space sites
+    for (sites, coord) in ((site1, coord1), (site2, coord2)):
+        spacemask = np.all(coord == 0., axis=1)
+        if np.any(spacemask):
+            if timetype=='GMST':
+                raise Exception("Spacecraft ephemeris only work with UTC!")
+            for site in np.unique(sites[spacemask]):
+                mask = spacemask * (sites == site)
+                coord[mask] = ephem_coords(array, site, fracmjd[mask])
 
     # rotate the station coordinates with the earth
     coord1 = earthrot(coord1, theta)
@@ -141,6 +116,82 @@ def compute_uv_coordinates(array, site1, site2, time, mjd, ra, dec, rf, timetype
     # return times and uv points where we have  data
     return (time, u, v)
 
+def ephem_body(tle):
+    """Return the (cached) pyephem body of a three line TLE ephemeris
+    """
+
+    tle = tuple(tle)
+    if tle not in _tle_cache:
+        _tle_cache[tle] = ephem.readtle(tle[0], tle[1], tle[2])
+    return _tle_cache[tle]
+
+def ephem_coords(array, site, fracmjd):
+    """Return the (n,3) geocentric positions of a spacecraft site at fractional mjds from its TLE ephemeris.
+       The positions of the last EPHEM_CACHE_SIZE (site, time grid) pairs are cached.
+    """
+
+    fracmjd = np.ascontiguousarray(fracmjd, dtype=float).reshape(-1)
+    tle = tuple(array.ephem[site])
+    key = (site, tle, hashlib.sha1(fracmjd.tobytes()).hexdigest(), fracmjd.shape)
+    if key in _ephem_cache:
+        _ephem_cache[key] = _ephem_cache.pop(key)
+        return _ephem_cache[key].copy()
+
+    # propagate the orbit once per distinct time
+    (mjds, idx) = np.unique(fracmjd, return_inverse=True)
+    dtos = np.atleast_1d(at.Time(mjds, format='mjd').datetime)
+    sat = ephem_body(tle)
+    elev = np.empty(len(mjds))
+    lat = np.empty(len(mjds))
+    lon = np.empty(len(mjds))
+    for (k, dto_now) in enumerate(dtos):
+        sat.compute(dto_now) # often complains if ephemeris out of date!
+        elev[k] = sat.elevation
+        lat[k] = sat.sublat / DEGREE
+        lon[k] = sat.sublong / DEGREE
+
+    # pyephem doesn't use an ellipsoid earth model!
+    c = coords.EarthLocation.from_geodetic(lon, lat, elev, ellipsoid=None)
+    coords_out = np.vstack((c.x.value, c.y.value, c.z.value)).T[idx]
+
+    _ephem_cache[key] = coords_out
+    while len(_ephem_cache) > EPHEM_CACHE_SIZE:
+        _ephem_cache.popitem(last=False)
+
+    return coords_out.copy()
+
+def imaging_weights(u, v, sigma, fov, weighting='none', robust=0.):
+    """Return the imaging weights of visibilities at u,v points for a square image with field of view fov.
+       weighting is 'none' for equal weights, 'natural' for 1/sigma^2 weights,
+       'uniform' to divide the natural weights by the summed weight in each 1/fov uv cell,
+       or 'briggs' for robust weighting between natural (robust=2) and uniform (robust=-2).
+    """
+
+    u = np.asarray(u)
+    v = np.asarray(v)
+    if weighting == 'none':
+        return np.ones(len(u))
+    if weighting not in ['natural', 'uniform', 'briggs']:
+        raise Exception("weighting must be 'none', 'natural', 'uniform', or 'briggs'!")
+
+    weights = 1./np.asarray(sigma)**2
+    if weighting == 'natural':
+        return weights
+
+    # summed natural weights in each uv cell, counting the conjugate points
+    iu = np.round(np.hstack((u, -u))*fov).astype(int)
+    iv = np.round(np.hstack((v, -v))*fov).astype(int)
+    cellkey = (iu - np.min(iu))*(np.max(iv) - np.min(iv) + 1) + (iv - np.min(iv))
+    (cells, idx) = np.unique(cellkey, return_inverse=True)
+    cellweights = np.bincount(idx, weights=np.hstack((weights, weights)))
+    density = cellweights[idx[:len(u)]]
+
+    if weighting == 'uniform':
+        return weights/density
+
+    f2 = (5.*10**(-robust))**2 / (np.sum(cellweights**2) / (2*np.sum(weights)))
+    return weights/(1. + density*f2)
+
 def make_bispectrum(l1, l2, l3,vtype):
     """make a list of bispectra and errors
        l1,l2,l3 are full datatables of visibility entries
@@ -323,6 +374,79 @@ def make_closure_amplitude(red1, red2, blue1, blue2, vtype, ctype='camp', debias
 
     return (camp, camperr)
 
+def closure_site_table(sites, tarr, ctype='bispec', count='min'):
+    """Return the closures formed from the sites present in a scan
+       sites are sorted indices into tarr, ctype is 'bispec' for triangles or 'camp' for quadrangles
+       returns an array of tarr indices for each closure and the site pairs of its baselines
+       the baselines are (l1, l2, l3) for bispectra and (blue1, blue2, red1, red2) for closure amplitudes
+    """
+
+    sites = list(sites)
+
+    if ctype == 'bispec':
+        pairs = ((0,1), (1,2), (2,0))
+        if len(sites) < 3:
+            return (np.zeros((0,3), dtype=int), pairs)
+
+        # Minimal Set
+        if count == 'min':
+            # If we want a minimal set, choose triangles with the minimum sefd reference
+            # Unless there is no sefd data, in which case choose the northernmost
+            # TODO This should probably be an sefdr + sefdl average instead
+            if len(set(tarr['sefdr'])) > 1:
+                ref = sites[np.argmin(tarr['sefdr'][sites])]
+            else:
+                ref = sites[np.argmax(tarr['z'][sites])]
+            sites.remove(ref)
+            tris = [(ref, t[0], t[1]) for t in it.combinations(sites,2)]
+
+        # Maximal  Set - find all triangles
+        elif count == 'max':
+            tris = list(it.combinations(sites,3))
+
+        # The ordering is north-south
+        tris = np.array(tris, dtype=int)
+        nsorder = np.argsort(-tarr['z'][tris], axis=1, kind='mergesort')
+        tris = np.take_along_axis(tris, nsorder, axis=1)
+
+        return (tris, pairs)
+
+    elif ctype == 'camp':
+        # Our site convention is (12)(34)/(14)(23)
+        if len(sites) < 4:
+            return (np.zeros((0,4), dtype=int), ((0,1), (2,3), (0,3), (1,2)))
+
+        # Minimal set
+        if count == 'min':
+            # If we want a minimal set, choose the minimum sefd reference
+            # TODO this should probably be an sefdr + sefdl average instead
+            sites = [sites[i] for i in np.argsort(tarr['sefdr'][sites], kind='mergesort')]
+            ref = sites[0]
+
+            # Loop over other sites >=3 and form minimal closure amplitude set
+            quads = []
+            for i in range(3, len(sites)):
+                for j in range(1, i):
+                    if j == i-1: k = 1
+                    else: k = j+1
+                    quads.append((ref, sites[i], sites[j], sites[k]))
+
+            # blue baselines are (ref, i), (j, k), red baselines are (i, j), (ref, k)
+            pairs = ((0,1), (2,3), (1,2), (0,3))
+
+        # Maximal Set
+        elif count == 'max':
+            # Loop over 3 closure amplitudes in every quadrangle
+            quads = []
+            for q in it.combinations(sites,4):
+                quads.extend((q, (q[0],q[2],q[1],q[3]), (q[0],q[1],q[3],q[2])))
+            pairs = ((0,1), (2,3), (0,3), (1,2))
+
+        return (np.array(quads, dtype=int), pairs)
+
+    else:
+        raise Exception("closure type must be 'bispec' or 'camp'!")
+
 #MW---OCT---2017
 def get_snr_help(Esnr):
     """estimates snr given a single biased snr measurement
@@ -338,7 +462,8 @@ def get_snr(Esnr):
     if type(Esnr) == float or type(Esnr)==np.float64:
         return get_snr_help(Esnr)
     else:
-        return np.asarray(map(get_snr_help,Esnr))
+        Esnr = np.asarray(Esnr)
+        return np.where(Esnr**2 >= 2.0, np.sqrt(np.abs(Esnr**2 - 1.0)), 1.0)
 
 def log_debias(snr0):
     """debias log snr
@@ -418,7 +543,7 @@ def gauss_uv(u, v, flux, beamparams, x=0., y=0.):
 
 def sgra_kernel_uv(rf, u, v):
     """Return the value of the Sgr A* scattering kernel at a given u,v pt (in lambda),
-       at a given frequency rf (in Hz).
+       at a given frequency rf (in Hz). u and v may also be arrays of uv points.
        Values from Bower et al.
     """
 
@@ -434,10 +559,10 @@ def sgra_kernel_uv(rf, u, v):
     a = (sigma_min * np.cos(theta))**2 + (sigma_maj*np.sin(theta))**2
     b = (sigma_maj * np.cos(theta))**2 + (sigma_min*np.sin(theta))**2
     c = (sigma_min**2 - sigma_maj**2) * np.cos(theta) * np.sin(theta)
-    m = np.array([[a, c], [c, b]])
-    uv = np.array([u,v])
+    u = np.asarray(u)
+    v = np.asarray(v)
 
-    x2 = np.dot(uv, np.dot(m, uv))
+    x2 = a*u**2 + 2*c*u*v + b*v**2
     g = np.exp(-2 * np.pi**2 * x2)
 
     return g
@@ -481,18 +606,35 @@ def cerror(sigma):
     """
     return np.random.normal(loc=0,scale=sigma) + 1j*np.random.normal(loc=0,scale=sigma)
 
+def hashseed(*args):
+    """return a seed determined by a collection of arguments that is the same in every python session
+    """
+    return int(hashlib.md5(",".join(map(repr,args)).encode()).hexdigest(), 16) % 4294967295
+
 def hashrandn(*args):
     """set the seed according to a collection of arguments and return random gaussian var
     """
-    np.random.seed(hash(",".join(map(repr,args))) % 4294967295)
+    np.random.seed(hashseed(*args))
     return np.random.randn()
 
 def hashrand(*args):
     """set the seed according to a collection of arguments and return random number in 0,1
     """
-    np.random.seed(hash(",".join(map(repr,args))) % 4294967295)
+    np.random.seed(hashseed(*args))
     return np.random.rand()
 
+def hashrandn_array(size, *args):
+    """return an array of random gaussian vars from a generator seeded by a collection of arguments
+       (the global seed is not changed)
+    """
+    return np.random.RandomState(hashseed(*args)).randn(size)
+
+def hashrand_array(size, *args):
+    """return an array of random numbers in 0,1 from a generator seeded by a collection of arguments
+       (the global seed is not changed)
+    """
+    return np.random.RandomState(hashseed(*args)).rand(size)
+
 def image_centroid(im):
     """Return the image centroid (in radians)
     """
@@ -512,20 +654,224 @@ def ftmatrix(pdim, xdim, ydim, uvlist, pulse=PULSE_DEFAULT, mask=[]):
 
     xlist = np.arange(0,-xdim,-1)*pdim + (pdim*xdim)/2.0 - pdim/2.0
     ylist = np.arange(0,-ydim,-1)*pdim + (pdim*ydim)/2.0 - pdim/2.0
+    uvlist = np.asarray(uvlist).reshape(-1,2)
 
     # original sign convention
     #ftmatrices = [pulse(2*np.pi*uv[0], 2*np.pi*uv[1], pdim, dom="F") * np.outer(np.exp(-2j*np.pi*ylist*uv[1]), np.exp(-2j*np.pi*xlist*uv[0])) for uv in uvlist] #list of matrices at each freq
 
     # changed the sign convention to agree with BU data (Jan 2017)
-    ftmatrices = [pulse(2*np.pi*uv[0], 2*np.pi*uv[1], pdim, dom="F") * np.outer(np.exp(2j*np.pi*ylist*uv[1]), np.exp(2j*np.pi*xlist*uv[0])) for uv in uvlist] #list of matrices at each freq
+    # the phase factors are separable in x and y
+    pulsefac = pulse(2*np.pi*uvlist[:,0], 2*np.pi*uvlist[:,1], pdim, dom="F")
+    yphase = np.exp(2j*np.pi*np.outer(uvlist[:,1], ylist))
+    xphase = np.exp(2j*np.pi*np.outer(uvlist[:,0], xlist))
+    ftmatrices = (pulsefac.reshape(-1,1,1) * yphase[:,:,None]) * xphase[:,None,:]
 
-    ftmatrices = np.reshape(np.array(ftmatrices), (len(uvlist), xdim*ydim))
+    ftmatrices = np.reshape(ftmatrices, (len(uvlist), xdim*ydim))
 
     if len(mask):
         ftmatrices = ftmatrices[:,mask]
 
     return ftmatrices
 
+def pulse_factors(uv, psize, pulse, xdim, ydim):
+    """Return the pulse function times the image centroid phase at each of the uv points,
+       the factor multiplying FFT-sampled visibilities of an xdim*ydim image with pixel width psize.
+       The last PULSEFAC_CACHE_SIZE results are cached, so repeated observations of images on the
+       same uv coverage do not recompute them. The returned array is read-only.
+    """
+
+    uv = np.ascontiguousarray(uv, dtype=float).reshape(-1,2)
+    key = (hashlib.sha1(uv.tobytes()).hexdigest(), uv.shape, psize, pulse, xdim, ydim)
+    if key in _pulsefac_cache:
+        _pulsefac_cache[key] = _pulsefac_cache.pop(key)
+        return _pulsefac_cache[key]
+
+    phase = np.exp(-1j*np.pi*psize*((1+xdim%2)*uv[:,0] + (1+ydim%2)*uv[:,1]))
+    pulsefac = pulse(2*np.pi*uv[:,0], 2*np.pi*uv[:,1], psize, dom="F") * phase
+    pulsefac.setflags(write=False)
+
+    _pulsefac_cache[key] = pulsefac
+    while len(_pulsefac_cache) > PULSEFAC_CACHE_SIZE:
+        _pulsefac_cache.popitem(last=False)
+
+    return pulsefac
+
+class DFTOperator(object):
+    """A matrix-free equivalent of ftmatrix() for large images and uv coverages.
+       matvec() and rmatvec() apply the DFT and its adjoint a block of uv points at a time,
+       using separable x and y phase factors, so the full nvis*npix matrix is never stored.
+    """
+
+    def __init__(self, pdim, xdim, ydim, uvlist, pulse=PULSE_DEFAULT, mask=[], blocksize=DFT_BLOCKSIZE):
+        self.pdim = pdim
+        self.xdim = int(xdim)
+        self.ydim = int(ydim)
+        self.uv = np.asarray(uvlist).reshape(-1,2)
+        self.blocksize = int(blocksize)
+
+        self.xlist = np.arange(0,-xdim,-1)*pdim + (pdim*xdim)/2.0 - pdim/2.0
+        self.ylist = np.arange(0,-ydim,-1)*pdim + (pdim*ydim)/2.0 - pdim/2.0
+        self.pulsefac = pulse(2*np.pi*self.uv[:,0], 2*np.pi*self.uv[:,1], pdim, dom="F") * np.ones(len(self.uv))
+
+        if len(mask):
+            self.mask = np.asarray(mask)
+        else:
+            self.mask = np.ones(self.xdim*self.ydim, dtype=bool)
+
+        self.shape = (len(self.uv), int(np.sum(self.mask)))
+        self.dtype = np.dtype('c16')
+
+    def phases(self, k0, k1):
+        """Return the y and x phase factors for uv points k0 to k1
+        """
+        yphase = np.exp(2j*np.pi*np.outer(self.uv[k0:k1,1], self.ylist))
+        xphase = np.exp(2j*np.pi*np.outer(self.uv[k0:k1,0], self.xlist))
+        return (yphase, xphase)
+
+    def matvec(self, imvec):
+        """Return the visibilities of the (masked) image vector imvec
+        """
+        im = np.zeros(self.xdim*self.ydim, dtype=np.result_type(imvec, float))
+        im[self.mask] = imvec
+        im = im.reshape(self.ydim, self.xdim)
+
+        vis = np.empty(self.shape[0], dtype='c16')
+        for k0 in range(0, self.shape[0], self.blocksize):
+            k1 = min(k0 + self.blocksize, self.shape[0])
+            (yphase, xphase) = self.phases(k0, k1)
+            vis[k0:k1] = np.sum(yphase * np.dot(xphase, im.T), axis=1)
+
+        return vis * self.pulsefac
+
+    def matmat(self, imvecs):
+        """Return the (nimage, nvis) visibilities of a (nimage, npix) stack of (masked) image vectors
+        """
+        imvecs = np.atleast_2d(imvecs)
+        ims = np.zeros((len(imvecs), self.xdim*self.ydim), dtype=np.result_type(imvecs, float))
+        ims[:, self.mask] = imvecs
+        ims = ims.reshape(-1, self.ydim, self.xdim)
+
+        vis = np.empty((len(ims), self.shape[0]), dtype='c16')
+        for k0 in range(0, self.shape[0], self.blocksize):
+            k1 = min(k0 + self.blocksize, self.shape[0])
+            (yphase, xphase) = self.phases(k0, k1)
+            vis[:, k0:k1] = np.einsum('nyk,ky->nk', np.dot(ims, xphase.T), yphase)
+
+        return vis * self.pulsefac
+
+    def rmatvec(self, vis):
+        """Return the adjoint DFT of the visibility vector vis on the (masked) image grid
+        """
+        wvis = np.asarray(vis) * self.pulsefac.conj()
+
+        im = np.zeros((self.ydim, self.xdim), dtype='c16')
+        for k0 in range(0, self.shape[0], self.blocksize):
+            k1 = min(k0 + self.blocksize, self.shape[0])
+            (yphase, xphase) = self.phases(k0, k1)
+            im += np.dot((yphase.conj() * wvis[k0:k1].reshape(-1,1)).T, xphase.conj())
+
+        return im.reshape(-1)[self.mask]
+
+    def dot(self, imvec):
+        """Same as matvec(), for compatibility with dense DFT matrices
+        """
+        return self.matvec(imvec)
+
+class GatheredFTOperator(object):
+    """The DFT rows of one closure leg, gathered from a DFT operator A over a set of unique uv points.
+       Row k is row index[k] of A, conjugated where conj[k] is True (uv points reflected into the upper half plane).
+       Legs built from the same A share the last model visibilities, so A is applied once per image for all legs.
+    """
+
+    def __init__(self, A, index, conj, shared=None):
+        self.A = A
+        self.index = np.asarray(index)
+        self.conj = np.asarray(conj, dtype=bool)
+        self.shared = {} if shared is None else shared
+
+        self.shape = (len(self.index), A.shape[1])
+        self.dtype = np.dtype('c16')
+
+    def unique_vis(self, imvec):
+        """Return A.dot(imvec) and A.dot(conj(imvec)), reusing the result for the last image seen by any leg
+        """
+        last = self.shared.get('imvec')
+        if last is None or last.shape != np.shape(imvec) or not np.array_equal(last, imvec):
+            vis = self.A.dot(imvec)
+            if np.iscomplexobj(imvec):
+                vis_conj = self.A.dot(np.conj(imvec))
+            else:
+                vis_conj = vis
+            self.shared['imvec'] = np.array(imvec, copy=True)
+            self.shared['vis'] = (vis, vis_conj)
+
+        return self.shared['vis']
+
+    def dot(self, imvec):
+        """Return the visibilities of the (masked) image vector imvec on the uv points of this leg
+        """
+        (vis, vis_conj) = self.unique_vis(imvec)
+        return np.where(self.conj, np.conj(vis_conj[self.index]), vis[self.index])
+
+    def rdot(self, vec):
+        """Return np.dot(vec, M) for the gathered matrix M of this leg
+        """
+        nuv = self.A.shape[0]
+        vec = np.asarray(vec)
+        w = (np.bincount(self.index, weights=np.where(self.conj, 0, vec.real), minlength=nuv) +
+             1j*np.bincount(self.index, weights=np.where(self.conj, 0, vec.imag), minlength=nuv))
+        wc = (np.bincount(self.index, weights=np.where(self.conj, vec.real, 0), minlength=nuv) -
+              1j*np.bincount(self.index, weights=np.where(self.conj, vec.imag, 0), minlength=nuv))
+
+        return ftrdot(w, self.A) + np.conj(ftrdot(wc, self.A))
+
+def dft_too_large(nvis, npix):
+    """Return True if a dense nvis x npix DFT matrix exceeds DFT_MATRIX_MAXSIZE elements
+    """
+    return nvis*npix > DFT_MATRIX_MAXSIZE
+
+def ftoperator(pdim, xdim, ydim, uvlist, pulse=PULSE_DEFAULT, mask=[]):
+    """Return a dense DFT matrix, or a DFTOperator if the matrix would be too large
+    """
+
+    npix = int(np.sum(mask)) if len(mask) else xdim*ydim
+    if dft_too_large(len(uvlist), npix):
+        return DFTOperator(pdim, xdim, ydim, uvlist, pulse=pulse, mask=mask)
+    else:
+        return ftmatrix(pdim, xdim, ydim, uvlist, pulse=pulse, mask=mask)
+
+def ftoperator_cached(pdim, xdim, ydim, uvlist, pulse=PULSE_DEFAULT):
+    """Return ftoperator() for an unmasked image, keeping the last FTOPERATOR_CACHE_SIZE results
+       so that many images observed on the same uv coverage share one DFT matrix.
+    """
+
+    uv = np.ascontiguousarray(uvlist, dtype=float).reshape(-1,2)
+    key = (hashlib.sha1(uv.tobytes()).hexdigest(), uv.shape, pdim, pulse, xdim, ydim)
+    if key in _ftoperator_cache:
+        _ftoperator_cache[key] = _ftoperator_cache.pop(key)
+        return _ftoperator_cache[key]
+
+    A = ftoperator(pdim, xdim, ydim, uv, pulse=pulse)
+    if not isinstance(A, DFTOperator):
+        A.setflags(write=False)
+
+    _ftoperator_cache[key] = A
+    while len(_ftoperator_cache) > FTOPERATOR_CACHE_SIZE:
+        _ftoperator_cache.popitem(last=False)
+
+    return A
+
+def ftrdot(vec, A):
+    """Return np.dot(vec, A) for a dense DFT matrix, a DFTOperator or a GatheredFTOperator A
+    """
+
+    if isinstance(A, DFTOperator):
+        return A.rmatvec(np.conj(vec)).conj()
+    elif isinstance(A, GatheredFTOperator):
+        return A.rdot(vec)
+    else:
+        return np.dot(vec, A)
+
 def ftmatrix_centered(im, pdim, xdim, ydim, uvlist, pulse=PULSE_DEFAULT):
     """Return a DFT matrix for the xdim*ydim image with pixel width pdim
        that extracts spatial frequencies of the uv points in uvlist.
@@ -543,8 +889,12 @@ def ftmatrix_centered(im, pdim, xdim, ydim, uvlist, pulse=PULSE_DEFAULT):
     xlist = xlist - x0
     ylist = ylist - y0
 
-    ftmatrices = [pulse(2*np.pi*uv[0], 2*np.pi*uv[1], pdim, dom="F") * np.outer(np.exp(-2j*np.pi*ylist*uv[1]), np.exp(-2j*np.pi*xlist*uv[0])) for uv in uvlist] #list of matrices at each freq
-    ftmatrices = np.reshape(np.array(ftmatrices), (len(uvlist), xdim*ydim))
+    uvlist = np.asarray(uvlist).reshape(-1,2)
+    pulsefac = pulse(2*np.pi*uvlist[:,0], 2*np.pi*uvlist[:,1], pdim, dom="F") * np.ones(len(uvlist))
+    yphase = np.exp(-2j*np.pi*np.outer(uvlist[:,1], ylist))
+    xphase = np.exp(-2j*np.pi*np.outer(uvlist[:,0], xlist))
+    ftmatrices = (pulsefac.reshape(-1,1,1) * yphase[:,:,None]) * xphase[:,None,:]
+    ftmatrices = np.reshape(ftmatrices, (len(uvlist), xdim*ydim))
     return ftmatrices
 
 
@@ -575,6 +925,28 @@ def power_of_two(target):
     else:
         return 1
 
+def split_table(data, idxlist):
+    """Split a data table into an array of sub-tables given a list of slices or index arrays.
+       The sub-tables are copies, so editing them does not modify data.
+    """
+
+    tables = np.empty(len(idxlist), dtype=object)
+    for i, idx in enumerate(idxlist):
+        tables[i] = data[idx].copy()
+
+    return tables
+
+def run_slices(vals):
+    """Return a list of slices over the runs of equal consecutive values in vals
+    """
+
+    vals = np.asarray(vals)
+    starts = np.append(0, np.nonzero(vals[1:] != vals[:-1])[0] + 1)
+    stops = np.append(starts[1:], len(vals))
+    if len(vals) == 0:
+        return []
+
+    return [slice(start, stop) for (start, stop) in zip(starts, stops)]
 
 def paritycompare(perm1, perm2):
     """Compare the parity of two permutations.
@@ -684,26 +1056,19 @@ def earthrot(vecs, thetas):
 
     if len(vecs.shape)==1:
         vecs = np.array([vecs])
-    if np.isscalar(thetas):
-        thetas = np.array([thetas for i in range(len(vecs))])
-
-    # equal numbers of sites and angles
-    if len(thetas) == len(vecs):
-        rotvec = np.array([np.dot(np.array(((np.cos(thetas[i]),-np.sin(thetas[i]),0),(np.sin(thetas[i]),np.cos(thetas[i]),0),(0,0,1))), vecs[i])
-                       for i in range(len(vecs))])
-
-    # only one rotation angle, many sites
-    elif len(thetas) == 1:
-        rotvec = np.array([np.dot(np.array(((np.cos(thetas[0]),-np.sin(thetas[0]),0),(np.sin(thetas[0]),np.cos(thetas[0]),0),(0,0,1))), vecs[i])
-                       for i in range(len(vecs))])
-    # only one site, many angles
-    elif len(vecs) == 1:
-        rotvec = np.array([np.dot(np.array(((np.cos(thetas[i]),-np.sin(thetas[i]),0),(np.sin(thetas[i]),np.cos(thetas[i]),0),(0,0,1))), vecs[0])
-                       for i in range(len(thetas))])
-    else:
+    thetas = np.atleast_1d(thetas)
+
+    # equal numbers of sites and angles, one angle for many sites, or one site for many angles
+    if not (len(thetas) == len(vecs) or len(thetas) == 1 or len(vecs) == 1):
         raise Exception("Unequal numbers of vectors and angles in earthrot(vecs, thetas)!")
 
-    #if rotvec.shape[0]==1: rotvec = rotvec[0]
+    c = np.cos(thetas)
+    s = np.sin(thetas)
+    rotvec = np.empty((max(len(thetas), len(vecs)), 3))
+    rotvec[:,0] = c*vecs[:,0] - s*vecs[:,1]
+    rotvec[:,1] = s*vecs[:,0] + c*vecs[:,1]
+    rotvec[:,2] = vecs[:,2]
+
     return rotvec
 
 def elev(obsvecs, sourcevec):
@@ -714,7 +1079,7 @@ def elev(obsvecs, sourcevec):
     if len(obsvecs.shape)==1:
         obsvecs=np.array([obsvecs])
 
-    anglebtw = np.array([np.dot(obsvec,sourcevec)/np.linalg.norm(obsvec)/np.linalg.norm(sourcevec) for obsvec in obsvecs])
+    anglebtw = np.dot(obsvecs,sourcevec)/np.linalg.norm(obsvecs, axis=-1)/np.linalg.norm(sourcevec)
     el = 0.5*np.pi - np.arccos(anglebtw)
 
     return el
@@ -79,70 +79,93 @@ def make_uvpoints(array,
         print("Time Type Not Recognized! Assuming UTC!")
         timetype = 'UTC'
 
-    # Generate uv points at all times
-    outlist = []
-    blpairs = []
-    for i1 in range(len(array.tarr)):
-        for i2 in range(len(array.tarr)):
-            if (i1!=i2 and
-                i1 < i2 and # This is the right condition for uvfits save order
-                not ((i2, i1) in blpairs)): # This cuts out the conjugate baselines
-
-                blpairs.append((i1,i2))
-                
-                # Optical Depth
-                if type(tau) == dict:
-                    try:
-                        tau1 = tau[i1]
-                        tau2 = tau[i2]
-                    except KeyError:
-                        tau1 = tau2 = TAUDEF
-                else:
-                    tau1 = tau2 = tau
-
-                # Noise on the correlations
-                sig_rr = blnoise(array.tarr[i1]['sefdr'], array.tarr[i2]['sefdr'], tint, bw)
-                sig_ll = blnoise(array.tarr[i1]['sefdl'], array.tarr[i2]['sefdl'], tint, bw)
-                sig_rl = blnoise(array.tarr[i1]['sefdr'], array.tarr[i2]['sefdl'], tint, bw)
-                sig_lr = blnoise(array.tarr[i1]['sefdl'], array.tarr[i2]['sefdr'], tint, bw)
-                sig_iv = 0.5*np.sqrt(sig_rr**2 + sig_ll**2)
-                sig_qu = 0.5*np.sqrt(sig_rl**2 + sig_lr**2)
-
-                site1 = array.tarr[i1]['site']
-                site2 = array.tarr[i2]['site']
-                (timesout,uout,vout) = compute_uv_coordinates(array, site1, site2, times, mjd, 
-                                                              ra, dec, rf, timetype=timetype, 
-                                                              elevmin=elevmin, elevmax=elevmax,
-                                                              fix_theta_GMST=fix_theta_GMST)
-
-                for k in range(len(timesout)):
-                    outlist.append(np.array((
-                              timesout[k],
-                              tint, # Integration
-                              site1, # Station 1
-                              site2, # Station 2
-                              tau1, # Station 1 zenith optical depth
-                              tau2, # Station 1 zenith optical depth
-                              uout[k], # u (lambda)
-                              vout[k], # v (lambda)
-                              0.0, # I Visibility (Jy)
-                              0.0, # Q Visibility
-                              0.0, # U Visibility
-                              0.0, # V Visibilities
-                              sig_iv, # I Sigma (Jy)
-                              sig_qu, # Q Sigma
-                              sig_qu, # U Sigma
-                              sig_iv  # V Sigma
-                            ), dtype=DTPOL
-                            ))
-
-    obsarr = np.array(outlist)
+    # All baselines in the right order for uvfits save
+    nsite = len(array.tarr)
+    (i1, i2) = np.triu_indices(nsite, 1)
+
+    # Optical Depth
+    if type(tau) == dict:
+        known = np.array([(a in tau and b in tau) for (a, b) in zip(i1, i2)], dtype=bool)
+        tau1 = np.array([tau[a] if k else TAUDEF for (a, k) in zip(i1, known)])
+        tau2 = np.array([tau[b] if k else TAUDEF for (b, k) in zip(i2, known)])
+    else:
+        tau1 = tau2 = tau*np.ones(len(i1))
+
+    # Noise on the correlations
+    sig_rr = blnoise(array.tarr['sefdr'][i1], array.tarr['sefdr'][i2], tint, bw)
+    sig_ll = blnoise(array.tarr['sefdl'][i1], array.tarr['sefdl'][i2], tint, bw)
+    sig_rl = blnoise(array.tarr['sefdr'][i1], array.tarr['sefdl'][i2], tint, bw)
+    sig_lr = blnoise(array.tarr['sefdl'][i1], array.tarr['sefdr'][i2], tint, bw)
+    sig_iv = 0.5*np.sqrt(sig_rr**2 + sig_ll**2)
+    sig_qu = 0.5*np.sqrt(sig_rl**2 + sig_lr**2)
+
+    # Rotate all station positions with the earth once per time step
+    coords_t = station_coords(array, times, mjd, ra, timetype=timetype, fix_theta_GMST=fix_theta_GMST)
+
+    # Elevation cut for every station and time
+    sourcevec = np.array([np.cos(dec*DEGREE), 0, np.sin(dec*DEGREE)])
+    visible = elevcut(coords_t.reshape(-1,3), sourcevec, elevmin=elevmin, elevmax=elevmax).reshape(len(times), nsite)
+
+    # u,v coordinates of all baselines
+    projU = np.cross(np.array([0,0,1]), sourcevec)
+    projU = projU/np.linalg.norm(projU)
+    projV = -np.cross(projU, sourcevec)
+    l = C/rf
+    diff = (coords_t[:,i1] - coords_t[:,i2])/l
+
+    # Keep the (baseline, time) points where both sites see the source, ordered by baseline
+    (bl, t) = np.nonzero((visible[:,i1] * visible[:,i2]).T)
+
+    obsarr = np.zeros(len(bl), dtype=DTPOL)
+    obsarr['time'] = times[t]
+    obsarr['tint'] = tint
+    obsarr['t1'] = array.tarr['site'][i1[bl]]
+    obsarr['t2'] = array.tarr['site'][i2[bl]]
+    obsarr['tau1'] = tau1[bl]
+    obsarr['tau2'] = tau2[bl]
+    obsarr['u'] = np.dot(diff[t,bl], projU)
+    obsarr['v'] = np.dot(diff[t,bl], projV)
+    obsarr['sigma'] = sig_iv[bl]
+    obsarr['qsigma'] = sig_qu[bl]
+    obsarr['usigma'] = sig_qu[bl]
+    obsarr['vsigma'] = sig_iv[bl]
 
     if not len(obsarr):
         raise Exception("No mutual visibilities in the specified time range!")
 
     return obsarr
 
+def station_coords(array, times, mjd, ra, timetype='UTC', fix_theta_GMST=False):
+    """Return the (ntime, nsite, 3) positions of all array sites rotated with the earth at each time.
+       Space sites (with zero positions in the tarr) take their positions from their ephemeris.
+    """
+
+    if timetype=='GMST':
+        time_sidereal = times
+    elif timetype=='UTC':
+        time_sidereal = utc_to_gmst(times, mjd)
+    else: raise Exception("timetype must be UTC or GMST!")
+
+    theta = np.mod((time_sidereal - ra)*HOUR, 2*np.pi)
+    if type(fix_theta_GMST) != bool:
+        theta = np.mod((fix_theta_GMST - ra)*HOUR, 2*np.pi)*np.ones(len(times))
+
+    nsite = len(array.tarr)
+    coords_t = np.empty((len(times), nsite, 3))
+    coords_t[:] = np.vstack((array.tarr['x'], array.tarr['y'], array.tarr['z'])).T
+
+    # use spacecraft ephemeris to get position of space sites
+    spacemask = np.all(coords_t[0] == 0., axis=1)
+    if np.any(spacemask):
+        if timetype=='GMST':
+            raise Exception("Spacecraft ephemeris only work with UTC!")
+        fracmjd = np.floor(mjd) + times/24.
+        for k in np.nonzero(spacemask)[0]:
+            coords_t[:,k] = ephem_coords(array, array.tarr[k]['site'], fracmjd)
+
+    coords_t = earthrot(coords_t.reshape(-1,3), np.repeat(theta, nsite))
+    return coords_t.reshape(len(times), nsite, 3)
+
 ##################################################################################################
 # Observe w/o noise
 ##################################################################################################
@@ -240,15 +263,10 @@ def observe_image_nonoise(im, obs, sgrscat=False, ttype="direct", fft_pad_factor
         visim = nd.map_coordinates(np.imag(vis_im), uv2)
         vis = visre + 1j*visim
 
-        # Extra phase to match centroid convention 
+        # Multiply by the pulse function and the extra phase to match centroid convention
+        # these only depend on the uv points, so they are cached across images
         # TODO -- is the convention right??
-        #phase = np.exp(-1j*np.pi*im.psize*(uv[:,0] + uv[:,1]))
-        phase = np.exp(-1j*np.pi*im.psize*((1+im.xdim%2)*uv[:,0] + (1+im.ydim%2)*uv[:,1])) 
-        vis = vis * phase
-
-        # Multiply by the pulse function
-        # TODO make faster?
-        pulsefac = np.array([im.pulse(2*np.pi*uvpt[0], 2*np.pi*uvpt[1], im.psize, dom="F") for uvpt in uv])
+        pulsefac = pulse_factors(uv, im.psize, im.pulse, im.xdim, im.ydim)
         vis = vis * pulsefac
 
         # FT of polarimetric quantities
@@ -263,13 +281,11 @@ def observe_image_nonoise(im, obs, sgrscat=False, ttype="direct", fft_pad_factor
 
             qvisre = nd.map_coordinates(np.real(qvis_im), uv2)
             qvisim = nd.map_coordinates(np.imag(qvis_im), uv2)
-            qvis = phase*(qvisre + 1j*qvisim)
-            qvis = qvis*pulsefac
+            qvis = (qvisre + 1j*qvisim)*pulsefac
 
             uvisre = nd.map_coordinates(np.real(uvis_im), uv2)
             uvisim = nd.map_coordinates(np.imag(uvis_im), uv2)
-            uvis = phase*(uvisre + 1j*uvisim)
-            uvis = uvis*pulsefac
+            uvis = (uvisre + 1j*uvisim)*pulsefac
 
         if len(im.vvec):
             varr = im.vvec.reshape(im.ydim, im.xdim)
@@ -279,8 +295,7 @@ def observe_image_nonoise(im, obs, sgrscat=False, ttype="direct", fft_pad_factor
 
             vvisre = nd.map_coordinates(np.real(vvis_im), uv2)
             vvisim = nd.map_coordinates(np.imag(vvis_im), uv2)
-            vvis = phase*(vvisre + 1j*vvisim)
-            vvis = vvis*pulsefac
+            vvis = (vvisre + 1j*vvisim)*pulsefac
 
     #visibilities from NFFT
     elif ttype=="nfft":
@@ -307,26 +322,25 @@ def observe_image_nonoise(im, obs, sgrscat=False, ttype="direct", fft_pad_factor
         plan.precompute()
 
         #phase and pulsefac
-        phase = np.exp(-1j*np.pi*(uvlist[:,0] + uvlist[:,1]))
-        pulsefac = np.array([im.pulse(2*np.pi*uvlist[i,0], 2*np.pi*uvlist[i,1], 1., dom="F") for i in xrange(uvdim)])
+        pulsefac = pulse_factors(uv, im.psize, im.pulse, im.xdim, im.ydim)
 
         #compute uniform --> nonuniform transform
         plan.f_hat = im.imvec.copy().reshape((im.ydim,im.xdim)).T
         plan.trafo()
-        vis = plan.f.copy()*phase*pulsefac
+        vis = plan.f.copy()*pulsefac
 
         if len(im.qvec):
             plan.f_hat = im.qvec.copy().reshape((im.ydim,im.xdim)).T
             plan.trafo()
-            qvis = plan.f.copy()*phase*pulsefac
+            qvis = plan.f.copy()*pulsefac
 
             plan.f_hat = im.uvec.copy().reshape((im.ydim,im.xdim)).T
             plan.trafo()
-            uvis = plan.f.copy()*phase*pulsefac
+            uvis = plan.f.copy()*pulsefac
         if len(im.vvec):
             plan.f_hat = im.vvec.copy().reshape((im.ydim,im.xdim)).T
             plan.trafo()
-            vvis = plan.f.copy()*phase*pulsefac
+            vvis = plan.f.copy()*pulsefac
 
     #visibilities from DFT
     else:
@@ -342,12 +356,11 @@ def observe_image_nonoise(im, obs, sgrscat=False, ttype="direct", fft_pad_factor
     # Scatter the visibilities with the SgrA* kernel
     if sgrscat:
         print('Scattering Visibilities with Sgr A* kernel!')
-        for i in range(len(vis)):
-            ker = sgra_kernel_uv(im.rf, uv[i,0], uv[i,1])
-            vis[i]  *= ker
-            qvis[i] *= ker
-            uvis[i] *= ker
-            vvis[i] *= ker
+        ker = sgra_kernel_uv(im.rf, uv[:,0], uv[:,1])
+        vis  = vis*ker
+        qvis = qvis*ker
+        uvis = uvis*ker
+        vvis = vvis*ker
 
     # Put the visibilities back in the obsdata array
     if type(obs) == Obsdata:
@@ -363,6 +376,149 @@ def observe_image_nonoise(im, obs, sgrscat=False, ttype="direct", fft_pad_factor
 
     return obsdata
 
+def observe_batch_nonoise(images, obs, sgrscat=False, ttype="direct", fft_pad_factor=1):
+    """Observe a list of images with the same pixel grid on the same baselines with no noise.
+       The images are stacked and transformed together: the DFT matrix and pulse factors
+       of the uv coverage are computed once, so each extra image only costs its FFT and sampling.
+
+       Args:
+           images (list): the Image objects to be observed, all with the same dimensions and pixel size
+           obs (Obsdata): The empty observation object OR a list of u,v coordinates
+           sgrscat (bool): if True, the visibilites will be blurred by the Sgr A* scattering kernel
+           ttype (str): if "fast" or 'nfft', use FFT to produce visibilities. Else "direct" for DTFT
+           fft_pad_factor (float): zero pad the image to fft_pad_factor * image size in FFT
+
+       Returns:
+           (numpy.ndarray): the (nimage, nvis) complex visibilities, or (nimage, 4, nvis) I,Q,U,V visibilities
+                            if any image is polarized
+    """
+
+    from ehtim.obsdata import Obsdata
+
+    if len(images) == 0:
+        raise Exception("observe_batch needs at least one image!")
+    im = images[0]
+    for image in images[1:]:
+        if (image.xdim != im.xdim or image.ydim != im.ydim or image.psize != im.psize or
+            image.pulse != im.pulse or image.rf != im.rf):
+            raise Exception("All images in a batch must have the same dimensions, pixel size, pulse and frequency!")
+
+    if type(obs) == Obsdata:
+        tolerance = 1e-8
+        for image in images:
+            if (np.abs(image.ra - obs.ra) > tolerance) or (np.abs(image.dec - obs.dec) > tolerance):
+                raise Exception("Image coordinates are not the same as observtion coordinates!")
+        if (np.abs(im.rf - obs.rf)/obs.rf > tolerance):
+            raise Exception("Image frequency is not the same as observation frequency!")
+        uv = recarr_to_ndarr(obs.data[['u','v']],'f8')
+    else:
+        uv = np.array(obs)
+        if uv.shape[1] != 2:
+            raise Exception("When given as a list of uv points, the obs should be a list of pairs of u-v coordinates!")
+
+    if ttype=='direct' or ttype=='fast' or ttype=='nfft':
+        print("Producing clean visibilities from %i images with %s FT . . . " % (len(images), ttype))
+    else:
+        raise Exception("ttype=%s, options for ttype are 'direct', 'fast', 'nfft'"%ttype)
+
+    # Stack the Stokes images into a (nimage*nstokes, ydim, xdim) array
+    npix = im.xdim*im.ydim
+    polarized = np.any([len(image.qvec) or len(image.vvec) for image in images])
+    if polarized:
+        nstokes = 4
+        vecs = np.zeros((len(images), 4, npix))
+        for (i, image) in enumerate(images):
+            vecs[i,0] = image.imvec
+            if len(image.qvec):
+                vecs[i,1] = image.qvec
+                vecs[i,2] = image.uvec
+            if len(image.vvec):
+                vecs[i,3] = image.vvec
+    else:
+        nstokes = 1
+        vecs = np.array([image.imvec for image in images])
+    vecs = vecs.reshape(-1, npix)
+
+    #visibilities from FFT
+    if ttype=="fast":
+
+        # Pad images
+        npad = fft_pad_factor * np.max((im.xdim, im.ydim))
+        npad = power_of_two(npad)
+
+        padvalx1 = padvalx2 = int(np.floor((npad - im.xdim)/2.0))
+        if im.xdim % 2:
+            padvalx2 += 1
+        padvaly1 = padvaly2 = int(np.floor((npad - im.ydim)/2.0))
+        if im.ydim % 2:
+            padvaly2 += 1
+
+        imarrs = vecs.reshape(-1, im.ydim, im.xdim)
+        imarrs = np.pad(imarrs, ((0,0),(padvalx1,padvalx2),(padvaly1,padvaly2)), 'constant', constant_values=0.0)
+        npad = imarrs.shape[1]
+        if imarrs.shape[1]!=imarrs.shape[2]:
+            raise Exception("FFT padding did not return a square image!")
+
+        # Scaled uv points
+        du = 1.0/(npad*im.psize)
+        uv2 = np.hstack((uv[:,1].reshape(-1,1), uv[:,0].reshape(-1,1)))
+        uv2 = (uv2/du + 0.5*npad).T
+
+        # Batched FFT of all images
+        vis_ims = np.fft.fftshift(np.fft.fft2(np.fft.ifftshift(imarrs, axes=(-2,-1))), axes=(-2,-1))
+
+        # Sample the visibilities
+        vis = np.empty((len(vis_ims), len(uv)), dtype='c16')
+        for (i, vis_im) in enumerate(vis_ims):
+            vis[i] = nd.map_coordinates(np.real(vis_im), uv2) + 1j*nd.map_coordinates(np.imag(vis_im), uv2)
+
+        vis *= pulse_factors(uv, im.psize, im.pulse, im.xdim, im.ydim)
+
+    #visibilities from NFFT
+    elif ttype=="nfft":
+
+        if (im.xdim%2 or im.ydim%2):
+            raise Exception("NFFT doesn't work with odd image dimensions!")
+
+        npad = fft_pad_factor * np.max((im.xdim, im.ydim))
+
+        nker = np.floor(np.min((im.xdim,im.ydim))/5)
+        if (nker>50):
+            nker = 50
+        elif (im.xdim<50 or im.ydim<50):
+            nker = np.min((im.xdim,im.ydim))/2
+        plan = NFFT([im.xdim,im.ydim], len(uv), m=nker, n=[npad,npad])
+
+        # one plan for all images
+        plan.x = uv*im.psize
+        plan.precompute()
+
+        vis = np.empty((len(vecs), len(uv)), dtype='c16')
+        for (i, vec) in enumerate(vecs):
+            plan.f_hat = vec.copy().reshape((im.ydim,im.xdim)).T
+            plan.trafo()
+            vis[i] = plan.f
+
+        vis *= pulse_factors(uv, im.psize, im.pulse, im.xdim, im.ydim)
+
+    #visibilities from DFT
+    else:
+        mat = ftoperator_cached(im.psize, im.xdim, im.ydim, uv, pulse=im.pulse)
+        if isinstance(mat, DFTOperator):
+            vis = mat.matmat(vecs)
+        else:
+            vis = np.dot(vecs, mat.T)
+
+    # Scatter the visibilities with the SgrA* kernel
+    if sgrscat:
+        print('Scattering Visibilities with Sgr A* kernel!')
+        vis *= sgra_kernel_uv(im.rf, uv[:,0], uv[:,1])
+
+    if polarized:
+        return vis.reshape(len(images), nstokes, len(uv))
+    else:
+        return vis
+
 def observe_movie_nonoise(mov, obs, sgrscat=False, ttype="direct", fft_pad_factor=1, repeat=False):
 
     """Observe a movie on the same baselines as an existing observation object with no noise.
@@ -466,8 +622,7 @@ def observe_movie_nonoise(mov, obs, sgrscat=False, ttype="direct", fft_pad_facto
             vis = vis * phase
 
             # Multiply by the pulse function
-            # TODO make faster?
-            pulsefac = np.array([mov.pulse(2*np.pi*uvpt[0], 2*np.pi*uvpt[1], mov.psize, dom="F") for uvpt in uv])
+            pulsefac = mov.pulse(2*np.pi*uv[:,0], 2*np.pi*uv[:,1], mov.psize, dom="F")
             vis = vis * pulsefac
 
             if len(mov.qframes):
@@ -525,26 +680,25 @@ def observe_movie_nonoise(mov, obs, sgrscat=False, ttype="direct", fft_pad_facto
             plan.precompute()
 
             #phase and pulsefac
-            phase = np.exp(-1j*np.pi*(uvlist[:,0] + uvlist[:,1]))
-            pulsefac = np.array([mov.pulse(2*np.pi*uvlist[i,0], 2*np.pi*uvlist[i,1], 1., dom="F") for i in xrange(uvdim)])
+            pulsefac = pulse_factors(uv, mov.psize, mov.pulse, mov.xdim, mov.ydim)
 
             #compute uniform --> nonuniform transform
             plan.f_hat = mov.frames[n].copy().reshape((mov.ydim,mov.xdim)).T
             plan.trafo()
-            vis = plan.f.copy()*phase*pulsefac
+            vis = plan.f.copy()*pulsefac
 
             if len(mov.qframes):
                 plan.f_hat = mov.qframes[n].copy().reshape((mov.ydim,mov.xdim)).T
                 plan.trafo()
-                qvis = plan.f.copy()*phase*pulsefac
+                qvis = plan.f.copy()*pulsefac
 
                 plan.f_hat = mov.uframes[n].copy().reshape((mov.ydim,mov.xdim)).T
                 plan.trafo()
-                uvis = plan.f.copy()*phase*pulsefac
+                uvis = plan.f.copy()*pulsefac
             if len(mov.vframes):
                 plan.f_hat = mov.vframes[n].copy().reshape((mov.ydim,mov.xdim)).T
                 plan.trafo()
-                vvis = plan.f.copy()*phase*pulsefac
+                vvis = plan.f.copy()*pulsefac
 
         #visibilities from DFT
         else:
@@ -559,11 +713,10 @@ def observe_movie_nonoise(mov, obs, sgrscat=False, ttype="direct", fft_pad_facto
 
         # Scatter the visibilities with the SgrA* kernel
         if sgrscat:
-            for i in range(len(vis)):
-                ker = sgra_kernel_uv(mov.rf, uv[i,0], uv[i,1])
-                vis[i]  *= ker
-                qvis[i] *= ker
-                uvis[i] *= ker
+            ker = sgra_kernel_uv(mov.rf, uv[:,0], uv[:,1])
+            vis  = vis*ker
+            qvis = qvis*ker
+            uvis = uvis*ker
 
         # Put the visibilities back in the obsdata array
         obsdata['vis'] = vis
@@ -582,6 +735,41 @@ def observe_movie_nonoise(mov, obs, sgrscat=False, ttype="direct", fft_pad_facto
 # Noise + miscalibration funcitons
 ##################################################################################################
 
+def scan_taus(obs):
+    """Return the unique times of obs and the (nsite, ntime) array of opacities of every site in each scan.
+       Each site takes the tau of its first appearance in the scan; sites without data have tau = 0.
+    """
+
+    data = obs.data
+    order = np.argsort(data['time'], kind='mergesort')
+    (times, time_idx) = np.unique(data['time'][order], return_inverse=True)
+
+    # every (site, tau) in data order, t1 before t2 on each row
+    sites = np.vstack((data['t1'][order], data['t2'][order])).T.ravel()
+    taus_all = np.vstack((data['tau1'][order], data['tau2'][order])).T.ravel()
+    time_idx = np.repeat(time_idx, 2)
+    (names, site_idx) = np.unique(sites, return_inverse=True)
+    site_idx = np.array([obs.tkey[name] for name in names], dtype=int)[site_idx]
+
+    # keep the first appearance of each site in each scan
+    key = site_idx*len(times) + time_idx
+    first = np.unique(key, return_index=True)[1]
+    taus = np.zeros((len(obs.tarr), len(times)))
+    taus[site_idx[first], time_idx[first]] = taus_all[first]
+
+    return (times, taus)
+
+def jones_keys(obs, obsdata):
+    """Return the unique time index and the tarr indices of both sites of every data point,
+       for indexing the arrays returned by make_jones and make_jones_inverse.
+    """
+
+    time_idx = np.unique(obsdata['time'], return_inverse=True)[1]
+    (names, site_idx) = np.unique(np.hstack((obsdata['t1'], obsdata['t2'])), return_inverse=True)
+    site_idx = np.array([obs.tkey[name] for name in names], dtype=int)[site_idx]
+
+    return (time_idx, site_idx[:len(obsdata)], site_idx[len(obsdata):])
+
 def make_jones(obs,  opacitycal=True, ampcal=True, phasecal=True, dcal=True, frcal=True, 
                taup=GAINPDEF, gainp=GAINPDEF, gain_offset=GAINPDEF,  
                dtermp=DTERMPDEF, dterm_offset=DTERMPDEF,
@@ -604,39 +792,17 @@ def make_jones(obs,  opacitycal=True, ampcal=True, phasecal=True, dcal=True, frc
            seed : a seed for the random number generators, uses system time if false
 
        Returns:
-           (dict): a nested dictionary of matrices indexed by the site, then by the time
+           (numpy.ndarray): a (nsite, ntime, 2, 2) array of matrices indexed by the tarr row, then by the unique time
     """
 
-    tlist = obs.tlist()
     tarr = obs.tarr
     ra = obs.ra
     dec = obs.dec
     sourcevec = np.array([np.cos(dec*DEGREE), 0, np.sin(dec*DEGREE)])
     tproc = str(ttime.time())
 
-    # Create a dictionary of taus and a list of unique times
-    nsites = len(obs.tarr['site'])
-    taudict = {site : np.array([]) for site in obs.tarr['site']}
-    times = np.array([])
-    for scan in tlist:
-        time = scan['time'][0]
-        times = np.append(times, time)
-        sites_in = np.array([])
-        for bl in scan:
-            # Should we screen for conflicting same-time measurements of tau?
-            if len(sites_in) >= nsites: break
-
-            if (not len(sites_in)) or (not bl['t1'] in sites_in):
-                taudict[bl['t1']] = np.append(taudict[bl['t1']], bl['tau1'])
-                sites_in = np.append(sites_in, bl['t1'])
-
-            if (not len(sites_in)) or (not bl['t2'] in sites_in):
-                taudict[bl['t2']] = np.append(taudict[bl['t2']], bl['tau2'])
-                sites_in = np.append(sites_in, bl['t2'])
-        if len(sites_in) < nsites:
-            for site in obs.tarr['site']:
-                if site not in sites_in:
-                    taudict[site] = np.append(taudict[site], 0.0)
+    # Get the unique times and the opacity of every site in each scan
+    (times, taus) = scan_taus(obs)
 
     # Compute Sidereal Times
     if obs.timetype=='GMST':
@@ -649,7 +815,7 @@ def make_jones(obs,  opacitycal=True, ampcal=True, phasecal=True, dcal=True, frc
         seed=str(ttime.time())
 
     # Generate Jones Matrices at each time for each telescope
-    out = {}
+    out = np.empty((len(tarr), len(times), 2, 2), dtype=np.complex128)
     for i in range(len(tarr)):
         site = tarr[i]['site']
         coords = np.array([tarr[i]['x'],tarr[i]['y'],tarr[i]['z']])
@@ -671,22 +837,22 @@ def make_jones(obs,  opacitycal=True, ampcal=True, phasecal=True, dcal=True, frc
             else:
                 goff = gain_offset
 
-            gainR = np.sqrt(np.abs(np.array([(1.0 +  goff*hashrandn(site,'gainR',str(goff), seed))*(1.0 + gainp * hashrandn(site, 'gainR', time, str(gainp), seed))
-                                     for time in times]))) 
-            gainL = np.sqrt(np.abs(np.array([(1.0 +  goff*hashrandn(site,'gainL',str(goff), seed))*(1.0 + gainp * hashrandn(site, 'gainL', time, str(gainp), seed))
-                                     for time in times])))
+            gainR = np.sqrt(np.abs((1.0 + goff*hashrandn(site, 'gainR', str(goff), seed)) *
+                                   (1.0 + gainp*hashrandn_array(len(times), site, 'gainR', str(gainp), seed))))
+            gainL = np.sqrt(np.abs((1.0 + goff*hashrandn(site, 'gainL', str(goff), seed)) *
+                                   (1.0 + gainp*hashrandn_array(len(times), site, 'gainL', str(gainp), seed))))
 
         # Opacity attenuation of amplitude gain
         if not opacitycal:
-            taus = np.abs(np.array([taudict[site][j] * (1.0 + taup * hashrandn(site, 'tau', times[j], seed)) for j in range(len(times))]))
-            atten = np.exp(-taus/(EP + 2.0*np.sin(el_angles)))
+            taus_site = np.abs(taus[i] * (1.0 + taup*hashrandn_array(len(times), site, 'tau', seed)))
+            atten = np.exp(-taus_site/(EP + 2.0*np.sin(el_angles)))
 
             gainR = gainR * atten
             gainL = gainL * atten
 
         # Atmospheric Phase
         if not phasecal:
-            phase = np.array([2 * np.pi * hashrand(site, 'phase', time, seed) for time in times])
+            phase = 2 * np.pi * hashrand_array(len(times), site, 'phase', seed)
             gainR = gainR * np.exp(1j*phase)
             gainL = gainL * np.exp(1j*phase)
 
@@ -713,16 +879,12 @@ def make_jones(obs,  opacitycal=True, ampcal=True, phasecal=True, dcal=True, frc
         if not frcal:
             fr_angle = tarr[i]['fr_elev']*el_angles + tarr[i]['fr_par']*par_angles + tarr[i]['fr_off']*DEGREE
 
-        # Assemble the Jones Matrices and save to dictionary
+        # Assemble the Jones Matrices
         # TODO: indexed by utc or sideral time?
-        j_matrices = {times[j]: np.array([
-                                [np.exp(-1j*fr_angle[j])*gainR[j], np.exp(1j*fr_angle[j])*dR*gainR[j]],
-                                [np.exp(-1j*fr_angle[j])*dL*gainL[j], np.exp(1j*fr_angle[j])*gainL[j]]
-                                ])
-                                for j in range(len(times))
-                     }
-
-        out[site] = j_matrices
+        out[i,:,0,0] = np.exp(-1j*fr_angle)*gainR
+        out[i,:,0,1] = np.exp(1j*fr_angle)*dR*gainR
+        out[i,:,1,0] = np.exp(-1j*fr_angle)*dL*gainL
+        out[i,:,1,1] = np.exp(1j*fr_angle)*gainL
 
     return out
 
@@ -737,40 +899,17 @@ def make_jones_inverse(obs, opacitycal=True, dcal=True, frcal=True):
            frcal (bool): if False, inverse feed rotation angle terms are applied to Jones matrices. 
 
        Returns:
-           (dict): a nested dictionary of matrices indexed by the site, then by the time
+           (numpy.ndarray): a (nsite, ntime, 2, 2) array of matrices indexed by the tarr row, then by the unique time
     """
 
     # Get data
-    tlist = obs.tlist()
     tarr = obs.tarr
     ra = obs.ra
     dec = obs.dec
     sourcevec = np.array([np.cos(dec*DEGREE), 0, np.sin(dec*DEGREE)])
 
-    # Create a dictionary of taus and a list of unique times
-    nsites = len(obs.tarr['site'])
-    taudict = {site : np.array([]) for site in obs.tarr['site']}
-    times = np.array([])
-    for scan in tlist:
-        time = scan['time'][0]
-        times = np.append(times, time)
-        sites_in = np.array([])
-        for bl in scan:
-
-            # Should we screen for conflicting same-time measurements of tau?
-            if len(sites_in) >= nsites: break
-
-            if (not len(sites_in)) or (not bl['t1'] in sites_in):
-                taudict[bl['t1']] = np.append(taudict[bl['t1']], bl['tau1'])
-                sites_in = np.append(sites_in, bl['t1'])
-
-            if (not len(sites_in)) or (not bl['t2'] in sites_in):
-                taudict[bl['t2']] = np.append(taudict[bl['t2']], bl['tau2'])
-                sites_in = np.append(sites_in, bl['t2'])
-        if len(sites_in) < nsites:
-            for site in obs.tarr['site']:
-                if site not in sites_in:
-                    taudict[site] = np.append(taudict[site], 0.0)
+    # Get the unique times and the opacity of every site in each scan
+    (times, taus) = scan_taus(obs)
 
     # Compute Sidereal Times
     if obs.timetype=='GMST':
@@ -779,7 +918,7 @@ def make_jones_inverse(obs, opacitycal=True, dcal=True, frcal=True):
         times_sid = utc_to_gmst(times, obs.mjd)
 
     # Make inverse Jones Matrices
-    out = {}
+    out = np.empty((len(tarr), len(times), 2, 2), dtype=np.complex128)
     for i in range(len(tarr)):
         site = tarr[i]['site']
         coords = np.array([tarr[i]['x'],tarr[i]['y'],tarr[i]['z']])
@@ -798,8 +937,7 @@ def make_jones_inverse(obs, opacitycal=True, dcal=True, frcal=True):
 
         # Opacity attenuation of amplitude gain
         if not opacitycal:
-            taus = np.abs(np.array(taudict[site]))
-            atten = np.exp(-taus/(EP + 2.0*np.sin(el_angles)))
+            atten = np.exp(-np.abs(taus[i])/(EP + 2.0*np.sin(el_angles)))
 
             gainR = gainR * atten
             gainL = gainL * atten
@@ -816,15 +954,12 @@ def make_jones_inverse(obs, opacitycal=True, dcal=True, frcal=True):
             # Total Angle (Radian)
             fr_angle = tarr[i]['fr_elev']*el_angles + tarr[i]['fr_par']*par_angles + tarr[i]['fr_off']*DEGREE
 
-        # Assemble the Jones Matrices and save to dictionary
+        # Assemble the Jones Matrices
         pref = 1.0/(gainL*gainR*(1.0 - dL*dR))
-        j_matrices_inv = {times[j]: pref[j]*np.array([
-                                     [np.exp(1j*fr_angle[j])*gainL[j], -np.exp(1j*fr_angle[j])*dR*gainR[j]],
-                                     [-np.exp(-1j*fr_angle[j])*dL*gainL[j], np.exp(-1j*fr_angle[j])*gainR[j]]
-                                     ]) for j in range(len(times))
-                         }
-
-        out[site] = j_matrices_inv
+        out[i,:,0,0] = pref*np.exp(1j*fr_angle)*gainL
+        out[i,:,0,1] = -pref*np.exp(1j*fr_angle)*dR*gainR
+        out[i,:,1,0] = -pref*np.exp(-1j*fr_angle)*dL*gainL
+        out[i,:,1,1] = pref*np.exp(-1j*fr_angle)*gainR
 
     return out
 
@@ -858,7 +993,7 @@ def add_jones_and_noise(obs, add_th_noise=True,
 
     print("Applying Jones Matrices to data . . . ")
     # Build Jones Matrices
-    jm_dict = make_jones(obs,
+    jones = make_jones(obs,
                          ampcal=ampcal, opacitycal=opacitycal, phasecal=phasecal,dcal=dcal,frcal=frcal,
                          gainp=gainp, taup=taup, gain_offset=gain_offset, dtermp=dtermp, dterm_offset=dterm_offset,
                          seed=seed)
@@ -868,22 +1003,20 @@ def add_jones_and_noise(obs, add_th_noise=True,
     else:
         obsdata = obs.data
 
-    times = obsdata['time']
-    t1 = obsdata['t1']
-    t2 = obsdata['t2']
-    tints = obsdata['tint']
+    (time_idx, i1, i2) = jones_keys(obs, obsdata)
 
     # Visibility Data
-    rr = obsdata['vis'] + obsdata['vvis']
-    ll = obsdata['vis'] - obsdata['vvis']
-    rl = obsdata['qvis'] + 1j*obsdata['uvis']
-    lr = obsdata['qvis'] - 1j*obsdata['uvis']
+    corr_matrix = np.empty((len(obsdata), 2, 2), dtype=np.complex128)
+    corr_matrix[:,0,0] = obsdata['vis'] + obsdata['vvis']
+    corr_matrix[:,1,1] = obsdata['vis'] - obsdata['vvis']
+    corr_matrix[:,0,1] = obsdata['qvis'] + 1j*obsdata['uvis']
+    corr_matrix[:,1,0] = obsdata['qvis'] - 1j*obsdata['uvis']
 
     # Recompute the noise std. deviations from the SEFDs
-    sig_rr = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdr'], obs.tarr[obs.tkey[t2[i]]]['sefdr'], tints[i], obs.bw) for i in range(len(rr))])
-    sig_ll = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdl'], obs.tarr[obs.tkey[t2[i]]]['sefdl'], tints[i], obs.bw) for i in range(len(ll))])
-    sig_rl = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdr'], obs.tarr[obs.tkey[t2[i]]]['sefdl'], tints[i], obs.bw) for i in range(len(rl))])
-    sig_lr = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdl'], obs.tarr[obs.tkey[t2[i]]]['sefdr'], tints[i], obs.bw) for i in range(len(lr))])
+    sig_rr = blnoise(obs.tarr['sefdr'][i1], obs.tarr['sefdr'][i2], obsdata['tint'], obs.bw)
+    sig_ll = blnoise(obs.tarr['sefdl'][i1], obs.tarr['sefdl'][i2], obsdata['tint'], obs.bw)
+    sig_rl = blnoise(obs.tarr['sefdr'][i1], obs.tarr['sefdl'][i2], obsdata['tint'], obs.bw)
+    sig_lr = blnoise(obs.tarr['sefdl'][i1], obs.tarr['sefdr'][i2], obsdata['tint'], obs.bw)
 
     #print "------------------------------------------------------------------------------------------------------------------------"
     if not opacitycal:
@@ -900,33 +1033,28 @@ def add_jones_and_noise(obs, add_th_noise=True,
         print("Adding thermal noise to data . . . ")
     #print "------------------------------------------------------------------------------------------------------------------------"
 
-    # Corrupt each IQUV visibilty set with the jones matrices and add noise
-    for i in range(len(times)):
-        # Form the visibility correlation matrix
-        corr_matrix = np.array([[rr[i], rl[i]], [lr[i], ll[i]]])
-
-        # Get the jones matrices and corrupt the corr_matrix
-        j1 = jm_dict[t1[i]][times[i]]
-        j2 = jm_dict[t2[i]][times[i]]
-
-        corr_matrix_corrupt = np.dot(j1, np.dot(corr_matrix, np.conjugate(j2.T)))
+    # Corrupt each IQUV visibilty set with the jones matrices
+    j1 = jones[i1, time_idx]
+    j2 = jones[i2, time_idx]
+    corr_matrix_corrupt = np.einsum('nij,njk,nlk->nil', j1, corr_matrix, j2.conj())
 
-        # Add noise
-        if add_th_noise:
-            noise_matrix = np.array([[cerror(sig_rr[i]), cerror(sig_rl[i])], [cerror(sig_lr[i]), cerror(sig_ll[i])]])
-            corr_matrix_corrupt += noise_matrix
-
-        # Put the corrupted data back into the data table
-        obsdata['vis'][i]  = 0.5*(corr_matrix_corrupt[0][0] + corr_matrix_corrupt[1][1])
-        obsdata['vvis'][i] = 0.5*(corr_matrix_corrupt[0][0] - corr_matrix_corrupt[1][1])
-        obsdata['qvis'][i] = 0.5*(corr_matrix_corrupt[0][1] + corr_matrix_corrupt[1][0])
-        obsdata['uvis'][i] = -0.5j*(corr_matrix_corrupt[0][1] - corr_matrix_corrupt[1][0])
-
-        # Put the recomputed sigmas back into the data table
-        obsdata['sigma'][i] = 0.5*np.sqrt(sig_rr[i]**2 + sig_ll[i]**2)
-        obsdata['vsigma'][i] = 0.5*np.sqrt(sig_rr[i]**2 + sig_ll[i]**2)
-        obsdata['qsigma'][i] = 0.5*np.sqrt(sig_rl[i]**2 + sig_lr[i]**2)
-        obsdata['usigma'][i] = 0.5*np.sqrt(sig_rl[i]**2 + sig_lr[i]**2)
+    # Add noise, drawn in the same order as one cerror() call per matrix element and data point
+    if add_th_noise:
+        sig_matrix = np.array([[sig_rr, sig_rl], [sig_lr, sig_ll]]).transpose(2,0,1)
+        noise = np.random.normal(loc=0, scale=1, size=(len(obsdata), 2, 2, 2))
+        corr_matrix_corrupt += sig_matrix * (noise[...,0] + 1j*noise[...,1])
+
+    # Put the corrupted data back into the data table
+    obsdata['vis']  = 0.5*(corr_matrix_corrupt[:,0,0] + corr_matrix_corrupt[:,1,1])
+    obsdata['vvis'] = 0.5*(corr_matrix_corrupt[:,0,0] - corr_matrix_corrupt[:,1,1])
+    obsdata['qvis'] = 0.5*(corr_matrix_corrupt[:,0,1] + corr_matrix_corrupt[:,1,0])
+    obsdata['uvis'] = -0.5j*(corr_matrix_corrupt[:,0,1] - corr_matrix_corrupt[:,1,0])
+
+    # Put the recomputed sigmas back into the data table
+    obsdata['sigma'] = 0.5*np.sqrt(sig_rr**2 + sig_ll**2)
+    obsdata['vsigma'] = 0.5*np.sqrt(sig_rr**2 + sig_ll**2)
+    obsdata['qsigma'] = 0.5*np.sqrt(sig_rl**2 + sig_lr**2)
+    obsdata['usigma'] = 0.5*np.sqrt(sig_rl**2 + sig_lr**2)
 
     # Return observation data
     return obsdata
@@ -947,30 +1075,28 @@ def apply_jones_inverse(obs, opacitycal=True, dcal=True, frcal=True, deepcopy=Tr
 
     print("Applying a priori calibration with estimated Jones matrices . . . ")
     # Build Inverse Jones Matrices
-    jm_dict = make_jones_inverse(obs, opacitycal=opacitycal, dcal=dcal, frcal=frcal)
+    jones_inv = make_jones_inverse(obs, opacitycal=opacitycal, dcal=dcal, frcal=frcal)
 
     # Unpack Data
     if deepcopy:
         obsdata = copy.deepcopy(obs.data)
     else:
         obsdata = obs.data
-    times = obsdata['time']
-    t1 = obsdata['t1']
-    t2 = obsdata['t2']
-    tints = obsdata['tint']
+    (time_idx, i1, i2) = jones_keys(obs, obsdata)
 
     # Visibility Data
-    rr = obsdata['vis'] + obsdata['vvis']
-    ll = obsdata['vis'] - obsdata['vvis']
-    rl = obsdata['qvis'] + 1j*obsdata['uvis']
-    lr = obsdata['qvis'] - 1j*obsdata['uvis']
+    corr_matrix = np.empty((len(obsdata), 2, 2), dtype=np.complex128)
+    corr_matrix[:,0,0] = obsdata['vis'] + obsdata['vvis']
+    corr_matrix[:,1,1] = obsdata['vis'] - obsdata['vvis']
+    corr_matrix[:,0,1] = obsdata['qvis'] + 1j*obsdata['uvis']
+    corr_matrix[:,1,0] = obsdata['qvis'] - 1j*obsdata['uvis']
 
     # Recompute the noise std. deviations from the SEFDs
     #!AC should we instead get them from the file?
-    sig_rr = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdr'], obs.tarr[obs.tkey[t2[i]]]['sefdr'], tints[i], obs.bw) for i in range(len(rr))])
-    sig_ll = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdl'], obs.tarr[obs.tkey[t2[i]]]['sefdl'], tints[i], obs.bw) for i in range(len(ll))])
-    sig_rl = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdr'], obs.tarr[obs.tkey[t2[i]]]['sefdl'], tints[i], obs.bw) for i in range(len(rl))])
-    sig_lr = np.array([blnoise(obs.tarr[obs.tkey[t1[i]]]['sefdl'], obs.tarr[obs.tkey[t2[i]]]['sefdr'], tints[i], obs.bw) for i in range(len(lr))])
+    sig_rr = blnoise(obs.tarr['sefdr'][i1], obs.tarr['sefdr'][i2], obsdata['tint'], obs.bw)
+    sig_ll = blnoise(obs.tarr['sefdl'][i1], obs.tarr['sefdl'][i2], obsdata['tint'], obs.bw)
+    sig_rl = blnoise(obs.tarr['sefdr'][i1], obs.tarr['sefdl'][i2], obsdata['tint'], obs.bw)
+    sig_lr = blnoise(obs.tarr['sefdl'][i1], obs.tarr['sefdr'][i2], obsdata['tint'], obs.bw)
 
     ampcal = obs.ampcal
     phasecal = obs.phasecal
@@ -986,45 +1112,31 @@ def apply_jones_inverse(obs, opacitycal=True, dcal=True, frcal=True, deepcopy=Tr
         frcal=True
     #print "------------------------------------------------------------------------------------------------------------------------"
 
-    # Apply the inverse Jones matrices to each visibility
-    for i in range(len(times)):
-        # Get the inverse jones matrices
-        inv_j1 = jm_dict[t1[i]][times[i]]
-        inv_j2 = jm_dict[t2[i]][times[i]]
-
-        # Form the visibility correlation matrix
-        corr_matrix = np.array([[rr[i], rl[i]], [lr[i], ll[i]]])
-
-        # Form the sigma matrices
-        sig_rr_matrix = np.array([[sig_rr[i], 0.0], [0.0, 0.0]])
-        sig_ll_matrix = np.array([[0.0, 0.0], [0.0, sig_ll[i]]])
-        sig_rl_matrix = np.array([[0.0, sig_rl[i]], [0.0, 0.0]])
-        sig_lr_matrix = np.array([[0.0, 0.0], [sig_lr[i], 0.0]])
-
-        # Apply the Jones Matrices to the visibility correlation matrix and sigma matrices
-        corr_matrix_new = np.dot(inv_j1, np.dot(corr_matrix, np.conjugate(inv_j2.T)))
-
-        sig_rr_matrix_new = np.dot(inv_j1, np.dot(sig_rr_matrix, np.conjugate(inv_j2.T)))
-        sig_ll_matrix_new = np.dot(inv_j1, np.dot(sig_ll_matrix, np.conjugate(inv_j2.T)))
-        sig_rl_matrix_new = np.dot(inv_j1, np.dot(sig_rl_matrix, np.conjugate(inv_j2.T)))
-        sig_lr_matrix_new = np.dot(inv_j1, np.dot(sig_lr_matrix, np.conjugate(inv_j2.T)))
-
-        # TODO is this correct?
-        # Get the final sigma matrix as a quadrature sum
-        sig_matrix_new = np.sqrt(np.abs(sig_rr_matrix_new)**2 + np.abs(sig_ll_matrix_new)**2 +
-                                 np.abs(sig_rl_matrix_new)**2 + np.abs(sig_lr_matrix_new)**2)
-
-        # Put the data back into the data table
-        obsdata['vis'][i]  = 0.5*(corr_matrix_new[0][0] + corr_matrix_new[1][1])
-        obsdata['vvis'][i] = 0.5*(corr_matrix_new[0][0] - corr_matrix_new[1][1])
-        obsdata['qvis'][i] = 0.5*(corr_matrix_new[0][1] + corr_matrix_new[1][0])
-        obsdata['uvis'][i] = -0.5j*(corr_matrix_new[0][1] - corr_matrix_new[1][0])
-
-        # Put the recomputed sigmas back into the data table
-        obsdata['sigma'][i] = 0.5*np.sqrt(sig_matrix_new[0][0]**2 + sig_matrix_new[1][1]**2)
-        obsdata['vsigma'][i] = 0.5*np.sqrt(sig_matrix_new[0][0]**2 + sig_matrix_new[1][1]**2)
-        obsdata['qsigma'][i] = 0.5*np.sqrt(sig_matrix_new[0][1]**2 + sig_matrix_new[1][0]**2)
-        obsdata['usigma'][i] = 0.5*np.sqrt(sig_matrix_new[0][1]**2 + sig_matrix_new[1][0]**2)
+    # Apply the inverse Jones matrices to all visibilities
+    inv_j1 = jones_inv[i1, time_idx]
+    inv_j2 = jones_inv[i2, time_idx]
+    corr_matrix_new = np.einsum('nij,njk,nlk->nil', inv_j1, corr_matrix, inv_j2.conj())
+
+    # The sigma matrices have one nonzero element (a,b), so inv_j1 sig inv_j2^H = sig * outer(inv_j1[:,a], conj(inv_j2[:,b]))
+    def sig_new(sig, a, b):
+        return sig[:,None,None] * inv_j1[:,:,a,None] * inv_j2[:,None,:,b].conj()
+
+    # TODO is this correct?
+    # Get the final sigma matrix as a quadrature sum
+    sig_matrix_new = np.sqrt(np.abs(sig_new(sig_rr, 0, 0))**2 + np.abs(sig_new(sig_ll, 1, 1))**2 +
+                             np.abs(sig_new(sig_rl, 0, 1))**2 + np.abs(sig_new(sig_lr, 1, 0))**2)
+
+    # Put the data back into the data table
+    obsdata['vis']  = 0.5*(corr_matrix_new[:,0,0] + corr_matrix_new[:,1,1])
+    obsdata['vvis'] = 0.5*(corr_matrix_new[:,0,0] - corr_matrix_new[:,1,1])
+    obsdata['qvis'] = 0.5*(corr_matrix_new[:,0,1] + corr_matrix_new[:,1,0])
+    obsdata['uvis'] = -0.5j*(corr_matrix_new[:,0,1] - corr_matrix_new[:,1,0])
+
+    # Put the recomputed sigmas back into the data table
+    obsdata['sigma'] = 0.5*np.sqrt(sig_matrix_new[:,0,0]**2 + sig_matrix_new[:,1,1]**2)
+    obsdata['vsigma'] = 0.5*np.sqrt(sig_matrix_new[:,0,0]**2 + sig_matrix_new[:,1,1]**2)
+    obsdata['qsigma'] = 0.5*np.sqrt(sig_matrix_new[:,0,1]**2 + sig_matrix_new[:,1,0]**2)
+    obsdata['usigma'] = 0.5*np.sqrt(sig_matrix_new[:,0,1]**2 + sig_matrix_new[:,1,0]**2)
 
     # Return observation data
     return obsdata
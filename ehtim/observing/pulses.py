@@ -27,10 +27,9 @@ import scipy.special as spec
 
 def deltaPulse2D(x, y, pdim, dom='F'):
     if dom=='I':
-        if x==y==0.0: return 1.0
-        else: return 0.0
+        return np.where((x==0.0) * (y==0.0), 1.0, 0.0)
     elif dom=='F':
-        return 1.0
+        return np.ones(np.broadcast(x, y).shape)
 
 def rectPulse2D(x, y, pdim, dom='F'):
     if dom=='I':
@@ -39,16 +38,11 @@ def rectPulse2D(x, y, pdim, dom='F'):
         return rectPulse_F(x, pdim) * rectPulse_F(y,pdim)
 
 def rectPulse_I(x, pdim):
-    if abs(x) >= pdim/2.0:
-        return 0.0
-    else:
-        return 1.0/pdim
+    return np.where(np.abs(x) >= pdim/2.0, 0.0, 1.0/pdim)
 
 def rectPulse_F(omega, pdim):
-    if (omega == 0):
-        return 1.0
-    else:
-        return (2.0/(pdim*omega)) * math.sin((pdim*omega)/2.0)
+    # (2/(pdim*omega)) * sin(pdim*omega/2), with the limit 1 at omega=0
+    return np.sinc((pdim*omega)/(2.0*np.pi))
 
 def trianglePulse2D(x, y, pdim, dom='F'):
     if dom=='I':
@@ -58,15 +52,11 @@ def trianglePulse2D(x, y, pdim, dom='F'):
         return trianglePulse_F(x, pdim)*trianglePulse_F(y, pdim)
 
 def trianglePulse_I(x, pdim):
-    if abs(x) > pdim: return 0.0
-    else: return -(1.0/(pdim**2))*abs(x) + 1.0/pdim
+    return np.where(np.abs(x) > pdim, 0.0, -(1.0/(pdim**2))*np.abs(x) + 1.0/pdim)
 
 def trianglePulse_F(omega, pdim):
-    if (omega == 0):
-        return 1.0
-    else:
-        return (4.0/(pdim**2 * omega**2)) * ( math.sin (( pdim * omega )/2.0) )**2
-
+    # (4/(pdim**2 * omega**2)) * sin(pdim*omega/2)**2, with the limit 1 at omega=0
+    return np.sinc((pdim*omega)/(2.0*np.pi))**2
 
 # def cubicsplinePulse2D_F(omegaX, omegaY, pdim):
 #       return cubicsplinePulse(omegaX, pdim)*cubicsplinePulse(omegaY,pdim)
@@ -109,15 +99,15 @@ def cubicPulse2D(x, y, pdim, dom='F'):
         return cubicPulse_F(x, pdim)*cubicPulse_F(y, pdim)
 
 def cubicPulse_I(x, pdim):
-    if abs(x) < pdim: return (1.5*(abs(x)/pdim)**3 - 2.5*(x/pdim)**2 +1.)/pdim
-    elif  abs(abs(x)-1.5*pdim) <= 0.5*pdim: return (-0.5*(abs(x)/pdim)**3 + 2.5*(x/pdim)**2 - 4.*(abs(x)/pdim) +2.)/pdim
-    else: return 0.
+    ax = np.abs(x)/pdim
+    return np.where(ax < 1., (1.5*ax**3 - 2.5*ax**2 + 1.)/pdim,
+                    np.where(np.abs(ax - 1.5) <= 0.5, (-0.5*ax**3 + 2.5*ax**2 - 4.*ax + 2.)/pdim, 0.))
 
 def cubicPulse_F(omega, pdim):
-    if (omega == 0):
-        return 1.0
-    else:
-        return 2.*((3./omega/pdim)*math.sin(omega*pdim/2.)-math.cos(omega*pdim/2.))*((2./omega/pdim)*math.sin(omega*pdim/2.))**3
+    # 2*((3/(omega*pdim))*sin(omega*pdim/2) - cos(omega*pdim/2))*((2/(omega*pdim))*sin(omega*pdim/2))**3,
+    # with the limit 1 at omega=0
+    sincfac = np.sinc((pdim*omega)/(2.0*np.pi))
+    return (3.*sincfac - 2.*np.cos(omega*pdim/2.)) * sincfac**3
 
 
 
@@ -129,12 +119,7 @@ def sincPulse2D(x, y, pdim, dom='F'):
         return sincPulse_F(x, pdim) * sincPulse_F(y, pdim)
 
 def sincPulse_I(x, pdim):
-    if (x == 0):
-        return 1./pdim
-    else: return (1./pdim)*math.sin(np.pi*x/pdim)/(np.pi*x/pdim)
+    return (1./pdim)*np.sinc(x/pdim)
 
 def sincPulse_F(omega, pdim):
-    if (abs(omega) < np.pi/pdim):
-        return 1.0
-    else:
-        return 0.
+    return np.where(np.abs(omega) < np.pi/pdim, 1.0, 0.)
@@ -0,0 +1,43 @@
+import os
+
+import numpy as np
+import pytest
+
+import ehtim as eh
+from ..observing import obs_simulate as simobs
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..')
+
+@pytest.fixture(scope='session')
+def make_obs():
+    """Return a function that observes the Sgr A* model with EHT2017 and returns the image and the observation,
+       with the gain errors and thermal noise drawn from a fixed seed.
+       Each observation is simulated once per session; every call returns fresh copies.
+    """
+    cache = {}
+    def make_obs(tstop=4., tadv=1200., ampcal=False, phasecal=False, seed=4):
+        key = (tstop, tadv, ampcal, phasecal, seed)
+        if key not in cache:
+            im = eh.image.load_txt(os.path.join(ROOT, 'models', 'avery_sgra_eofn.txt'))
+            arr = eh.array.load_txt(os.path.join(ROOT, 'arrays', 'EHT2017.txt'))
+            obs = im.observe(arr, 600., tadv, 0., tstop, 4.e9, add_th_noise=False, ttype='direct')
+            obs.data = simobs.add_noise(obs, ampcal=ampcal, phasecal=phasecal, seed=seed)
+            cache[key] = (im, obs)
+        (im, obs) = cache[key]
+        return (im.copy(), obs.copy())
+    return make_obs
+
+@pytest.fixture(scope='session')
+def make_image():
+    """Return a function that makes a small random image with the default pulse at (ra, dec),
+       and Q, U and V planes if pol
+    """
+    def make_image(npix=16, fov=100., seed=0, pol=True, ra=17.761122, dec=-28.992189):
+        rng = np.random.RandomState(seed)
+        psize = fov*eh.RADPERUAS/npix
+        im = eh.image.Image(rng.rand(npix, npix), psize, ra, dec, rf=230.e9)
+        if pol:
+            im.add_qu(0.1*rng.randn(npix, npix), 0.1*rng.randn(npix, npix))
+            im.add_v(0.01*rng.randn(npix, npix))
+        return im
+    return make_image
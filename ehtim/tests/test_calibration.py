@@ -0,0 +1,180 @@
+import numpy as np
+
+import ehtim as eh
+from ..calibrating import self_cal as sc
+from ..calibrating.cal_pool import CalibrationPool
+from ..calibrating.pipeline import CalibrationPipeline
+
+def scan_chisq(obs, V):
+    """Return the chi^2 of every scan of obs with respect to the model visibilities V
+    """
+    scan_idx = np.unique(obs.data['time'], return_inverse=True)[1]
+    return np.bincount(scan_idx, weights=np.abs((obs.data['vis'] - V)/obs.data['sigma'])**2)
+
+def test_network_cal_does_not_modify_input(make_obs):
+    """Test that network_cal() leaves the data of the input observation unchanged
+    """
+    (im, obs) = make_obs()
+    data = obs.data.copy()
+
+    sc.network_cal(obs, im.total_flux(), method='amp', processes=-1)
+
+    assert np.array_equal(obs.data, data)
+
+def test_self_cal_matches_self_cal_scan(make_obs):
+    """Test that the batched self_cal() fits every scan at least as well as self_cal_scan()
+    """
+    (im, obs) = make_obs(tstop=24., tadv=600.)
+    keep = np.random.RandomState(1).rand(len(obs.data)) > 0.15
+    obs.data = obs.data[keep]
+    V = sc.model_vis(obs, im)
+
+    obs_batch = sc.self_cal(obs, im, method='both', processes=-1)
+    scans = [sc.self_cal_scan(scan, im, V_scan=V[idx], sites=obs.tarr['site'], method='both')
+             for (scan, idx) in zip(obs.tlist(), obs.tlist_idx())]
+    obs_scan = obs.copy()
+    obs_scan.data = np.hstack(scans)
+
+    chisq_batch = scan_chisq(obs_batch, V)
+    chisq_scan = scan_chisq(obs_scan, V)
+    assert np.all(chisq_batch <= 1.01*chisq_scan + 1.)
+
+def random_caltable(obs, seed=0):
+    """Return a Caltable with random complex R and L gains for every site at every scan time
+    """
+    rng = np.random.RandomState(seed)
+    times = np.unique(obs.data['time'])
+    datatables = {}
+    for site in obs.tarr['site']:
+        table = np.empty(len(times), dtype=eh.DTCAL)
+        table['time'] = times
+        table['rscale'] = (1. + 0.1*rng.randn(len(times))) * np.exp(1j*rng.randn(len(times)))
+        table['lscale'] = (1. + 0.1*rng.randn(len(times))) * np.exp(1j*rng.randn(len(times)))
+        datatables[site] = table
+    return eh.caltable.Caltable(obs.ra, obs.dec, obs.rf, obs.bw, datatables, obs.tarr,
+                                source=obs.source, mjd=obs.mjd)
+
+def applycal_loop(caltab, obs):
+    """Apply a Caltable to obs one data point at a time, as the original applycal did
+    """
+    data = obs.data.copy()
+    for row in data:
+        scales = []
+        for site in (row['t1'], row['t2']):
+            table = caltab.data[site]
+            scales.append([np.interp(row['time'], table['time'], table[field].real) +
+                           1j*np.interp(row['time'], table['time'], table[field].imag)
+                           for field in ('rscale', 'lscale')])
+        ((r1, l1), (r2, l2)) = scales
+
+        rrscale = r1 * r2.conj()
+        llscale = l1 * l2.conj()
+        rlscale = r1 * l2.conj()
+        lrscale = l1 * r2.conj()
+
+        rrvis = (row['vis']  +    row['vvis']) * rrscale
+        llvis = (row['vis']  -    row['vvis']) * llscale
+        rlvis = (row['qvis'] + 1j*row['uvis']) * rlscale
+        lrvis = (row['qvis'] - 1j*row['uvis']) * lrscale
+
+        rrsigma = np.sqrt(row['sigma']**2 + row['vsigma']**2) * np.abs(rrscale)
+        llsigma = np.sqrt(row['sigma']**2 + row['vsigma']**2) * np.abs(llscale)
+        rlsigma = np.sqrt(row['qsigma']**2 + row['usigma']**2) * np.abs(rlscale)
+        lrsigma = np.sqrt(row['qsigma']**2 + row['usigma']**2) * np.abs(lrscale)
+
+        row['vis']  = 0.5  * (rrvis + llvis)
+        row['qvis'] = 0.5  * (rlvis + lrvis)
+        row['uvis'] = 0.5j * (lrvis - rlvis)
+        row['vvis'] = 0.5  * (rrvis - llvis)
+        row['sigma']  = 0.5 * np.sqrt(rrsigma**2 + llsigma**2)
+        row['qsigma'] = 0.5 * np.sqrt(rlsigma**2 + lrsigma**2)
+        row['usigma'] = 0.5 * np.sqrt(lrsigma**2 + rlsigma**2)
+        row['vsigma'] = 0.5 * np.sqrt(rrsigma**2 + llsigma**2)
+    return data
+
+def test_applycal_matches_loop(make_obs):
+    """Test that applycal() matches applying the gains one data point at a time
+    """
+    (im, obs) = make_obs(ampcal=True, phasecal=True)
+    caltab = random_caltable(obs)
+
+    data = caltab.applycal(obs).data
+    data_loop = applycal_loop(caltab, obs)
+
+    for field in ('vis', 'qvis', 'uvis', 'vvis', 'sigma', 'qsigma', 'usigma', 'vsigma'):
+        assert np.allclose(data[field], data_loop[field])
+
+def test_caltable_npz_roundtrip(make_obs, tmpdir):
+    """Test that a Caltable saved with save_caltable_npz() is reloaded unchanged
+    """
+    (im, obs) = make_obs()
+    caltab = random_caltable(obs)
+    fname = str(tmpdir.join('caltable.npz'))
+
+    eh.caltable.save_caltable_npz(caltab, fname)
+    caltab2 = eh.caltable.load_caltable_npz(fname)
+
+    assert sorted(caltab2.data.keys()) == sorted(caltab.data.keys())
+    for site in caltab.data:
+        assert np.array_equal(caltab2.data[site], caltab.data[site])
+    assert np.array_equal(caltab2.tarr, caltab.tarr)
+    for attr in ('ra', 'dec', 'rf', 'bw', 'source', 'mjd', 'timetype'):
+        assert getattr(caltab2, attr) == getattr(caltab, attr)
+
+def pool_sum(arrays, start, stop, scale):
+    return scale*np.sum(arrays['x'][start:stop])
+
+def test_calibration_pool(make_obs):
+    """Test that a CalibrationPool maps over shared arrays and that pooled calibration matches the serial code
+    """
+    (im, obs) = make_obs()
+    zbl = im.total_flux()
+
+    with CalibrationPool(processes=2) as pool:
+        x = np.arange(10.)
+        handle = pool.share(x=x)
+        assert np.array_equal(pool.arrays(handle)['x'], x)
+        assert pool.map(pool_sum, handle, [(0, 4), (4, 10)], args=(2.,)) == [12., 78.]
+        pool.release(handle)
+        handle = pool.share(payload=(2.,), x=x)
+        assert list(pool.arrays(handle).keys()) == ['x']
+        assert pool.map(pool_sum, handle, [(0, 4), (4, 10)]) == [12., 78.]
+        pool.release(handle)
+
+        caltab_pool = sc.network_cal(obs, zbl, method='amp', caltable=True, pool=pool)
+        obs_pool = sc.self_cal(obs, im, method='both', pool=pool)
+
+    caltab = sc.network_cal(obs, zbl, method='amp', caltable=True, processes=-1)
+    obs_serial = sc.self_cal(obs, im, method='both', processes=-1)
+
+    for site in caltab.data:
+        assert np.allclose(caltab_pool.data[site]['rscale'], caltab.data[site]['rscale'])
+    assert np.allclose(obs_pool.data['vis'], obs_serial.data['vis'])
+
+def test_pipeline_round_matches_network_cal(make_obs):
+    """Test that one CalibrationPipeline round gives the same data and gains as network_cal and applycal
+    """
+    (im, obs) = make_obs()
+    zbl = im.total_flux()
+
+    pipeline = CalibrationPipeline(obs)
+    caltab_pipe = pipeline.network_cal(zbl, method='amp')
+    obs_pipe = pipeline.obsdata()
+
+    caltab = sc.network_cal(obs, zbl, method='amp', caltable=True, processes=-1)
+    obs_cal = caltab.applycal(obs)
+
+    for site in caltab.data:
+        assert np.allclose(caltab_pipe.data[site]['rscale'], caltab.data[site]['rscale'])
+    for field in ('vis', 'sigma'):
+        assert np.allclose(obs_pipe.data[field], obs_cal.data[field])
+
+    # pooled rounds, over all scans and over a subset, match the serial pipeline
+    scans = np.arange(0, len(CalibrationPipeline(obs).scan_times), 3)
+    caltab_sub = CalibrationPipeline(obs).network_cal(zbl, method='amp', scans=scans)
+    with CalibrationPool(processes=2) as pool:
+        caltab_pool = CalibrationPipeline(obs, pool=pool).network_cal(zbl, method='amp')
+        caltab_pool_sub = CalibrationPipeline(obs, pool=pool).network_cal(zbl, method='amp', scans=scans)
+    for site in caltab.data:
+        assert np.allclose(caltab_pool.data[site]['rscale'], caltab_pipe.data[site]['rscale'])
+        assert np.allclose(caltab_pool_sub.data[site]['rscale'], caltab_sub.data[site]['rscale'])
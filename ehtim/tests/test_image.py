@@ -0,0 +1,59 @@
+import numpy as np
+import scipy.interpolate
+
+import ehtim as eh
+
+def resample_square_loop(im, vec, xdim_new, ker_size=5):
+    """Resample one Stokes plane of im by summing the pulses of all nearby pixels at every new pixel,
+       as the original resample_square did. The result is not yet normalized.
+    """
+    psize_new = im.xdim*im.psize/xdim_new
+    x = np.arange(0, -im.xdim, -1)*im.psize + (im.psize*im.xdim)/2.0 - im.psize/2.0
+    x_new = np.arange(0, -xdim_new, -1)*psize_new + (psize_new*xdim_new)/2.0 - psize_new/2.0
+    vec = vec.reshape(im.ydim, im.xdim)
+
+    out = np.zeros((xdim_new, xdim_new))
+    for (k, yk) in enumerate(x_new):
+        for (l, xl) in enumerate(x_new):
+            for (i, yi) in enumerate(x):
+                for (j, xj) in enumerate(x):
+                    if np.abs(xl - xj) < ker_size*im.psize/2.0 and np.abs(yk - yi) < ker_size*im.psize/2.0:
+                        out[k,l] += vec[i,j] * im.pulse(xl - xj, yk - yi, im.psize, dom="I")
+    return out
+
+def test_resample_square_matches_loop(make_image):
+    """Test that resample_square() matches resampling every new pixel one at a time
+    """
+    im = make_image(npix=8)
+    xdim_new = 12
+    out = im.resample_square(xdim_new)
+
+    out_i = resample_square_loop(im, im.imvec, xdim_new)
+    scaling = np.sum(im.imvec)/np.sum(out_i)
+    assert np.allclose(out.imvec, scaling*out_i.flatten())
+    for (vec, vec_new) in ((im.qvec, out.qvec), (im.uvec, out.uvec), (im.vvec, out.vvec)):
+        assert np.allclose(vec_new, scaling*resample_square_loop(im, vec, xdim_new).flatten())
+
+def test_regrid_images_match_spline(make_image):
+    """Test that regrid_images() matches interpolating every Stokes plane with a 2-D spline
+    """
+    ims = [make_image(seed=0), make_image(seed=1)]
+    fov = ims[0].xdim*ims[0].psize
+    x = np.linspace(-fov/2, fov/2, ims[0].xdim)
+
+    for (interp, k) in (('linear', 1), ('cubic', 3)):
+        for (targetfov, npix) in ((1.5*fov, 24), (0.5*fov, 10)):
+            xtarget = np.linspace(-targetfov/2, targetfov/2, npix)
+            outs = eh.image.regrid_images(ims, targetfov, npix, interp=interp)
+
+            for (im, out) in zip(ims, outs):
+                for (vec, vec_new) in ((im.imvec, out.imvec), (im.qvec, out.qvec),
+                                       (im.uvec, out.uvec), (im.vvec, out.vvec)):
+                    spline = scipy.interpolate.RectBivariateSpline(x, x, vec.reshape(im.ydim, im.xdim), kx=k, ky=k)
+                    ref = spline(xtarget, xtarget)
+                    ref[np.abs(xtarget) > fov/2., :] = 0.0
+                    ref[:, np.abs(xtarget) > fov/2.] = 0.0
+                    ref *= (targetfov/npix)**2 / im.psize**2
+                    assert np.allclose(vec_new, ref.flatten())
+
+            assert np.array_equal(ims[0].regrid_image(targetfov, npix, interp=interp).imvec, outs[0].imvec)
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from ..imaging import imager_utils as iu
+
+def test_closure_ftmatrices_match_dense_rows(make_obs):
+    """Test that the gathered closure DFT operators give the same chi^2 and gradient as dense per-leg DFT matrices
+    """
+    (im, obs) = make_obs(tstop=24., ampcal=True, phasecal=True)
+    mask = np.ones(im.xdim*im.ydim, dtype=bool)
+    mask[:im.xdim] = False
+    imvec = im.imvec[mask] + 1.e-4
+
+    for dtype in ('bs', 'cphase', 'camp', 'logcamp'):
+        (data, sigma, A) = iu.chisqdata(obs, im, mask, dtype, ttype='direct')
+        assert len(A[0].A) < sum(len(Ai.index) for Ai in A)
+
+        # the old per-leg matrices, one dense row per closure
+        A_dense = []
+        for Ai in A:
+            rows = A[0].A[Ai.index]
+            rows[Ai.conj] = rows[Ai.conj].conj()
+            A_dense.append(rows)
+        A_dense = tuple(A_dense)
+
+        assert np.allclose(iu.chisq(imvec, A, data, sigma, dtype, mask=mask),
+                           iu.chisq(imvec, A_dense, data, sigma, dtype, mask=mask))
+        assert np.allclose(iu.chisqgrad(imvec, A, data, sigma, dtype, mask=mask),
+                           iu.chisqgrad(imvec, A_dense, data, sigma, dtype, mask=mask))
+
+@pytest.mark.parametrize('ttype', ['direct', 'fast', 'nfft'])
+def test_chisq_and_grad_matches_separate(make_obs, ttype):
+    """Test that the fused chi^2 and gradient match chisq() and chisqgrad() for every data type
+    """
+    (im, obs) = make_obs(tstop=24., ampcal=True, phasecal=True)
+    mask = np.ones(im.xdim*im.ydim, dtype=bool)
+    imvec = im.imvec*(1. + 0.05*np.random.RandomState(0).randn(len(im.imvec))) + 1.e-4
+
+    for dtype in ('vis', 'bs', 'amp', 'cphase', 'camp', 'logcamp'):
+        try:
+            (data, sigma, A) = iu.chisqdata(obs, im, mask, dtype, ttype=ttype, fft_pad_factor=4, p_rad=8)
+        except Exception:
+            if ttype == 'nfft':
+                pytest.skip("NFFT is not available")
+            raise
+
+        chisq = iu.chisq(imvec, A, data, sigma, dtype, ttype=ttype, mask=mask)
+        grad = iu.chisqgrad(imvec, A, data, sigma, dtype, ttype=ttype, mask=mask)
+        (chisq_fused, grad_fused) = iu.chisq_and_grad(imvec, A, data, sigma, dtype, ttype=ttype, mask=mask)
+
+        assert np.allclose(chisq_fused, chisq)
+        assert np.allclose(grad_fused, grad)
+
+def test_fft_sampler_is_adjoint_of_gridder(make_obs):
+    """Test that the fast-mode forward model and the gradient transform are an adjoint pair, <A x, y> == <x, A^H y>,
+       and that the forward model matches the direct transform
+    """
+    (im, obs) = make_obs(tstop=24.)
+    mask = np.ones(im.xdim*im.ydim, dtype=bool)
+    (data, sigma, A_direct) = iu.chisqdata(obs, im, mask, 'vis', ttype='direct')
+
+    rng = np.random.RandomState(0)
+    for (conv_func, p_rad, tol) in (('gaussian', 2, 2.e-3), ('kaiserbessel', 3, 1.e-5)):
+        (data, sigma, A) = iu.chisqdata(obs, im, mask, 'vis', ttype='fast', conv_func=conv_func, p_rad=p_rad)
+
+        x = rng.rand(len(im.imvec))
+        y = rng.randn(len(data)) + 1j*rng.randn(len(data))
+        Ax = iu.sampler(iu.fft_imvec(x, A[0]), A[1])
+        assert np.allclose(np.vdot(Ax, y).real, np.dot(x, iu.fft_adjoint([y], A)))
+
+        vis = iu.shared_vis(im.imvec, A, ttype='fast')
+        vis_direct = A_direct.dot(im.imvec)
+        assert np.max(np.abs(vis - vis_direct)) < tol*np.max(np.abs(vis_direct))
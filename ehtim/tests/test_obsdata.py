@@ -0,0 +1,179 @@
+import numpy as np
+import warnings
+
+import ehtim as eh
+from ..observing.obs_helpers import imaging_weights
+
+def test_index_cache_follows_reassigned_data(make_obs):
+    """Test that tlist_idx() and bllist_idx() are recomputed once a table edited in place is reassigned,
+       or when the table is replaced
+    """
+    (im, obs) = make_obs()
+    ntime = len(obs.tlist_idx())
+    nbl = len(obs.bllist_idx())
+
+    # merge the first two scans and drop one site from the first scan
+    times = np.unique(obs.data['time'])
+    obs.data['time'][obs.data['time'] == times[1]] = times[0]
+    obs.data = obs.data
+    assert len(obs.tlist_idx()) == ntime - 1
+
+    row = np.where(obs.data['time'] == times[0])[0][0]
+    obs.data['t2'][row] = obs.data['t1'][row]
+    obs.data = obs.data
+    assert len(obs.bllist_idx()) == nbl + 1
+
+    # a table swapped in without the setter is also detected
+    nrow = len(obs.data) // 2
+    obs._data = obs._data[:nrow]
+    assert sum(len(obs.data[idx]) for idx in obs.tlist_idx()) == nrow
+
+def test_constructor_restores_canonical_order(make_obs):
+    """Test that the constructor sorts, reverses and deduplicates baselines into the order of obs.data,
+       and that canonical=True keeps an already canonical table unchanged
+    """
+    (im, obs) = make_obs()
+    rng = np.random.RandomState(0)
+    data = obs.data.copy()
+
+    # reverse a random half of the baselines
+    swap = rng.rand(len(data)) < 0.5
+    for (f1, f2) in (('t1', 't2'), ('tau1', 'tau2')):
+        (data[f1][swap], data[f2][swap]) = (data[f2][swap], data[f1][swap].copy())
+    for f in ('u', 'v'):
+        data[f][swap] = -data[f][swap]
+    for f in ('vis', 'qvis', 'uvis', 'vvis'):
+        data[f][swap] = np.conj(data[f][swap])
+
+    # shuffle the baselines within each scan and append a reversed copy of every scan
+    scans = []
+    for time in np.unique(data['time']):
+        scan = data[data['time'] == time]
+        scan = scan[rng.permutation(len(scan))]
+        conj = scan.copy()
+        (conj['t1'], conj['t2']) = (scan['t2'], scan['t1'])
+        scans += [scan, conj]
+    data = np.hstack(scans)
+
+    obs2 = eh.obsdata.Obsdata(obs.ra, obs.dec, obs.rf, obs.bw, data, obs.tarr, mjd=obs.mjd)
+    assert np.array_equal(obs2.data, obs.data)
+
+    obs3 = eh.obsdata.Obsdata(obs.ra, obs.dec, obs.rf, obs.bw, obs.data, obs.tarr, mjd=obs.mjd, canonical=True)
+    assert np.array_equal(obs3.data, obs.data)
+    assert np.array_equal(obs.copy().data, obs.data)
+
+def test_dirty_planes_match_loop(make_obs):
+    """Test that the direct dirty images match a per-pixel DFT, peak on a point source, and agree with the FFT
+    """
+    (im, obs) = make_obs(tstop=24., tadv=600.)
+    (npix, fov) = (32, 200.*eh.RADPERUAS)
+
+    # observe a point source in pixel (10, 20)
+    point = np.zeros((npix, npix))
+    point[10, 20] = 1.
+    obs.data = eh.image.Image(point, fov/npix, obs.ra, obs.dec, rf=obs.rf).observe_same_nonoise(obs).data
+
+    (beam, ims) = obs.dirty_planes(npix, fov, weighting='natural')
+    assert np.unravel_index(np.argmax(ims[0]), ims[0].shape) == (10, 20)
+
+    data = obs.unpack(['u', 'v', 'vis', 'sigma'])
+    weights = 1./data['sigma']**2
+    xlist = np.arange(0, -npix, -1)*(fov/npix) + fov/2.0 - fov/npix/2.0
+    beam_loop = np.zeros((npix, npix))
+    im_loop = np.zeros((npix, npix))
+    for (j, y) in enumerate(xlist):
+        for (i, x) in enumerate(xlist):
+            phase = np.exp(-2j*np.pi*(x*data['u'] + y*data['v']))
+            beam_loop[j,i] = np.sum(weights*np.real(phase))
+            im_loop[j,i] = np.sum(np.real(weights*data['vis']*phase))
+    assert np.allclose(beam, beam_loop/np.sum(beam_loop))
+    assert np.allclose(ims[0], im_loop/np.sum(beam_loop))
+
+    (beam_fast, ims_fast) = obs.dirty_planes(npix, fov, weighting='natural', ttype='fast')
+    assert np.allclose(beam_fast, beam, atol=1e-2*np.max(beam))
+    assert np.allclose(ims_fast[0], ims[0], atol=1e-2*np.max(ims[0]))
+
+def test_imaging_weights_match_loop(make_obs):
+    """Test that natural and uniform imaging weights match summing the weights of every uv cell with a loop
+    """
+    (im, obs) = make_obs(tstop=24., tadv=600.)
+    fov = 200.*eh.RADPERUAS
+    (u, v, sigma) = (obs.data['u'], obs.data['v'], obs.data['sigma'])
+
+    assert np.array_equal(imaging_weights(u, v, sigma, fov, weighting='none'), np.ones(len(u)))
+    assert np.allclose(imaging_weights(u, v, sigma, fov, weighting='natural'), 1./sigma**2)
+
+    cells = {}
+    for (uk, vk, sk) in zip(np.hstack((u, -u)), np.hstack((v, -v)), np.hstack((sigma, sigma))):
+        cell = (int(np.round(uk*fov)), int(np.round(vk*fov)))
+        cells[cell] = cells.get(cell, 0.) + 1./sk**2
+    uniform = [1./sk**2 / cells[(int(np.round(uk*fov)), int(np.round(vk*fov)))] for (uk, vk, sk) in zip(u, v, sigma)]
+    assert np.allclose(imaging_weights(u, v, sigma, fov, weighting='uniform'), uniform)
+
+def scatter_loop(obs, field, max_diff_seconds):
+    """Return the median and median absolute deviation of field on the same baseline
+       within max_diff_seconds of every data point, one point at a time
+    """
+    values = obs.unpack(field)[field]
+    (t1, t2, time) = (obs.data['t1'], obs.data['t2'], obs.data['time'])
+    median = np.empty(len(values))
+    mad = np.empty(len(values))
+    for k in range(len(values)):
+        same = ((t1 == t1[k]) & (t2 == t2[k])) | ((t1 == t2[k]) & (t2 == t1[k]))
+        same &= np.abs(time - time[k]) < max_diff_seconds/3600.
+        median[k] = np.median(values[same])
+        mad[k] = np.median(np.abs(values[same] - median[k]))
+    return (values, median, mad)
+
+def test_scatter_masks_match_loop(make_obs):
+    """Test that mask_large_scatter() and mask_anomalous() match per-point windowed statistics
+    """
+    (im, obs) = make_obs(tstop=2., tadv=60.)
+    max_diff_seconds = 400.
+
+    (values, median, mad) = scatter_loop(obs, 'amp', max_diff_seconds)
+    scatter_cut = np.median(mad)
+    assert np.array_equal(obs.mask_large_scatter('amp', scatter_cut, max_diff_seconds), mad < scatter_cut)
+
+    (values, median, mad) = scatter_loop(obs, 'snr', max_diff_seconds)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        anomalous = np.abs(values - median)/mad < 1.
+    mask = obs.mask_anomalous('snr', max_diff_seconds, 1.)
+    assert np.array_equal(mask, anomalous)
+    assert 0 < np.sum(mask) < len(mask)
+
+def test_flag_mask_combines_masks(make_obs):
+    """Test that flag_mask() keeps exactly the points of a combined mask
+    """
+    (im, obs) = make_obs()
+    uvdist = obs.unpack('uvdist')['uvdist']
+    uv_max = np.median(uvdist)
+    site = obs.tarr['site'][0]
+
+    mask = obs.mask_uvdist(uv_max=uv_max) & obs.mask_sites([site])
+    assert np.array_equal(mask, (uvdist <= uv_max) & (obs.data['t1'] != site) & (obs.data['t2'] != site))
+
+    obs_flagged = obs.flag_mask(mask)
+    assert np.array_equal(obs_flagged.data, obs.data[mask])
+    assert np.array_equal(obs.flag_uvdist(uv_max=uv_max).data, obs.data[uvdist <= uv_max])
+
+def test_scan_avg_skips_empty_scans(make_obs):
+    """Test that averaging over a scan table with scans that have no data gives one time per
+       non-empty scan and does not divide by empty bins
+    """
+    (im, obs) = make_obs()
+    utimes = np.unique(obs.data['time'])
+    dt = 0.25*np.min(np.diff(utimes))
+
+    # one scan around every time, plus an empty scan before the first and between every pair
+    centers = np.sort(np.hstack((utimes, utimes - 2*dt)))
+    obs.scans = np.zeros(len(centers), dtype=eh.DTSCANS)
+    obs.scans['time'] = centers/24.
+    obs.scans['interval'] = dt/24.
+
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        obs_avg = obs.avg_coherent(0., scan_avg=True)
+
+    assert np.allclose(np.unique(obs_avg.data['time']), utimes)
+    assert len(obs_avg.data) == len(obs.data)
@@ -0,0 +1,132 @@
+import numpy as np
+
+import ehtim as eh
+from ..observing import obs_helpers as obsh
+from ..observing import obs_simulate as simobs
+
+def test_add_jones_and_noise_matches_loop(make_obs):
+    """Test that add_jones_and_noise() matches corrupting and adding noise to one data point at a time
+    """
+    (im, obs) = make_obs()
+    seed = 5
+    data = simobs.add_jones_and_noise(obs, ampcal=False, phasecal=False, dcal=False, frcal=False, seed=seed)
+
+    # make_jones reseeds the global random state, so the thermal noise drawn after it is reproducible
+    jones = simobs.make_jones(obs, ampcal=False, phasecal=False, dcal=False, frcal=False, seed=seed)
+    data_loop = obs.data.copy()
+    times = np.unique(obs.data['time'])
+    for row in data_loop:
+        t = np.searchsorted(times, row['time'])
+        j1 = jones[obs.tkey[row['t1']], t]
+        j2 = jones[obs.tkey[row['t2']], t]
+        corr = np.array([[row['vis'] + row['vvis'], row['qvis'] + 1j*row['uvis']],
+                         [row['qvis'] - 1j*row['uvis'], row['vis'] - row['vvis']]])
+        corr = np.dot(j1, np.dot(corr, j2.conj().T))
+
+        tarr1 = obs.tarr[obs.tkey[row['t1']]]
+        tarr2 = obs.tarr[obs.tkey[row['t2']]]
+        sig_rr = obsh.blnoise(tarr1['sefdr'], tarr2['sefdr'], row['tint'], obs.bw)
+        sig_rl = obsh.blnoise(tarr1['sefdr'], tarr2['sefdl'], row['tint'], obs.bw)
+        sig_lr = obsh.blnoise(tarr1['sefdl'], tarr2['sefdr'], row['tint'], obs.bw)
+        sig_ll = obsh.blnoise(tarr1['sefdl'], tarr2['sefdl'], row['tint'], obs.bw)
+        corr[0,0] += obsh.cerror(sig_rr)
+        corr[0,1] += obsh.cerror(sig_rl)
+        corr[1,0] += obsh.cerror(sig_lr)
+        corr[1,1] += obsh.cerror(sig_ll)
+
+        row['vis'] = 0.5*(corr[0,0] + corr[1,1])
+        row['vvis'] = 0.5*(corr[0,0] - corr[1,1])
+        row['qvis'] = 0.5*(corr[0,1] + corr[1,0])
+        row['uvis'] = -0.5j*(corr[0,1] - corr[1,0])
+        row['sigma'] = 0.5*np.sqrt(sig_rr**2 + sig_ll**2)
+        row['qsigma'] = 0.5*np.sqrt(sig_rl**2 + sig_lr**2)
+
+    for field in ('vis', 'qvis', 'uvis', 'vvis', 'sigma', 'qsigma'):
+        assert np.allclose(data[field], data_loop[field])
+
+def test_make_uvpoints_matches_baseline_loop(make_obs):
+    """Test that make_uvpoints() matches computing the uv points of one baseline at a time
+    """
+    (im, obs) = make_obs()
+    arr = obs.tarr
+    array = eh.array.Array(arr)
+    (tint, tadv, tstart, tstop) = (60., 600., 0., 24.)
+    data = simobs.make_uvpoints(array, obs.ra, obs.dec, obs.rf, obs.bw, tint, tadv, tstart, tstop, mjd=obs.mjd)
+
+    times = np.arange(tstart, tstop, tadv/3600.)
+    rows = []
+    for i1 in range(len(arr)):
+        for i2 in range(i1 + 1, len(arr)):
+            (site1, site2) = (arr['site'][i1], arr['site'][i2])
+            (t, u, v) = obsh.compute_uv_coordinates(array, site1, site2, times, obs.mjd, obs.ra, obs.dec, obs.rf)
+            rows += [(tk, site1, site2, uk, vk) for (tk, uk, vk) in zip(t, u, v)]
+
+    assert len(data) == len(rows)
+    assert np.array_equal(data['time'], [row[0] for row in rows])
+    assert np.array_equal(data['t1'], [row[1] for row in rows])
+    assert np.array_equal(data['t2'], [row[2] for row in rows])
+    assert np.allclose(data['u'], [row[3] for row in rows])
+    assert np.allclose(data['v'], [row[4] for row in rows])
+
+def test_observe_batch_matches_observe_same_nonoise(make_obs, make_image):
+    """Test that observe_batch() gives the same visibilities as observing every image separately
+    """
+    (im, obs) = make_obs()
+    ims = [make_image(npix=16, fov=200., seed=seed, ra=obs.ra, dec=obs.dec) for seed in range(3)]
+
+    for ttype in ('direct', 'fast'):
+        vis = eh.image.observe_batch(ims, obs, ttype=ttype, compact=True)
+        obslist = eh.image.observe_batch(ims, obs, ttype=ttype)
+        assert vis.shape == (len(ims), 4, len(obs.data))
+
+        for (k, image) in enumerate(ims):
+            data = image.observe_same_nonoise(obs, ttype=ttype).data
+            for (i, field) in enumerate(('vis', 'qvis', 'uvis', 'vvis')):
+                assert np.allclose(vis[k,i], data[field])
+                assert np.allclose(obslist[k].data[field], data[field])
+
+def test_space_site_uv_is_antisymmetric(make_obs):
+    """Test that a spacecraft gets its own ephemeris in either baseline position, so swapping
+       the sites of a space-ground baseline negates its uv points, and that cached positions are reused
+    """
+    (im, obs) = make_obs()
+    tarr = np.hstack((obs.tarr, np.zeros(1, dtype=obs.tarr.dtype)))
+    tarr[-1]['site'] = 'ISS'
+    tarr[-1]['sefdr'] = tarr[-1]['sefdl'] = 1.e4
+    tle = np.array(['ISS',
+                    '1 25544U 98067A   17136.33145281  .00016717  00000-0  10270-3 0  9170',
+                    '2 25544  51.6384 197.0914 0005422 163.8086 196.3240 15.54075909 16798'])
+    (space, ground) = (tarr['site'][-1], tarr['site'][0])
+    array = eh.array.Array(tarr, ephem={space: tle})
+    mjd = 57889
+    times = np.linspace(0., 1., 13)
+
+    (t1, u1, v1) = obsh.compute_uv_coordinates(array, space, ground, times, mjd, obs.ra, obs.dec, obs.rf,
+                                               elevmin=-90., elevmax=90.)
+    (t2, u2, v2) = obsh.compute_uv_coordinates(array, ground, space, times, mjd, obs.ra, obs.dec, obs.rf,
+                                               elevmin=-90., elevmax=90.)
+    assert len(t1) == len(times)
+    assert np.array_equal(t1, t2)
+    assert np.allclose(u1, -u2)
+    assert np.allclose(v1, -v2)
+
+    # the spacecraft is in low earth orbit, not at the origin
+    fracmjd = mjd + times/24.
+    pos = obsh.ephem_coords(array, space, fracmjd)
+    assert np.all(np.abs(np.linalg.norm(pos, axis=1) - 6.78e6) < 1.e5)
+
+    # repeated lookups return copies of the cached positions
+    pos[:] = 0.
+    assert np.array_equal(obsh.ephem_coords(array, space, fracmjd), obsh.ephem_coords(array, space, fracmjd.copy()))
+    assert np.all(np.linalg.norm(obsh.ephem_coords(array, space, fracmjd), axis=1) > 6.e6)
+
+def test_make_jones_is_reproducible(make_obs):
+    """Test that the per-time station errors drawn by make_jones are fixed by the seed and differ between sites
+    """
+    (im, obs) = make_obs()
+    kwargs = dict(opacitycal=False, ampcal=False, phasecal=False, dcal=False, frcal=False, taup=0.1, gainp=0.1)
+    jones = simobs.make_jones(obs, seed=3, **kwargs)
+
+    assert np.array_equal(simobs.make_jones(obs, seed=3, **kwargs), jones)
+    assert not np.allclose(simobs.make_jones(obs, seed=4, **kwargs), jones)
+    assert not np.allclose(np.abs(jones[0,:,0,0]), np.abs(jones[1,:,0,0]))
@@ -36,40 +36,37 @@ def multical(obs, sites, master_caltab, n=3, amp0=8.0, gain_tol=0.1, only_amp=Tr
               'zbl_uvdist_max':10000000.0,
               'show_solution':False,
               'pad_amp':0.0,
-              'gain_tol':gain_tol,
-              'processes':0,
-              'caltable':True}
+              'gain_tol':gain_tol}
     # If the specified sites aren't present, skip the calibration
     if len(pick(obs,sites).data) == 0:
         return [obs, master_caltab]
 
-    for i in range(n):
-        # Self calibrate the amplitudes
-        datadir = '{}-{}-amp'.format(stepname, i)
-        caltab = eh.self_cal.network_cal(pick(obs,sites), amp0, method='amp',
-                                         **common)
-        obs = caltab.applycal(obs, interp='nearest', extrapolate=True)
-        caltab.save_txt(obs, datadir=datadir)
-        obs_cal_avg.save_uvfits(datadir+'/'+args.output)
-        if master_caltab == None:
-            master_caltab = caltab
-        else:
-            master_caltab = master_caltab.merge(caltab)
-
-        if only_amp:
-            continue
-
-        # Self calibrate the phases
-        datadir = '{}-{}-phase'.format(stepname, i)
-        caltab = eh.self_cal.network_cal(pick(obs,sites), amp0, method='phase',
-                                         **common)
-        obs = caltab.applycal(obs, interp='nearest', extrapolate=True)
-        caltab.save_txt(obs, datadir=datadir)
-        obs_cal_avg.save_uvfits(datadir+'/'+args.output)
-        if master_caltab == None:
-            master_caltab = caltab
-        else:
-            master_caltab = master_caltab.merge(caltab)
+    # Keep one pool of calibration workers and one partitioned copy of the data for all iterations;
+    # only the scans containing all of the sites are solved, the others take the nearest solution
+    with eh.calibrating.cal_pool.CalibrationPool(processes=0) as pool:
+        pipeline = eh.calibrating.pipeline.CalibrationPipeline(obs, pool=pool)
+        scans = pipeline.scans_with_sites(sites)
+        for i in range(n):
+            # Self calibrate the amplitudes
+            datadir = '{}-{}-amp'.format(stepname, i)
+            caltab = pipeline.network_cal(amp0, method='amp', scans=scans, **common)
+            caltab.save_txt(obs, datadir=datadir)
+            obs_cal_avg.save_uvfits(datadir+'/'+args.output)
+
+            if only_amp:
+                continue
+
+            # Self calibrate the phases
+            datadir = '{}-{}-phase'.format(stepname, i)
+            caltab = pipeline.network_cal(amp0, method='phase', scans=scans, **common)
+            caltab.save_txt(obs, datadir=datadir)
+            obs_cal_avg.save_uvfits(datadir+'/'+args.output)
+
+    obs = pipeline.obsdata()
+    if master_caltab == None:
+        master_caltab = pipeline.caltable()
+    else:
+        master_caltab = master_caltab.merge(pipeline.caltable())
 
     return [obs, master_caltab]
 
@@ -158,4 +155,6 @@ sites = {'AA','AP','SM','JC'}
 
 # Save output
 obs_cal_avg.save_uvfits(args.output)
-master_caltab.save_txt(obs, datadir=os.path.basename(args.input[:-15]) + '.'+args.pol+args.pol+'/master_caltab')
+caldir = os.path.basename(args.input[:-15]) + '.'+args.pol+args.pol+'/master_caltab'
+master_caltab.save_txt(obs, datadir=caldir)
+master_caltab.save_npz(caldir + '/master_caltab.npz')